@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+from app.cache import TTLCache
+from app.metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT, add_timing
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """A request was refused before reaching OpenAI, answered with status_code and Retry-After"""
+
+    def __init__(self, status_code: int, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.detail = detail
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to capacity"""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, capacity: float) -> float:
+        """Take one token, or return the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class Permit:
+    """A granted slot, released exactly once"""
+
+    def __init__(self, controller: "AdmissionController", key: Optional[str]):
+        self.controller = controller
+        self.key = key
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.controller._release(self.key)
+
+
+class PermitStreamingResponse(StreamingResponse):
+    """StreamingResponse that holds a permit until the response is finished.
+
+    The permit is released once the body is exhausted, before the last
+    chunk goes out, so a client that sends its next turn right after
+    [DONE] is not refused as still in flight. The response call releases
+    it as well, for bodies that never run because the client disconnected
+    before the response started.
+    """
+
+    def __init__(self, content, permit: Permit, **kwargs):
+        async def held():
+            try:
+                async for chunk in content:
+                    yield chunk
+            finally:
+                permit.release()
+
+        super().__init__(held(), **kwargs)
+        self.permit = permit
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.permit.release()
+
+
+class AdmissionController:
+    """Admission control in front of the OpenAI calls.
+
+    Each participant (prolific_pid or session id) has a token bucket and
+    may have one request in flight, so double clicks do not send duplicate
+    turns. A global semaphore bounds concurrent OpenAI calls; requests
+    wait for a slot for at most max_wait seconds, and once max_queue
+    requests are waiting new ones are refused right away.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        max_wait: float,
+        rate_per_minute: float,
+        burst: int,
+        enabled: bool = True,
+        max_keys: int = 10000
+    ):
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # Buckets of participants idle for longer than a full refill are dropped
+        self.buckets = TTLCache(maxsize=max_keys, ttl=burst / self.rate if self.rate else None)
+        self.in_flight: Dict[str, int] = {}
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.rejected = {"rate_limited": 0, "in_flight": 0, "queue_full": 0, "wait_timeout": 0}
+        self.wait_seconds_total = 0.0
+        self.recent_waits = deque(maxlen=1024)
+
+    def _reject(self, reason: str, status_code: int, retry_after: float, detail: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.labels(reason).inc()
+        logger.warning(f"Rejected LLM request ({reason}): {detail}")
+        return AdmissionRejected(status_code, retry_after, detail)
+
+    def _check_participant(self, key: str) -> None:
+        if self.in_flight.get(key):
+            raise self._reject("in_flight", 429, 1, "A request for this participant is already in progress")
+        if self.rate:
+            bucket = self.buckets.get(key) or TokenBucket(self.burst)
+            wait = bucket.take(self.rate, self.burst)
+            self.buckets.set(key, bucket)
+            if wait:
+                raise self._reject("rate_limited", 429, wait, "Too many requests for this participant")
+
+    async def admit(self, key: Optional[str] = None) -> Permit:
+        """Wait for a slot, or raise AdmissionRejected"""
+        if not self.enabled:
+            return Permit(self, None)
+        if key:
+            self._check_participant(key)
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            raise self._reject("queue_full", 503, self.max_wait, "Server is at capacity, please retry")
+
+        if key:
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+        started = time.monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        ADMISSION_QUEUE_DEPTH.inc()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.max_wait)
+        except BaseException as e:
+            self._leave(key)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("wait_timeout", 503, self.max_wait, "Server is at capacity, please retry")
+            raise
+        finally:
+            self.waiting -= 1
+            ADMISSION_QUEUE_DEPTH.dec()
+
+        waited = time.monotonic() - started
+        self.wait_seconds_total += waited
+        self.recent_waits.append(waited)
+        ADMISSION_WAIT.observe(waited)
+        add_timing("queue", waited)
+        self.admitted += 1
+        self.active += 1
+        return Permit(self, key)
+
+    def _leave(self, key: Optional[str]) -> None:
+        if key:
+            self.in_flight[key] -= 1
+            if not self.in_flight[key]:
+                del self.in_flight[key]
+
+    def _release(self, key: Optional[str]) -> None:
+        if not self.enabled:
+            return
+        self._leave(key)
+        self.active -= 1
+        self.semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self, key: Optional[str] = None):
+        permit = await self.admit(key)
+        try:
+            yield permit
+        finally:
+            permit.release()
+
+    def stats(self) -> dict:
+        waits = sorted(self.recent_waits)
+
+        def quantile(q):
+            return waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0.0
+
+        return {
+            "enabled": self.enabled,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_p50": quantile(0.5),
+            "wait_seconds_p95": quantile(0.95),
+            "wait_seconds_max": waits[-1] if waits else 0.0
+        }
+
+
+admission = AdmissionController(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+    max_wait=float(os.getenv("LLM_MAX_QUEUE_WAIT_SECONDS", "10")),
+    rate_per_minute=float(os.getenv("LLM_RATE_PER_MINUTE", "12")),
+    burst=int(os.getenv("LLM_RATE_BURST", "4")),
+    enabled=os.getenv("LLM_ADMISSION_ENABLED", "1").lower() in ("1", "true", "yes")
+)
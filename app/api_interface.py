@@ -1,275 +1,471 @@
-from openai import OpenAI
 import os
-from typing import List, Dict, Optional
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
+from app.client_pool import client_pool
+from app.prompts import prompt_registry
+from app.thesis_catalog import pro_contra_block
+from app.context_window import ContextWindow
+from app.response_cache import response_cache
+from app.precomputed import precomputed_replies
+from app.single_flight import payload_key, single_flight
+from app.call_policy import call_policy
+from app.metrics import observe_context_window, observe_llm
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize OpenAI client with error handling
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OPENAI_API_KEY environment variable is required")
-
-client = OpenAI(api_key=api_key)
 MODEL = "gpt-4-turbo"
+SUMMARY_MODEL = os.getenv("GROUP_B_SUMMARY_MODEL", "gpt-4o-mini")
+
+
+def _client():
+    """OpenAI client for the study's own API key, created on first use"""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is required")
+    return client_pool.get(api_key)
+
+
+async def check_openai() -> None:
+    """Health probe: the API key is configured, and OpenAI answers if OPENAI_HEALTH_PROBE is set"""
+    client = _client()
+    if os.getenv("OPENAI_HEALTH_PROBE", "0").lower() in ("1", "true", "yes"):
+        await client.models.retrieve(MODEL)
+
+
+def _reply(response, group: str, model: str, started: float) -> str:
+    """Record latency and token usage of a completed call and return its content"""
+    seconds = time.perf_counter() - started
+    observe_llm(group, model, seconds, seconds, response.usage)
+    return response.choices[0].message.content
+
+
+def _answered_by(model: str) -> Dict[str, str]:
+    """Reply field naming the model, set only when a fallback model answered instead of MODEL"""
+    return {} if model == MODEL else {"model": model}
+
+
+async def _summarize_turns(transcript: str) -> str:
+    """Condense older Group B turns for the context window"""
+    async def call(model):
+        started = time.perf_counter()
+        response = await _client().chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": (
+                    "Fasse den folgenden Ausschnitt einer Diskussion zwischen Nutzer und KI-Assistent sachlich und knapp zusammen. "
+                    "Behalte die vom Nutzer vorgebrachten Argumente, Fragen und Positionen sowie die vom Assistenten genannten Fakten bei."
+                )},
+                {"role": "user", "content": transcript}
+            ]
+        )
+        return _reply(response, "summary", model, started)
+
+    return await call_policy.run(call, SUMMARY_MODEL, "summary", fallback=False, hedge=False)
+
+
+# Token budget for Group B continue calls (0 disables windowing)
+context_window = ContextWindow(
+    token_budget=int(os.getenv("GROUP_B_TOKEN_BUDGET", "6000")),
+    recent_turns=int(os.getenv("GROUP_B_RECENT_TURNS", "6")),
+    summary_every_turns=int(os.getenv("GROUP_B_SUMMARY_EVERY_TURNS", "4")),
+    summarize=_summarize_turns
+)
+
+
+async def _windowed(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Group B messages fitted to the token budget, with the accounting recorded as metrics"""
+    window, accounting = await context_window.build(messages)
+    observe_context_window(accounting)
+    return window
+
+
+def _initial_user_message(position: int, user_statement: str) -> str:
+    return f"Auf die Frage, wie ich zu dieser These stehe (Skala 0–100), habe ich {position} angegeben.\n\nAls kurze Begründung bzw. Stellungnahme habe ich folgendes geschrieben: {user_statement}"
+
+
+def _metadata(prolific_pid: Optional[str]) -> Optional[dict]:
+    return {"metadata": {"prolific_id": prolific_pid}} if prolific_pid else None
+
+
+def _with_history(system_prompt: str, first_user_message: str, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Prepend the system prompt to a client history and rewrite its first user message"""
+    messages = history.copy()
+    # Add system prompt if not already present
+    if not messages or messages[0].get("role") != "system":
+        messages.insert(0, {"role": "system", "content": system_prompt})
+    # Replace only the first user message after the system prompt
+    for i in range(len(messages)):
+        if messages[i].get("role") == "user":
+            messages[i] = {"role": "user", "content": first_user_message}
+            break
+    return messages
+
+
+def _group_a_messages(thesis_text, position, user_statement, pro_text, contra_text, thesis_id=None) -> List[Dict[str, str]]:
+    system_prompt = prompt_registry.system_prompt("A", thesis_id, position, thesis_text, pro_text, contra_text)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": _initial_user_message(position, user_statement)}
+    ]
+
+
+def group_b_initial_messages(thesis_text, position, user_statement, pro_text, contra_text, thesis_id=None) -> List[Dict[str, str]]:
+    """System prompt and rewritten first user message that open a Group B conversation"""
+    system_prompt = prompt_registry.system_prompt("B", thesis_id, position, thesis_text, pro_text, contra_text)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": _initial_user_message(position, user_statement)}
+    ]
+
+
+def _group_b_messages(thesis_text, position, user_statement, pro_text, contra_text, history, thesis_id=None) -> List[Dict[str, str]]:
+    if not history:
+        # First conversation - create initial user message
+        return group_b_initial_messages(thesis_text, position, user_statement, pro_text, contra_text, thesis_id)
+    # Continuing conversation - use existing history
+    system_prompt = prompt_registry.system_prompt("B", thesis_id, position, thesis_text, pro_text, contra_text)
+    return _with_history(system_prompt, _initial_user_message(position, user_statement), history)
+
+
+def _group_c_messages(thesis_text, position, user_statement, thesis_id=None) -> List[Dict[str, str]]:
+    system_prompt = prompt_registry.system_prompt("C", thesis_id, position, thesis_text)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": _initial_user_message(position, user_statement)}
+    ]
 
-def generate_group_a_response(
+
+async def _close_stream(opened) -> None:
+    await opened["stream"].close()
+
+
+async def _stream_completion(messages: List[Dict[str, str]], prolific_pid: Optional[str], label: str) -> AsyncIterator[Tuple[str, str]]:
+    """Yield (content delta, answering model) of a streamed chat completion"""
+    async def open_stream(model):
+        started = time.perf_counter()
+        stream = await _client().chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            extra_body=_metadata(prolific_pid)
+        )
+        # The call policy covers the time to the first chunk, later chunks cannot be retried
+        chunks = stream.__aiter__()
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except BaseException:
+            await stream.close()
+            raise
+        return {"stream": stream, "chunks": chunks, "first": first, "model": model,
+                "started": started, "ttfb": time.perf_counter() - started}
+
+    opened = await call_policy.run(open_stream, MODEL, label, on_discard=_close_stream)
+
+    async def chunks():
+        if opened["first"] is not None:
+            yield opened["first"]
+        async for chunk in opened["chunks"]:
+            yield chunk
+
+    usage = None
+    try:
+        async for chunk in chunks():
+            # With include_usage the last chunk carries the token counts and no choices
+            usage = chunk.usage or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content, opened["model"]
+        observe_llm(label, opened["model"], opened["ttfb"], time.perf_counter() - opened["started"], usage)
+    finally:
+        await opened["stream"].close()
+
+
+async def _complete(messages: List[Dict[str, str]], prolific_pid: Optional[str], label: str, use_cache: bool = True) -> Tuple[str, str]:
+    """Content of a chat completion and the model that answered.
+
+    For groups that allow it, concurrent calls with identical messages share one call.
+    """
+    async def call(model):
+        started = time.perf_counter()
+        response = await _client().chat.completions.create(
+            model=model,
+            messages=messages,
+            extra_body=_metadata(prolific_pid)
+        )
+        return _reply(response, label, model, started), model
+
+    if not use_cache or not single_flight.enabled_for(label):
+        return await call_policy.run(call, MODEL, label)
+    # A coalesced call carries the metadata of the participant that started it
+    return await single_flight.do(payload_key(MODEL, messages), lambda: call_policy.run(call, MODEL, label))
+
+
+def _cache_key(group: str, messages: List[Dict[str, str]], use_cache: bool) -> Optional[str]:
+    return response_cache.key(messages, MODEL) if use_cache and response_cache.enabled_for(group) else None
+
+
+def first_turn_messages(group: str, thesis_text: str, position: int, user_statement: str, pro_text: str, contra_text: str, thesis_id: Optional[int] = None) -> List[Dict[str, str]]:
+    """Messages of a Group A or C first turn, whose reply depends on nothing else"""
+    if group == "A":
+        return _group_a_messages(thesis_text, position, user_statement, pro_text, contra_text, thesis_id)
+    if group == "C":
+        return _group_c_messages(thesis_text, position, user_statement, thesis_id)
+    raise ValueError(f"Group {group} has no stand-alone first turn")
+
+
+async def _precomputed_reply(group: str, messages: List[Dict[str, str]], use_cache: bool) -> Optional[str]:
+    if not use_cache or not precomputed_replies.enabled_for(group):
+        return None
+    return await precomputed_replies.get(response_cache.key(messages, MODEL))
+
+
+async def _cached_completion(group: str, messages: List[Dict[str, str]], prolific_pid: Optional[str], use_cache: bool) -> Tuple[str, str]:
+    """Reply content and model for a first turn, served from precomputed replies or the response cache if enabled"""
+    precomputed = await _precomputed_reply(group, messages, use_cache)
+    if precomputed is not None:
+        return precomputed, MODEL
+
+    key = _cache_key(group, messages, use_cache)
+    if key:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            return cached, MODEL
+
+    content, model = await _complete(messages, prolific_pid, group, use_cache)
+    # Fallback replies are not cached, they would be served to later participants as MODEL replies
+    if key and content and model == MODEL:
+        await response_cache.set(key, content)
+    return content, model
+
+
+async def _cached_stream(group: str, messages: List[Dict[str, str]], prolific_pid: Optional[str], use_cache: bool) -> AsyncIterator[Tuple[str, str]]:
+    """Streaming variant of _cached_completion, a cached reply is sent as one delta"""
+    precomputed = await _precomputed_reply(group, messages, use_cache)
+    if precomputed is not None:
+        yield precomputed, MODEL
+        return
+
+    key = _cache_key(group, messages, use_cache)
+    if key:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            yield cached, MODEL
+            return
+
+    parts = []
+    model = MODEL
+    async for delta, model in _stream_completion(messages, prolific_pid, group):
+        parts.append(delta)
+        yield delta, model
+    if key and parts and model == MODEL:
+        await response_cache.set(key, "".join(parts))
+
+
+async def generate_group_a_response(
     thesis_text: str,
     position: int,
     user_statement: str,
     pro_text: str,
     contra_text: str,
-    prolific_pid: Optional[str] = None
+    prolific_pid: Optional[str] = None,
+    thesis_id: Optional[int] = None,
+    use_cache: bool = True
 ) -> Dict[str, str]:
 
-    # Calculate position_LLM based on position
-    position_LLM = 100 if position > 50 else 0
-
-    system_prompt = (
-        "Du bist ein neutraler, faktenbasierter KI-Assistent für politische Diskussionen. "
-        "Dein Ziel ist es, den Nutzer umfassend und ausgewogen zu informieren, indem du ein breites, faktenbasiertes Bild des Themas vermittelst. "
-        "Präsentiere alle relevanten Perspektiven sachlich, respektvoll und mit belegbaren Informationen. "
-        "Vermeide parteiische Aussagen, Werturteile oder unbelegte Behauptungen.\n\n"
-        "Wir diskutieren die folgende These aus dem Wahl-O-Mat zur Bundestagswahl 2025:\n"
-        f'"{thesis_text}"\n\n'
-        "Bisher wurden folgende Pro- und Kontra-Argumente zum Thema generiert, mit denen sich der Nutzer bereits auseinandergesetzt hat:\n"
-        f"PRO: {pro_text}\n"
-        f"KONTRA: {contra_text}\n\n"
-        "Nutze in deiner ersten Antwort die persönliche Einschätzung (Skala 0–100) "
-        "und die schriftliche Begründung, die du gleich vom Nutzer erhältst, um einen individuellen, auf den Nutzer zugeschnittenen Antwortabschnitt zu verfassen. "
-        "Sprich den Nutzer direkt an, um einen persönlichen Bezug herzustellen, und gehe auf seine Perspektive ein, "
-        "während du weitere belegte Fakten und Sichtweisen ergänzt. "
-        "Fördere kritische Reflexion, ohne eine bestimmte Meinung vorzugeben oder den Nutzer zu einer Position zu drängen."
-        )
-    
-    user_message = f"Auf die Frage, wie ich zu dieser These stehe (Skala 0–100), habe ich {position} angegeben.\n\nAls kurze Begründung bzw. Stellungnahme habe ich folgendes geschrieben: {user_statement}"
-    
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_message}
-    ]
-    
+    messages = _group_a_messages(thesis_text, position, user_statement, pro_text, contra_text, thesis_id)
+
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            extra_body={"metadata": {"prolific_id": prolific_pid}} if prolific_pid else None
-        )
-        
-        personal_response = response.choices[0].message.content
+        personal_response, model = await _cached_completion("A", messages, prolific_pid, use_cache)
         # Combine pre-generated sections with AI personal response
-        full_response = f"PRO:\n {pro_text}\n\nKONTRA:\n {contra_text}\n\n{personal_response}"
-        
-        return {"role": "assistant", "content": full_response}
-        
+        full_response = f"{pro_contra_block(pro_text, contra_text)}{personal_response}"
+
+        return {"role": "assistant", "content": full_response, **_answered_by(model)}
+
     except Exception as e:
         return {"role": "error", "content": f"api_interface Error: {str(e)}"}
 
 
-def generate_group_b_response(
+async def generate_group_b_response(
     thesis_text: str,
     position: int,
     user_statement: str,
     pro_text: str,
     contra_text: str,
     history: Optional[List[Dict[str, str]]] = None,
-    prolific_pid: Optional[str] = None
+    prolific_pid: Optional[str] = None,
+    thesis_id: Optional[int] = None
 ) -> Dict[str, str]:
-   
-    # Calculate position_LLM based on position
-    position_LLM = 100 if position > 50 else 0
-
-    system_prompt = (
-        "Du bist ein neutraler, faktenbasierter KI-Assistent für politische Diskussionen. "
-        "Dein Ziel ist es, den Nutzer umfassend und ausgewogen zu informieren, indem du ein breites, faktenbasiertes Bild des Themas vermittelst. "
-        "Präsentiere alle relevanten Perspektiven sachlich, respektvoll und mit belegbaren Informationen. "
-        "Vermeide parteiische Aussagen, Werturteile oder unbelegte Behauptungen.\n\n"
-        "Wir diskutieren die folgende These aus dem Wahl-O-Mat zur Bundestagswahl 2025:\n"
-        f'"{thesis_text}"\n\n'
-        "Bisher wurden folgende Pro- und Kontra-Argumente zum Thema generiert, mit denen sich der Nutzer bereits auseinandergesetzt hat:\n"
-        f"PRO: {pro_text}\n"
-        f"KONTRA: {contra_text}\n\n"
-        "Nutze in deiner ersten Antwort die persönliche Einschätzung (Skala 0–100) "
-        "und die schriftliche Begründung, die du gleich vom Nutzer erhältst, um einen individuellen, auf den Nutzer zugeschnittenen Antwortabschnitt zu verfassen. "
-        "Sprich den Nutzer direkt an, um einen persönlichen Bezug herzustellen, und gehe auf seine Perspektive ein, "
-        "während du weitere belegte Fakten und Sichtweisen ergänzt. "
-        "Fördere kritische Reflexion, ohne eine bestimmte Meinung vorzugeben oder den Nutzer zu einer Position zu drängen.\n\n"
-        "Ab deiner zweiten Antwort und in allen weiteren Nachrichten reagiere frei auf die Eingaben des Nutzers, um eine fortlaufende Diskussion zu führen. "
-        "Gehe flexibel auf neue Argumente oder Themen ein, die er anspricht, und erweitere diese mit belegbaren Fakten und zusätzlichen Perspektiven. "
-        "Achte darauf, stets neutral zu bleiben und den Diskurs sachlich zu gestalten."
-        )
-    
-    
+
+    messages = _group_b_messages(thesis_text, position, user_statement, pro_text, contra_text, history, thesis_id)
+
     try:
+        messages = await _windowed(messages)
+        content, model = await _complete(messages, prolific_pid, "B")
+
         if not history:
-            # First conversation - create initial user message
-            user_message = f"Auf die Frage, wie ich zu dieser These stehe (Skala 0–100), habe ich {position} angegeben.\n\nAls kurze Begründung bzw. Stellungnahme habe ich folgendes geschrieben: {user_statement}"
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ]
+            full_response = f"{pro_contra_block(pro_text, contra_text)}{content}"
+            return {"role": "assistant", "content": full_response, **_answered_by(model)}
+
+        return {"role": "assistant", "content": content, **_answered_by(model)}
+
+    except Exception as e:
+        return {"role": "error", "content": f"api_interface Error: {str(e)}"}
+
+
+async def generate_group_b_session_response(
+    messages: List[Dict[str, str]],
+    prolific_pid: Optional[str] = None
+) -> Dict[str, str]:
+    """Continue a Group B conversation whose full message list is kept server-side"""
+    try:
+        messages = await _windowed(messages)
+        content, model = await _complete(messages, prolific_pid, "B")
+        return {"role": "assistant", "content": content, **_answered_by(model)}
 
-            response = client.chat.completions.create(
-                model=MODEL,
-                messages=messages,
-                extra_body={"metadata": {"prolific_id": prolific_pid}} if prolific_pid else None
-            )
-            
-            personal_response = response.choices[0].message.content
-            full_response = f"PRO:\n {pro_text}\n\nKONTRA:\n {contra_text}\n\n{personal_response}"
-            
-            # print(history)
-            return {"role": "assistant", "content": full_response}
-        else:
-            # Continuing conversation - use existing history
-            # Add system prompt if not already present
-            messages = history.copy()
-            if not messages or messages[0].get("role") != "system":
-                messages.insert(0, {"role": "system", "content": system_prompt})
-            # Replace only the first user message after the system prompt
-            for i in range(len(messages)):
-                if messages[i].get("role") == "user":
-                    messages[i] = {
-                        "role": "user",
-                        "content": f"Auf die Frage, wie ich zu dieser These stehe (Skala 0–100), habe ich {position} angegeben.\n\nAls kurze Begründung bzw. Stellungnahme habe ich folgendes geschrieben: {user_statement}"
-                    }
-                    break
-
-            response = client.chat.completions.create(
-                model=MODEL,
-                messages=messages,
-                extra_body={"metadata": {"prolific_id": prolific_pid}} if prolific_pid else None
-            )
-            
-            # print(messages)
-            return {"role": "assistant", "content": response.choices[0].message.content}
-    
     except Exception as e:
         return {"role": "error", "content": f"api_interface Error: {str(e)}"}
 
 
-def generate_group_c_response(
+async def generate_group_c_response(
     thesis_text: str,
     position: int,
     user_statement: str,
     pro_text: str,
     contra_text: str,
-    prolific_pid: Optional[str] = None
+    prolific_pid: Optional[str] = None,
+    thesis_id: Optional[int] = None,
+    use_cache: bool = True
 ) -> Dict[str, str]:
 
-    # Calculate position_LLM based on position
-    position_LLM = 100 if position < 50 else 0
-
-    system_prompt = (
-        "Du bist ein faktenbasierter KI-Assistent für politische Diskussionen. "
-        "Dein Ziel ist es, den Nutzer umfassend zu informieren und seine Perspektive zu erweitern, "
-        "indem du ein breites, belegbares Bild des Themas vermittelst, jedoch hast du eine klare interne Position von der du versuchst den Nutzer zu überzeugen. "
-         "Wir diskutieren die folgende These aus dem Wahl-O-Mat zur Bundestagswahl 2025:\n"
-        f"\"{thesis_text}\"\n\n"
-         
-        f"Du hast eine interne Position zur These, die auf einer Skala von 0 (stimme überhaupt nicht zu) "
-        f"bis 100 (stimme voll und ganz zu) liegt und aktuell bei {position_LLM} steht. "
-        "Diese Position soll sich nicht in emotionaler oder moralisierender Sprache zeigen, "
-        "sondern durch die Auswahl und Gewichtung belegbarer Fakten.\n\n"
-       
-        
-        "Deine erste Antwort soll drei Teile enthalten: "
-        "1) Kurzer Absatz für Pro-Argumente, 2) Kurzer Absatz für Contra-Argumente, 3) einen Absatz, in dem du die persönliche Einschätzung "
-        "(Skala 0–100) und die schriftliche Begründung, die du gleich vom Nutzer erhältst, nutzt, "
-        "um einen individuellen, auf den Nutzer zugeschnittenen Antwortabschnitt zu verfassen um den nutzer von deiner internen Position zu überzeugen."
-        "Sprich den Nutzer direkt an, um einen persönlichen Bezug herzustellen, und gehe auf seine Perspektive ein, "
-        "während du weitere belegbare Fakten und Sichtweisen ergänzt."
-        "Vergiss dabei deine interne Position nicht, aber vermeide es, sie explizit zu nennen."
-        )
-    
-    user_message = f"Auf die Frage, wie ich zu dieser These stehe (Skala 0–100), habe ich {position} angegeben.\n\nAls kurze Begründung bzw. Stellungnahme habe ich folgendes geschrieben: {user_statement}"
-    
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_message}
-    ]
-    
+    messages = _group_c_messages(thesis_text, position, user_statement, thesis_id)
+
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            extra_body={"metadata": {"prolific_id": prolific_pid}} if prolific_pid else None
-        )
-        
-        personal_response = response.choices[0].message.content
-        
-        return {"role": "assistant", "content": personal_response}
-        
+        personal_response, model = await _cached_completion("C", messages, prolific_pid, use_cache)
+
+        return {"role": "assistant", "content": personal_response, **_answered_by(model)}
+
     except Exception as e:
         return {"role": "error", "content": f"api_interface Error: {str(e)}"}
 
-def generate_api_tester_response(
+
+async def stream_group_a_response(
+    thesis_text: str,
+    position: int,
+    user_statement: str,
+    pro_text: str,
+    contra_text: str,
+    prolific_pid: Optional[str] = None,
+    thesis_id: Optional[int] = None,
+    use_cache: bool = True
+) -> AsyncIterator[Dict[str, str]]:
+    """Streaming variant of generate_group_a_response yielding content deltas"""
+    # The PRO/KONTRA section is static, flush it before the model call
+    yield {"role": "assistant", "content": pro_contra_block(pro_text, contra_text)}
+
+    messages = _group_a_messages(thesis_text, position, user_statement, pro_text, contra_text, thesis_id)
+    try:
+        async for delta, model in _cached_stream("A", messages, prolific_pid, use_cache):
+            yield {"role": "assistant", "content": delta, **_answered_by(model)}
+    except Exception as e:
+        yield {"role": "error", "content": f"api_interface Error: {str(e)}"}
+
+
+async def stream_group_b_response(
+    thesis_text: str,
+    position: int,
+    user_statement: str,
+    pro_text: str,
+    contra_text: str,
+    history: Optional[List[Dict[str, str]]] = None,
+    prolific_pid: Optional[str] = None,
+    thesis_id: Optional[int] = None
+) -> AsyncIterator[Dict[str, str]]:
+    """Streaming variant of generate_group_b_response yielding content deltas"""
+    if not history:
+        yield {"role": "assistant", "content": pro_contra_block(pro_text, contra_text)}
+
+    messages = _group_b_messages(thesis_text, position, user_statement, pro_text, contra_text, history, thesis_id)
+    try:
+        messages = await _windowed(messages)
+        async for delta, model in _stream_completion(messages, prolific_pid, "B"):
+            yield {"role": "assistant", "content": delta, **_answered_by(model)}
+    except Exception as e:
+        yield {"role": "error", "content": f"api_interface Error: {str(e)}"}
+
+
+async def stream_group_b_session_response(
+    messages: List[Dict[str, str]],
+    prolific_pid: Optional[str] = None
+) -> AsyncIterator[Dict[str, str]]:
+    """Streaming variant of generate_group_b_session_response"""
+    try:
+        messages = await _windowed(messages)
+        async for delta, model in _stream_completion(messages, prolific_pid, "B"):
+            yield {"role": "assistant", "content": delta, **_answered_by(model)}
+    except Exception as e:
+        yield {"role": "error", "content": f"api_interface Error: {str(e)}"}
+
+
+async def stream_group_c_response(
+    thesis_text: str,
+    position: int,
+    user_statement: str,
+    pro_text: str,
+    contra_text: str,
+    prolific_pid: Optional[str] = None,
+    thesis_id: Optional[int] = None,
+    use_cache: bool = True
+) -> AsyncIterator[Dict[str, str]]:
+    """Streaming variant of generate_group_c_response yielding content deltas"""
+    messages = _group_c_messages(thesis_text, position, user_statement, thesis_id)
+    try:
+        async for delta, model in _cached_stream("C", messages, prolific_pid, use_cache):
+            yield {"role": "assistant", "content": delta, **_answered_by(model)}
+    except Exception as e:
+        yield {"role": "error", "content": f"api_interface Error: {str(e)}"}
+
+
+async def generate_api_tester_response(
     thesis_text: str,
     position: int,
     user_statement: str,
     history: Optional[List[Dict[str, str]]],
     api_key: str,
-    model: str
+    model: str,
+    base_url: Optional[str] = None,
+    thesis_id: Optional[int] = None
 ) -> Dict[str, str]:
-    
-    # Calculate position_LLM based on position
-    position_LLM = 100 if position > 50 else 0
-    
     """
     Generate a response using a custom API key and model, and prompt the model to provide both pro and contra arguments.
     """
-    from openai import OpenAI
-
-    system_prompt = (
-        "Du bist ein neutraler, faktenbasierter KI-Assistent für politische Diskussionen. "
-        "Vermeide parteiische Aussagen oder Werturteile. Präsentiere alle Perspektiven sachlich und respektvoll.\n"
-        "Wir diskutieren die folgende These aus dem Wahl-O-Mat zur Bundestagswahl 2025:\n\n"
-        f'"{thesis_text}"\n\n'
-        "Bitte nenne in deiner ersten Antwort jeweils mindestens ein PRO- und ein KONTRA-Argument zu dieser These. "
-        "Kennzeichne die Argumente klar als PRO und KONTRA. "
-        "Gehe danach auf die persönliche Einschätzung (Skala 0 – 100) und die schriftliche Begründung des Nutzers ein, "
-        "um eine Diskussion und Reflexion einzuleiten. "
-        "Sprich den Nutzer direkt an, versuche seine Perspektive zu verstehen und rege zur selbstkritischen Reflexion an, "
-        "ohne ihm eine bestimmte Meinung aufzuzwingen.\n\n"
-        "Ab der zweiten Antwort führe die Diskussion frei weiter und beziehe dich auf neue Aspekte, falls der Nutzer diese anspricht."
-    )
+    system_prompt = prompt_registry.system_prompt("tester", thesis_id, position, thesis_text)
+    user_message = _initial_user_message(position, user_statement)
 
     try:
-        client = OpenAI(api_key=api_key)
+        client = client_pool.get(api_key, base_url)
         if not history:
-            user_message = f"Auf die Frage, wie ich zu dieser These stehe (Skala 0–100), habe ich {position} angegeben.\n\nAls kurze Begründung bzw. Stellungnahme habe ich folgendes geschrieben: {user_statement}"
-
             messages = [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_message}
             ]
-
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages
-            )
-
-            return {"role": "assistant", "content": response.choices[0].message.content}
         else:
-            messages = history.copy()
-            if not messages or messages[0].get("role") != "system":
-                messages.insert(0, {"role": "system", "content": system_prompt})
-            for i in range(len(messages)):
-                if messages[i].get("role") == "user":
-                    messages[i] = {
-                        "role": "user",
-                        "content": f"Auf die Frage, wie ich zu dieser These stehe (Skala 0–100), habe ich {position} angegeben.\n\nAls kurze Begründung bzw. Stellungnahme habe ich folgendes geschrieben: {user_statement}"
-                    }
-                    break
-
-            response = client.chat.completions.create(
+            messages = _with_history(system_prompt, user_message, history)
+
+        async def call(model):
+            started = time.perf_counter()
+            response = await client.chat.completions.create(
                 model=model,
                 messages=messages
             )
+            return _reply(response, "tester", model, started)
 
-            return {"role": "assistant", "content": response.choices[0].message.content}
+        # The fallback model and hedging only apply to our own OpenAI account
+        content = await call_policy.run(call, model, "tester", fallback=False, hedge=False)
+        return {"role": "assistant", "content": content}
 
     except Exception as e:
         return {"role": "error", "content": f"api_tester Error: {str(e)}"}
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Optional, TypeVar
+import openai
+from app.metrics import LLM_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+# One JSON line per attempt, for tail-latency analysis of the provider
+attempt_logger = logging.getLogger("app.call_policy.attempts")
+
+T = TypeVar("T")
+
+
+def _outcome(error: Optional[BaseException]) -> str:
+    if error is None:
+        return "ok"
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError)):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection_error"
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code == 429:
+            return "rate_limited"
+        return "server_error" if error.status_code >= 500 else "client_error"
+    return "error"
+
+
+RETRYABLE_OUTCOMES = {"timeout", "connection_error", "rate_limited", "server_error"}
+
+
+class CallPolicy:
+    """Retry, timeout and hedging policy for OpenAI calls.
+
+    Every attempt runs under its own deadline. Timeouts, connection errors,
+    429s and 5xx responses are retried with exponentially growing, fully
+    jittered backoff (a longer Retry-After from the provider wins), and
+    after max_attempts on the primary model one last attempt goes to the
+    fallback model. With hedging, an attempt still running after the
+    model's recent latency quantile gets a second, identical request, and
+    the first success wins. Every attempt is recorded.
+    """
+
+    def __init__(
+        self,
+        attempt_timeout: float,
+        max_attempts: int,
+        backoff_base: float,
+        backoff_max: float,
+        fallback_model: Optional[str] = None,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        log_size: int = 1000
+    ):
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.fallback_model = fallback_model
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        # Latencies of successful attempts per model, the basis of the hedge delay
+        self.latencies = defaultdict(lambda: deque(maxlen=500))
+        self.attempts = deque(maxlen=log_size)
+
+    def _record(self, label: str, model: str, attempt: int, hedged: bool, started: float, error: Optional[BaseException]) -> None:
+        seconds = time.monotonic() - started
+        outcome = _outcome(error)
+        if outcome == "ok":
+            self.latencies[model].append(seconds)
+        record = {
+            "label": label,
+            "model": model,
+            "attempt": attempt,
+            "hedged": hedged,
+            "outcome": outcome,
+            "status": getattr(error, "status_code", None),
+            "seconds": round(seconds, 4),
+            "at": time.time()
+        }
+        self.attempts.append(record)
+        LLM_ATTEMPTS.labels(label, model, outcome).inc()
+        attempt_logger.info(json.dumps(record))
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Recent latency quantile of the model, or None while there are too few samples"""
+        samples = self.latencies[model]
+        if not self.hedge or len(samples) < self.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))]
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            return max(delay, min(float(retry_after), self.backoff_max)) if retry_after else delay
+        except ValueError:
+            return delay
+
+    async def _attempt(self, call, model, label, attempt, hedged):
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(call(model), timeout=self.attempt_timeout)
+        except BaseException as e:
+            self._record(label, model, attempt, hedged, started, e)
+            raise
+        self._record(label, model, attempt, hedged, started, None)
+        return result
+
+    async def _hedged_attempt(self, call, model, label, attempt, hedge, on_discard):
+        delay = self.hedge_delay(model) if hedge else None
+        if delay is None:
+            return await self._attempt(call, model, label, attempt, False)
+
+        pending = {asyncio.create_task(self._attempt(call, model, label, attempt, False))}
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            logger.info(f"Hedging {label} call to {model} after {delay:.2f}s")
+            pending.add(asyncio.create_task(self._attempt(call, model, label, attempt, True)))
+
+        error = None
+        try:
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        winner = task.result()
+                        for other in done - {task}:
+                            if other.exception() is None and on_discard:
+                                await on_discard(other.result())
+                        return winner
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+                if on_discard:
+                    # A loser may still finish before the cancellation lands
+                    task.add_done_callback(lambda t: asyncio.ensure_future(on_discard(t.result())) if not t.cancelled() and t.exception() is None else None)
+
+    async def run(
+        self,
+        call: Callable[[str], Awaitable[T]],
+        model: str,
+        label: str,
+        fallback: bool = True,
+        hedge: bool = True,
+        on_discard: Optional[Callable[[T], Awaitable[None]]] = None
+    ) -> T:
+        """Call call(model) under the policy; on_discard releases the result of a losing hedge"""
+        plan = [model] * self.max_attempts
+        if fallback and self.fallback_model and self.fallback_model != model:
+            plan.append(self.fallback_model)
+
+        for attempt, attempt_model in enumerate(plan, start=1):
+            try:
+                return await self._hedged_attempt(call, attempt_model, label, attempt, hedge, on_discard)
+            except Exception as e:
+                if _outcome(e) not in RETRYABLE_OUTCOMES or attempt == len(plan):
+                    raise
+                if plan[attempt] == attempt_model:
+                    await asyncio.sleep(self._backoff(attempt, e))
+                else:
+                    logger.warning(f"Falling back from {attempt_model} to {plan[attempt]} for {label} call: {e}")
+
+    def stats(self) -> dict:
+        summary = {}
+        for record in self.attempts:
+            model = summary.setdefault(record["model"], {"attempts": 0, "hedged": 0, "outcomes": defaultdict(int), "seconds": []})
+            model["attempts"] += 1
+            model["hedged"] += record["hedged"]
+            model["outcomes"][record["outcome"]] += 1
+            if record["outcome"] == "ok":
+                model["seconds"].append(record["seconds"])
+        for model in summary.values():
+            seconds = sorted(model.pop("seconds"))
+            model["outcomes"] = dict(model["outcomes"])
+            for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                model[f"seconds_{name}"] = seconds[min(len(seconds) - 1, int(q * len(seconds)))] if seconds else None
+        return {
+            "models": summary,
+            "hedge_delay": {model: self.hedge_delay(model) for model in self.latencies},
+            "recent": list(self.attempts)[-50:]
+        }
+
+
+call_policy = CallPolicy(
+    attempt_timeout=float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "60")),
+    max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3")),
+    backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5")),
+    backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8")),
+    fallback_model=os.getenv("LLM_FALLBACK_MODEL") or None,
+    hedge=os.getenv("LLM_HEDGE_ENABLED", "").lower() in ("1", "true", "yes"),
+    hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+    hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+)
@@ -0,0 +1,142 @@
+import hashlib
+import os
+from typing import Dict, List, Optional, Set, Tuple
+from bson import Binary
+from app.thesis_catalog import Thesis, pro_contra_block, thesis_catalog
+
+# zstd compression of long turns needs the optional zstandard package, block references always work
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Value of the chatHistoryFormat field of compactly stored documents, raw documents have none
+FORMAT_VERSION = 1
+
+# Keys of a message the encoding applies to, model marks replies of a fallback model
+MESSAGE_FIELDS = frozenset(("role", "content", "model"))
+
+
+def block_id(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ChatHistoryCodec:
+    """Compact MongoDB encoding of the chatHistory of study documents.
+
+    The first assistant turn of every group starts with the PRO/KONTRA block
+    of the thesis, the same few kilobytes in every submission. With the
+    encoding on, that prefix is replaced by a block id (a hash of the block
+    text) and the rest of a turn is zstd-compressed once it is at least
+    min_compress_bytes long. Block texts are resolved through the thesis
+    catalog and stored once in the chat_blocks collection, so documents
+    written before a catalog change still decode to the text participants saw.
+
+    Encoded documents carry chatHistoryFormat; DatabaseManager decodes them
+    when reading, so exports and get_all_study_data see plain messages.
+    """
+
+    def __init__(self, enabled: bool, min_compress_bytes: int = 512, level: int = 3):
+        self.enabled = enabled
+        self.min_compress_bytes = min_compress_bytes
+        self.level = level
+        self.blocks: Dict[str, str] = {}
+        # Per thesis id: the catalog record a block was computed from, its id and text
+        self._thesis_blocks: Dict[int, Tuple[Thesis, str, str]] = {}
+        self._compressor = zstandard.ZstdCompressor(level=level) if zstandard else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+    def _block_for(self, thesis_id) -> Optional[Tuple[str, str]]:
+        """Id and text of the current PRO/KONTRA block of a thesis"""
+        try:
+            thesis = thesis_catalog.get(int(thesis_id))
+        except (TypeError, ValueError):
+            return None
+        if thesis is None or not thesis.in_study:
+            return None
+        cached = self._thesis_blocks.get(thesis.id)
+        if cached is None or cached[0] is not thesis:
+            text = pro_contra_block(thesis.pro, thesis.contra)
+            cached = (thesis, block_id(text), text)
+            self._thesis_blocks[thesis.id] = cached
+            self.blocks[cached[1]] = text
+        return cached[1], cached[2]
+
+    def encode(self, document: dict) -> List[dict]:
+        """Encode document["chatHistory"] in place.
+
+        Returns the chat_blocks documents it references, for the caller to
+        store. Already encoded documents are left as they are, so a batch
+        that is retried is not encoded twice.
+        """
+        history = document.get("chatHistory")
+        if not self.enabled or not history or "chatHistoryFormat" in document:
+            return []
+        block = self._block_for(document.get("thesisId"))
+        used = {}
+        encoded = []
+        for message in history:
+            content = message.get("content")
+            if not isinstance(content, str) or not set(message) <= MESSAGE_FIELDS:
+                encoded.append(message)
+                continue
+            stored = {key: value for key, value in message.items() if key != "content"}
+            if block and message["role"] == "assistant" and content.startswith(block[1]):
+                stored["block"] = block[0]
+                used[block[0]] = block[1]
+                content = content[len(block[1]):]
+            data = content.encode("utf-8")
+            if self._compressor and len(data) >= self.min_compress_bytes:
+                compressed = self._compressor.compress(data)
+                if len(compressed) < len(data):
+                    stored["zstd"] = Binary(compressed)
+                    encoded.append(stored)
+                    continue
+            stored["content"] = content
+            encoded.append(stored)
+        document["chatHistory"] = encoded
+        document["chatHistoryFormat"] = FORMAT_VERSION
+        return [{"_id": key, "thesisId": document.get("thesisId"), "text": text} for key, text in used.items()]
+
+    def missing_blocks(self, document: dict) -> Set[str]:
+        """Block ids of an encoded document that are neither known nor in the current catalog"""
+        if "chatHistoryFormat" not in document:
+            return set()
+        ids = {message["block"] for message in document.get("chatHistory") or () if "block" in message}
+        missing = ids - self.blocks.keys()
+        if missing:
+            self._block_for(document.get("thesisId"))
+            missing -= self.blocks.keys()
+        return missing
+
+    def decode(self, document: dict) -> dict:
+        """Turn an encoded document back into plain {"role", "content"[, "model"]} messages, in place"""
+        if document.pop("chatHistoryFormat", None) is None:
+            return document
+        history = []
+        for message in document.get("chatHistory") or ():
+            if "zstd" in message:
+                if self._decompressor is None:
+                    raise RuntimeError("Reading compressed chat histories needs the zstandard package")
+                content = self._decompressor.decompress(message["zstd"]).decode("utf-8")
+            elif "block" in message:
+                content = message.get("content", "")
+            else:
+                # Stored as it was
+                history.append(message)
+                continue
+            if "block" in message:
+                content = self.blocks[message["block"]] + content
+            decoded = {"role": message["role"], "content": content}
+            if "model" in message:
+                decoded["model"] = message["model"]
+            history.append(decoded)
+        document["chatHistory"] = history
+        return document
+
+
+chat_codec = ChatHistoryCodec(
+    enabled=os.getenv("CHAT_STORAGE_COMPACT", "0").lower() in ("1", "true", "yes"),
+    min_compress_bytes=int(os.getenv("CHAT_COMPRESS_MIN_BYTES", "512")),
+    level=int(os.getenv("CHAT_COMPRESS_LEVEL", "3"))
+)
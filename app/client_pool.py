@@ -0,0 +1,54 @@
+import hashlib
+import os
+from typing import Optional
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from app.cache import TTLCache
+
+
+class ClientPool:
+    """Bounded cache of AsyncOpenAI clients keyed by a hash of (api_key, base_url).
+
+    All clients share one httpx connection pool, so connections and TLS
+    sessions to the provider are reused across requests and API keys.
+    Clients idle for longer than idle_timeout are dropped from the cache;
+    dropping one does not close the shared connections.
+    """
+
+    def __init__(self, maxsize: int, idle_timeout: float, max_connections: int, keepalive_expiry: float):
+        self.clients = TTLCache(maxsize=maxsize, ttl=idle_timeout)
+        self.http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry
+            )
+        )
+
+    @staticmethod
+    def _key(api_key: str, base_url: Optional[str]) -> str:
+        return hashlib.sha256(f"{api_key}\0{base_url or ''}".encode("utf-8")).hexdigest()
+
+    def get(self, api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+        """Return the cached client for these credentials, creating it if needed"""
+        base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        key = self._key(api_key, base_url)
+        client = self.clients.get(key)
+        if client is None:
+            # Retries are left to the call policy
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client, max_retries=0)
+        # Re-inserting refreshes the idle timeout
+        self.clients.set(key, client)
+        return client
+
+    async def aclose(self) -> None:
+        self.clients.clear()
+        await self.http_client.aclose()
+
+
+client_pool = ClientPool(
+    maxsize=int(os.getenv("OPENAI_CLIENT_CACHE_SIZE", "64")),
+    idle_timeout=float(os.getenv("OPENAI_CLIENT_IDLE_SECONDS", "900")),
+    max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+    keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_SECONDS", "60"))
+)
@@ -0,0 +1,51 @@
+"""Convert stored chat histories to the compact format, or back.
+
+Rewrites the chatHistory of study documents that are still stored as plain
+{"role", "content"} messages in the encoding of app.chat_storage: the
+PRO/KONTRA block replaced by a reference, long turns zstd-compressed.
+Reads decode both formats, so the app can keep running during a migration,
+and a rerun only touches documents that were not converted yet. --expand
+converts compact documents back to plain messages, e.g. before removing
+the zstandard package.
+
+    python -m app.compact_chat_history --dry-run
+    python -m app.compact_chat_history
+    python -m app.compact_chat_history --expand
+"""
+import argparse
+import asyncio
+from app.chat_storage import chat_codec, zstandard
+from app.database import db_manager
+
+
+async def run(args) -> None:
+    await db_manager.ping()
+    # The migration encodes regardless of CHAT_STORAGE_COMPACT, which only governs new submissions
+    chat_codec.enabled = True
+    if zstandard is None and not args.expand:
+        print("zstandard is not installed, only the PRO/KONTRA blocks are deduplicated")
+    stats = await db_manager.rewrite_chat_histories(compact=not args.expand, batch_size=args.batch_size, dry_run=args.dry_run)
+    before, after = stats["bytes_before"], stats["bytes_after"]
+    change = f"{after / before - 1:+.0%}" if before else "n/a"
+    print(f"{'Would convert' if args.dry_run else 'Converted'} {stats['documents']} documents, "
+          f"chatHistory {before / 1024:.1f} KB -> {after / 1024:.1f} KB ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--expand", action="store_true", help="convert compact documents back to plain messages")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="only report the size change")
+    args = parser.parse_args()
+
+    async def run_and_close():
+        try:
+            await run(args)
+        finally:
+            await db_manager.close_connection()
+
+    asyncio.run(run_and_close())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from app.cache import TTLCache
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+logger = logging.getLogger(__name__)
+
+# Rough per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Assumed size of a summary that is not written yet, used to choose how many recent turns fit
+SUMMARY_TOKENS_ESTIMATE = 400
+
+SUMMARY_PREFIX = "Zusammenfassung des bisherigen Gesprächsverlaufs (ältere Nachrichten wurden gekürzt):\n"
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Count prompt tokens with tiktoken if installed, else estimate ~4 characters per token"""
+    total = 0
+    for message in messages:
+        content = message.get("content") or ""
+        total += MESSAGE_OVERHEAD_TOKENS
+        total += len(_encoding.encode(content)) if _encoding else len(content) // 4 + 1
+    return total
+
+
+class ContextWindow:
+    """Token-budgeted message list for long Group B conversations.
+
+    The system prompt and the rewritten first user message are always kept,
+    older turns are folded into a running summary and the turns after the
+    summary are kept verbatim. Summaries are cached by a hash of the folded
+    messages. A request makes no summary call while the latest summary and
+    the turns after it fit the budget. Once they do not, the summary is
+    extended by at least summary_every_turns turns in one call, leaving the
+    most recent turns that fit; between two calls the window may grow past
+    the budget by those turns. If summarizing fails, the turns after the
+    latest summary are sent verbatim, so no context is lost.
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        recent_turns: int,
+        summarize: Callable[[str], Awaitable[str]],
+        summary_every_turns: int = 4,
+        summary_cache_size: int = 1024
+    ):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summarize = summarize
+        self.summary_every_turns = max(1, summary_every_turns)
+        self.summaries = TTLCache(maxsize=summary_cache_size)
+        self.tokens_sent = 0
+        self.tokens_baseline = 0
+        self.requests = 0
+        self.trimmed = 0
+        self.summary_calls = 0
+        self.summary_failures = 0
+
+    @staticmethod
+    def _head_length(messages: List[Dict[str, str]]) -> int:
+        """Number of leading messages up to and including the first user message"""
+        for i, message in enumerate(messages):
+            if message.get("role") == "user":
+                return i + 1
+        return len(messages)
+
+    @staticmethod
+    def _prefix_digests(messages: List[Dict[str, str]]) -> List[str]:
+        """Digest of every prefix of messages, digests[i] covering messages[:i + 1]"""
+        digest = hashlib.sha256()
+        digests = []
+        for message in messages:
+            digest.update(json.dumps([message.get("role"), message.get("content")], ensure_ascii=False).encode("utf-8"))
+            digests.append(digest.copy().hexdigest())
+        return digests
+
+    @staticmethod
+    def _summary_message(summary: str) -> Dict[str, str]:
+        return {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+    def _summary_tokens(self, summary: str) -> int:
+        return estimate_tokens([self._summary_message(summary)])
+
+    def _latest_summary(self, digests: List[str]) -> Tuple[Optional[str], int]:
+        """Summary of the longest summarized prefix and the number of messages it covers"""
+        for i in range(len(digests) - 1, -1, -1):
+            summary = self.summaries.get(digests[i])
+            if summary is not None:
+                return summary, i + 1
+        return None, 0
+
+    async def _extend_summary(self, messages: List[Dict[str, str]], digest: str, previous: Optional[str]) -> Optional[str]:
+        """Summary of previous plus messages, cached under digest, or None if the call fails"""
+        transcript = "\n\n".join(f"{m.get('role')}: {m.get('content')}" for m in messages)
+        if previous:
+            transcript = f"Bisherige Zusammenfassung:\n{previous}\n\nNeue Nachrichten:\n{transcript}"
+        self.summary_calls += 1
+        try:
+            summary = await self.summarize(transcript)
+        except Exception as e:
+            self.summary_failures += 1
+            logger.warning(f"Failed to summarize {len(messages)} folded messages, sending them verbatim: {e}")
+            return None
+        self.summaries.set(digest, summary)
+        return summary
+
+    async def build(self, messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], dict]:
+        """Return the messages to send and the prompt token accounting for this request"""
+        baseline = estimate_tokens(messages)
+        window = messages
+        summarized = False
+
+        if self.token_budget and baseline > self.token_budget:
+            head_length = self._head_length(messages)
+            head, rest = messages[:head_length], messages[head_length:]
+            head_tokens = estimate_tokens(head)
+            digests = self._prefix_digests(rest)
+            summary, covered = self._latest_summary(digests)
+            if summary is None or head_tokens + self._summary_tokens(summary) + estimate_tokens(rest[covered:]) > self.token_budget:
+                # Keep the most recent turns that fit next to a summary, or a single one if none do
+                recent = rest[-2:]
+                for turns in range(self.recent_turns, 0, -1):
+                    recent = rest[-2 * turns:]
+                    if head_tokens + SUMMARY_TOKENS_ESTIMATE + estimate_tokens(recent) <= self.token_budget:
+                        break
+                folded = len(rest) - len(recent)
+                # Summarize in chunks, not on every turn
+                if folded - covered >= 2 * self.summary_every_turns:
+                    summarized = True
+                    extended = await self._extend_summary(rest[covered:folded], digests[folded - 1], summary)
+                    if extended is not None:
+                        summary, covered = extended, folded
+            if summary is not None:
+                window = head + [self._summary_message(summary)] + rest[covered:]
+
+        sent = estimate_tokens(window) if window is not messages else baseline
+        self.requests += 1
+        self.trimmed += window is not messages
+        self.tokens_sent += sent
+        self.tokens_baseline += baseline
+        accounting = {
+            "prompt_tokens_sent": sent,
+            "prompt_tokens_baseline": baseline,
+            "messages_sent": len(window),
+            "messages_baseline": len(messages),
+            "summarized": summarized
+        }
+        if window is not messages:
+            logger.info(f"Group B context trimmed: {accounting}")
+        return window, accounting
+
+    def stats(self) -> dict:
+        return {
+            "token_budget": self.token_budget,
+            "requests": self.requests,
+            "trimmed": self.trimmed,
+            "summary_calls": self.summary_calls,
+            "summary_failures": self.summary_failures,
+            "prompt_tokens_sent": self.tokens_sent,
+            "prompt_tokens_baseline": self.tokens_baseline,
+            "summaries": self.summaries.stats()
+        }
@@ -1,9 +1,13 @@
 import os
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import bson
+from pymongo import AsyncMongoClient, UpdateOne, uri_parser
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from app.cache import TTLCache
+from app.chat_storage import chat_codec
+from app.metrics import observe_mongo_payload, timed_mongo
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,47 +16,159 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Fields read by the /stats aggregation, indexed together so the aggregation is covered
+STATS_INDEX = [
+    ("group", 1), ("thesisId", 1), ("run", 1),
+    ("initialPosition", 1), ("finalPosition", 1),
+    ("initialInformation", 1), ("finalInformation", 1),
+    ("chatTimeSeconds", 1)
+]
+
+# One submission per participant, thesis and run
+SUBMISSION_KEY = [("prolificPid", 1), ("thesisId", 1), ("run", 1)]
+
+# Pool and timeout options of the client, the environment variables that set them and their defaults.
+# An option set in MONGODB_URI is only overridden by its environment variable, never by the default
+CLIENT_OPTIONS = {
+    "maxPoolSize": ("MONGODB_MAX_POOL_SIZE", 50),
+    "minPoolSize": ("MONGODB_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": ("MONGODB_MAX_IDLE_TIME_MS", 300000),
+    "serverSelectionTimeoutMS": ("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000),
+    "connectTimeoutMS": ("MONGODB_CONNECT_TIMEOUT_MS", 5000),
+    "socketTimeoutMS": ("MONGODB_SOCKET_TIMEOUT_MS", 20000),
+    "waitQueueTimeoutMS": ("MONGODB_WAIT_QUEUE_TIMEOUT_MS", 5000)
+}
+
+def _uri_options(mongodb_uri):
+    """Lower-cased names of the options in the query string of a connection string"""
+    # Only the query string is parsed, parse_uri would resolve the DNS records of mongodb+srv URIs on import.
+    # Pool and timeout options cannot come from the SRV TXT record
+    query = mongodb_uri.partition("?")[2]
+    if not query:
+        return set()
+    try:
+        return {option.lower() for option in uri_parser.split_options(query, validate=False)}
+    except Exception as e:
+        logger.warning(f"Could not parse the options of MONGODB_URI: {e}")
+        return set()
+
+def _client_options(mongodb_uri):
+    """Client keyword arguments: options set in the environment, and defaults for options the URI leaves out"""
+    in_uri = _uri_options(mongodb_uri)
+    options = {}
+    for option, (name, default) in CLIENT_OPTIONS.items():
+        if os.getenv(name):
+            options[option] = int(os.environ[name])
+        elif option.lower() not in in_uri:
+            options[option] = default
+    return options
+
+def _winning_stages(node, in_winning_plan=False):
+    """Every plan stage below a winningPlan in an explain() result"""
+    stages = set()
+    if isinstance(node, dict):
+        if in_winning_plan and isinstance(node.get("stage"), str):
+            stages.add(node["stage"])
+        for key, value in node.items():
+            stages |= _winning_stages(value, in_winning_plan or key == "winningPlan")
+    elif isinstance(node, list):
+        for value in node:
+            stages |= _winning_stages(value, in_winning_plan)
+    return stages
+
 class DatabaseManager:
-    def __init__(self):
-        self.client = None
+    def __init__(self, client=None):
+        # An already configured client (e.g. an in-memory stand-in) can be injected
+        self.client = client
         self.db = None
         self.collection = None
+        self.sessions = None
+        self.responses = None
+        self.precomputed = None
+        self.chat_blocks = None
+        # Ids of chat_blocks documents written by this process
+        self.stored_blocks = set()
+        # Latest (count, createdAt) of the collection and /stats rollups, reset on every local write
+        self.version_cache = TTLCache(maxsize=1, ttl=float(os.getenv("EXPORT_VERSION_TTL_SECONDS", "30")))
+        self.stats_cache = TTLCache(maxsize=1, ttl=float(os.getenv("STATS_CACHE_SECONDS", "10")))
         self.connect()
     
     def connect(self):
-        """Connect to MongoDB using environment variable"""
+        """Create the pooled async MongoDB client using environment variables"""
         try:
-            # Get MongoDB connection string from environment variable
-            mongodb_uri = os.getenv("MONGODB_URI")
-            if not mongodb_uri:
-                raise ValueError("MONGODB_URI environment variable is required")
-            
-            # Connect to MongoDB
-            self.client = MongoClient(mongodb_uri)
-            
-            # Test the connection
-            self.client.admin.command('ping')
-            logger.info("Successfully connected to MongoDB")
+            if self.client is None:
+                # Get MongoDB connection string from environment variable
+                mongodb_uri = os.getenv("MONGODB_URI")
+                if not mongodb_uri:
+                    # The app still starts (static files, health endpoints), readiness reports the missing URI
+                    logger.error("MONGODB_URI environment variable is not set, database operations will fail")
+                    return
+                
+                # Connections are opened lazily by the pool. Keyword arguments override the
+                # URI, so defaults are only passed for options it does not set
+                self.client = AsyncMongoClient(mongodb_uri, **_client_options(mongodb_uri))
             
             # Select database and collection
             self.db = self.client["thesis_study"]
             self.collection = self.db["study_responses"]
-            
-        except ConnectionFailure as e:
-            logger.error(f"Failed to connect to MongoDB: {e}")
-            raise
+            self.sessions = self.db["chat_sessions"]
+            self.responses = self.db["response_cache"]
+            self.precomputed = self.db["precomputed_replies"]
+            self.chat_blocks = self.db["chat_blocks"]
+        
         except Exception as e:
             logger.error(f"Database connection error: {e}")
             raise
     
-    def save_study_data(self, study_data):
+    async def ping(self):
+        """Test the connection to MongoDB"""
+        if self.client is None:
+            raise ConnectionFailure("MONGODB_URI environment variable is required")
+        try:
+            await self.client.admin.command('ping')
+            logger.debug("Successfully connected to MongoDB")
+        except ConnectionFailure as e:
+            logger.error(f"Failed to connect to MongoDB: {e}")
+            raise
+    
+    def _invalidate_caches(self):
+        self.version_cache.clear()
+        self.stats_cache.clear()
+    
+    async def _encode_chat_histories(self, documents):
+        """Apply the compact chatHistory encoding, storing referenced PRO/KONTRA blocks first"""
+        blocks = {}
+        for document in documents:
+            for block in chat_codec.encode(document):
+                blocks[block["_id"]] = block
+        new_blocks = [block for key, block in blocks.items() if key not in self.stored_blocks]
+        if new_blocks:
+            await self.chat_blocks.bulk_write(
+                [UpdateOne({"_id": block["_id"]}, {"$set": {"thesisId": block["thesisId"], "text": block["text"]}}, upsert=True) for block in new_blocks],
+                ordered=False
+            )
+            self.stored_blocks.update(block["_id"] for block in new_blocks)
+    
+    async def _decode_chat_history(self, document):
+        """Plain chatHistory of a stored document, whichever format it was written in"""
+        missing = chat_codec.missing_blocks(document)
+        if missing:
+            async for block in self.chat_blocks.find({"_id": {"$in": list(missing)}}):
+                chat_codec.blocks[block["_id"]] = block["text"]
+        return chat_codec.decode(document)
+    
+    @timed_mongo("insert_one")
+    async def save_study_data(self, study_data):
         """Save study data to MongoDB"""
         try:
             # Add timestamp for when record was created
             study_data["createdAt"] = datetime.utcnow()
+            await self._encode_chat_histories([study_data])
+            observe_mongo_payload("insert_one", [study_data])
             
             # Insert the document
-            result = self.collection.insert_one(study_data)
+            result = await self.collection.insert_one(study_data)
+            self._invalidate_caches()
             logger.info(f"Study data saved with ID: {result.inserted_id}")
             
             return {
@@ -60,39 +176,381 @@ class DatabaseManager:
                 "message": "Study data saved successfully",
                 "document_id": str(result.inserted_id)
             }
-            
+        
+        except DuplicateKeyError:
+            # Double submit of the same participant, thesis and run, the first one is kept
+            logger.warning(f"Ignored duplicate study submission from {study_data.get('prolificPid')}")
+            return {
+                "success": True,
+                "message": "Study data was already submitted"
+            }
+        
         except Exception as e:
             logger.error(f"Failed to save study data: {e}")
             return {
                 "error": f"Failed to save study data: {str(e)}"
             }
     
-    def get_all_study_data(self):
+    @timed_mongo("insert_many")
+    async def save_many(self, documents):
+        """Insert a batch of study documents, skipping ones that are already stored"""
+        # Stamp records when they reach MongoDB, so incremental exports never skip a late flush
+        created_at = datetime.utcnow()
+        for document in documents:
+            document["createdAt"] = created_at
+        await self._encode_chat_histories(documents)
+        observe_mongo_payload("insert_many", documents)
+        try:
+            result = await self.collection.insert_many(documents, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            # Duplicate key errors mean the record was saved before, e.g. by a replayed spool,
+            # or the participant already submitted this thesis and run
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            inserted = e.details.get("nInserted", 0)
+            logger.warning(f"Skipped {len(errors)} already stored study documents")
+        self._invalidate_caches()
+        logger.info(f"Saved batch of {inserted} study documents")
+        return inserted
+    
+    @timed_mongo("find_all")
+    async def get_all_study_data(self):
         """Retrieve all study data from MongoDB"""
         try:
             # Get all documents, excluding the MongoDB _id field
             cursor = self.collection.find({}, {"_id": 0, "createdAt": 0})
-            data = list(cursor)
+            data = [await self._decode_chat_history(document) for document in await cursor.to_list()]
             logger.info(f"Retrieved {len(data)} study records")
             return data
-            
+        
         except Exception as e:
             logger.error(f"Failed to retrieve study data: {e}")
             raise
     
-    def get_study_count(self):
+    @staticmethod
+    def _export_filter(after=None, until=None):
+        """Filter on the (createdAt, _id) export order, after is exclusive and until inclusive"""
+        clauses = []
+        if after:
+            created_at, document_id = after
+            if document_id is None:
+                clauses.append({"createdAt": {"$gt": created_at}})
+            else:
+                clauses.append({"$or": [
+                    {"createdAt": {"$gt": created_at}},
+                    {"createdAt": created_at, "_id": {"$gt": document_id}}
+                ]})
+        if until:
+            created_at, document_id = until
+            clauses.append({"$or": [
+                {"createdAt": {"$lt": created_at}},
+                {"createdAt": created_at, "_id": {"$lte": document_id}}
+            ]})
+        return {"$and": clauses} if clauses else {}
+    
+    async def iter_study_data(self, batch_size=500, include_id=False, after=None, until=None):
+        """Yield study records one at a time, fetching them from MongoDB in batches.
+        
+        after and until are (createdAt, _id) positions bounding an incremental export.
+        """
+        try:
+            projection = {"createdAt": 0} if include_id else {"_id": 0, "createdAt": 0}
+            cursor = self.collection.find(self._export_filter(after, until), projection).batch_size(batch_size)
+            if after or until:
+                cursor = cursor.sort([("createdAt", 1), ("_id", 1)])
+            count = 0
+            async for document in cursor:
+                count += 1
+                yield await self._decode_chat_history(document)
+            logger.info(f"Streamed {count} study records")
+        
+        except Exception as e:
+            logger.error(f"Failed to stream study data: {e}")
+            raise
+    
+    @timed_mongo("export_watermark")
+    async def get_export_watermark(self, settle_seconds=5):
+        """Position of the newest record older than settle_seconds, or None if there is none"""
+        cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+        document = await self.collection.find_one(
+            {"createdAt": {"$lte": cutoff}},
+            {"createdAt": 1},
+            sort=[("createdAt", -1), ("_id", -1)]
+        )
+        return (document["createdAt"], document["_id"]) if document else None
+    
+    @timed_mongo("collection_version")
+    async def get_collection_version(self):
+        """Record count and latest createdAt, cached until the next local write"""
+        version = self.version_cache.get("version")
+        if version is None:
+            count = await self.collection.count_documents({})
+            latest = await self.collection.find_one({}, {"createdAt": 1}, sort=[("createdAt", -1)])
+            version = (count, latest["createdAt"] if latest else None)
+            self.version_cache.set("version", version)
+        return version
+    
+    async def ensure_indexes(self):
+        """Create the indexes used by exports, /stats and submissions (no-op if they exist)"""
+        indexes = [
+            # Incremental export order and createdAt lookups
+            ([("createdAt", 1), ("_id", 1)], {}),
+            # Covers the /stats aggregation so it never reads full documents, and group filters
+            (STATS_INDEX, {}),
+            # Rejects double submits, and serves prolificPid lookups
+            (SUBMISSION_KEY, {"unique": True}),
+            ([("thesisId", 1)], {})
+        ]
+        for keys, options in indexes:
+            try:
+                await self.collection.create_index(keys, **options)
+            except Exception as e:
+                # e.g. the unique index while duplicate submissions are still stored
+                logger.error(f"Failed to create index {keys}: {e}")
+    
+    def _hot_queries(self):
+        """Explain commands for the queries that must be served by an index"""
+        name = self.collection.name
+        now = datetime.utcnow()
+        return {
+            "incremental export": {"find": name, "filter": self._export_filter(after=(now, None)), "sort": {"createdAt": 1, "_id": 1}},
+            "export watermark": {"find": name, "filter": {"createdAt": {"$lte": now}}, "sort": {"createdAt": -1, "_id": -1}, "limit": 1},
+            "stats": {"aggregate": name, "pipeline": self._stats_pipeline(), "cursor": {}},
+            "duplicate submission": {"find": name, "filter": {"prolificPid": "", "thesisId": 0, "run": 0}},
+            "participant": {"find": name, "filter": {"prolificPid": ""}},
+            "group": {"find": name, "filter": {"group": "A"}},
+            "thesis": {"find": name, "filter": {"thesisId": 0}}
+        }
+    
+    async def check_query_plans(self):
+        """Log a warning for every hot query whose winning plan is a collection scan"""
+        scans = []
+        for query, command in self._hot_queries().items():
+            try:
+                plan = await self.db.command({"explain": command, "verbosity": "queryPlanner"})
+            except Exception as e:
+                logger.warning(f"Could not explain {query} query: {e}")
+                continue
+            if "COLLSCAN" in _winning_stages(plan):
+                logger.warning(f"The {query} query falls back to a collection scan, check the indexes on {self.collection.name}")
+                scans.append(query)
+        return scans
+    
+    @staticmethod
+    def _stats_pipeline():
+        """Aggregation behind /stats"""
+        def rollup(key):
+            return [
+                {"$group": {
+                    "_id": key,
+                    "count": {"$sum": 1},
+                    "meanPositionShift": {"$avg": {"$subtract": ["$finalPosition", "$initialPosition"]}},
+                    "meanInformationShift": {"$avg": {"$subtract": ["$finalInformation", "$initialInformation"]}},
+                    "avgChatTimeSeconds": {"$avg": "$chatTimeSeconds"}
+                }},
+                {"$sort": {"_id": 1}}
+            ]
+        
+        return [
+            # Sorting on the index prefix and projecting only indexed fields makes this a covered index scan
+            {"$sort": {"group": 1, "thesisId": 1, "run": 1}},
+            {"$project": {"_id": 0, **{field: 1 for field, _ in STATS_INDEX}}},
+            {"$facet": {
+                "total": rollup(None),
+                "byGroup": rollup("$group"),
+                "byThesis": rollup("$thesisId"),
+                "byRun": rollup("$run"),
+                "byGroupAndThesis": rollup({"group": "$group", "thesisId": "$thesisId"})
+            }}
+        ]
+    
+    @timed_mongo("stats_aggregate")
+    async def get_study_stats(self):
+        """Per-group, per-thesis and per-run rollups computed by a MongoDB aggregation"""
+        stats = self.stats_cache.get("stats")
+        if stats is not None:
+            return stats
+        
+        cursor = await self.collection.aggregate(self._stats_pipeline())
+        facets = (await cursor.to_list())[0]
+        
+        names = {"byGroup": "group", "byThesis": "thesisId", "byRun": "run"}
+        stats = {"total": {"count": 0}}
+        for facet, rows in facets.items():
+            for row in rows:
+                key = row.pop("_id")
+                if facet == "byGroupAndThesis":
+                    row.update(key)
+                elif facet in names:
+                    row[names[facet]] = key
+            if facet == "total":
+                stats["total"] = rows[0] if rows else {"count": 0}
+            else:
+                stats[facet] = rows
+        
+        self.stats_cache.set("stats", stats)
+        return stats
+    
+    @timed_mongo("count")
+    async def get_study_count(self):
         """Get the total number of study responses"""
         try:
-            count = self.collection.count_documents({})
+            count = await self.collection.count_documents({})
             return count
         except Exception as e:
             logger.error(f"Failed to get study count: {e}")
             return 0
     
-    def close_connection(self):
+    @timed_mongo("save_session")
+    async def save_session(self, session_id, owner, messages):
+        """Upsert the owner and message list of a chat session"""
+        try:
+            await self.sessions.update_one(
+                {"_id": session_id},
+                {"$set": {"owner": owner, "messages": messages, "updatedAt": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to save chat session {session_id}: {e}")
+    
+    @timed_mongo("get_session")
+    async def get_session(self, session_id):
+        """Get the owner and message list of a chat session, or None if unknown"""
+        try:
+            document = await self.sessions.find_one({"_id": session_id}, {"owner": 1, "messages": 1})
+            return (document.get("owner"), document["messages"]) if document else None
+        except Exception as e:
+            logger.error(f"Failed to load chat session {session_id}: {e}")
+            return None
+    
+    async def ensure_session_ttl(self, ttl_seconds):
+        """Let MongoDB expire chat sessions that were idle for ttl_seconds"""
+        try:
+            await self.sessions.create_index("updatedAt", expireAfterSeconds=int(ttl_seconds))
+        except Exception as e:
+            logger.error(f"Failed to create chat session TTL index: {e}")
+    
+    @timed_mongo("save_cached_response")
+    async def save_cached_response(self, key, content):
+        """Store a cached model reply under its prompt hash"""
+        try:
+            await self.responses.update_one(
+                {"_id": key},
+                {"$set": {"content": content, "updatedAt": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to save cached response {key}: {e}")
+    
+    @timed_mongo("get_cached_response")
+    async def get_cached_response(self, key):
+        """Get a cached model reply, or None if unknown"""
+        try:
+            document = await self.responses.find_one({"_id": key}, {"content": 1})
+            return document["content"] if document else None
+        except Exception as e:
+            logger.error(f"Failed to load cached response {key}: {e}")
+            return None
+    
+    async def ensure_response_cache_ttl(self, ttl_seconds):
+        """Let MongoDB expire cached replies ttl_seconds after they were stored"""
+        try:
+            await self.responses.create_index("updatedAt", expireAfterSeconds=int(ttl_seconds))
+        except Exception as e:
+            logger.error(f"Failed to create response cache TTL index: {e}")
+    
+    @timed_mongo("save_precomputed_replies")
+    async def save_precomputed_replies(self, documents):
+        """Upsert pre-generated first replies, keyed by their prompt hash in _id"""
+        if not documents:
+            return 0
+        now = datetime.utcnow()
+        observe_mongo_payload("bulk_write", documents)
+        requests = []
+        for document in documents:
+            fields = {key: value for key, value in document.items() if key != "_id"}
+            requests.append(UpdateOne({"_id": document["_id"]}, {"$set": {**fields, "createdAt": now}}, upsert=True))
+        result = await self.precomputed.bulk_write(requests, ordered=False)
+        return result.upserted_count + result.modified_count
+    
+    @timed_mongo("get_precomputed_reply")
+    async def get_precomputed_reply(self, key):
+        """Get a pre-generated first reply, or None if unknown"""
+        try:
+            document = await self.precomputed.find_one({"_id": key}, {"content": 1})
+            return document["content"] if document else None
+        except Exception as e:
+            logger.error(f"Failed to load precomputed reply {key}: {e}")
+            return None
+    
+    @timed_mongo("get_precomputed_keys")
+    async def get_precomputed_keys(self, keys):
+        """The subset of keys that already have a pre-generated reply"""
+        cursor = self.precomputed.find({"_id": {"$in": list(keys)}}, {"_id": 1})
+        return {document["_id"] async for document in cursor}
+    
+    async def iter_precomputed_replies(self, limit=0, batch_size=1000):
+        """Yield (key, content) of stored pre-generated replies"""
+        cursor = self.precomputed.find({}, {"content": 1}, limit=limit).batch_size(batch_size)
+        async for document in cursor:
+            yield document["_id"], document["content"]
+    
+    async def rewrite_chat_histories(self, compact=True, batch_size=500, dry_run=False):
+        """Convert stored chatHistory fields to the compact encoding, or back to plain messages.
+        
+        Returns the number of converted documents and the BSON size of their
+        chatHistory before and after. With dry_run nothing is written.
+        """
+        stats = {"documents": 0, "bytes_before": 0, "bytes_after": 0}
+        query = {"chatHistoryFormat": {"$exists": not compact}}
+        cursor = self.collection.find(query, {"thesisId": 1, "chatHistory": 1, "chatHistoryFormat": 1}).batch_size(batch_size)
+        
+        async def convert(batch):
+            stats["bytes_before"] += sum(len(bson.encode({"chatHistory": document.get("chatHistory") or []})) for document in batch)
+            if not compact:
+                batch = [await self._decode_chat_history(document) for document in batch]
+            elif dry_run:
+                for document in batch:
+                    chat_codec.encode(document)
+            else:
+                await self._encode_chat_histories(batch)
+            stats["documents"] += len(batch)
+            stats["bytes_after"] += sum(len(bson.encode({"chatHistory": document.get("chatHistory") or []})) for document in batch)
+            if dry_run:
+                return
+            if compact:
+                # The format condition keeps a concurrent run from encoding a document twice
+                requests = [
+                    UpdateOne({"_id": document["_id"], "chatHistoryFormat": {"$exists": False}},
+                              {"$set": {"chatHistory": document["chatHistory"], "chatHistoryFormat": document["chatHistoryFormat"]}})
+                    for document in batch if "chatHistoryFormat" in document
+                ]
+            else:
+                requests = [
+                    UpdateOne({"_id": document["_id"]}, {"$set": {"chatHistory": document["chatHistory"]}, "$unset": {"chatHistoryFormat": ""}})
+                    for document in batch
+                ]
+            if requests:
+                await self.collection.bulk_write(requests, ordered=False)
+        
+        batch = []
+        async for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                await convert(batch)
+                batch = []
+        if batch:
+            await convert(batch)
+        if stats["documents"] and not dry_run:
+            self._invalidate_caches()
+        return stats
+    
+    async def close_connection(self):
         """Close the MongoDB connection"""
         if self.client:
-            self.client.close()
+            await self.client.close()
             logger.info("MongoDB connection closed")
 
 # Global database manager instance
@@ -0,0 +1,278 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+from typing import AsyncIterable, AsyncIterator
+from bson import ObjectId
+
+# Define CSV headers
+CSV_HEADERS = [
+    'prolificPid', 'group', 'thesisId', 'thesisTitle', 'thesisText', 'run',
+    'initialPosition', 'initialInformation', 'initialStatement',
+    'finalPosition', 'finalInformation',
+    'totalTimeSeconds', 'chatTimeSeconds',
+    'iframeOpen', 'chatStart', 'chatEnd', 'completion',
+    'chatHistoryLength', 'chatHistoryJSON'
+]
+
+# Flush the CSV buffer to the response once it holds this many characters
+CHUNK_SIZE = 64 * 1024
+
+
+def format_timestamp(ts):
+    """Convert a millisecond timestamp to readable format"""
+    if ts:
+        try:
+            return datetime.fromtimestamp(ts / 1000).strftime('%Y-%m-%d %H:%M:%S')
+        except:
+            return str(ts)
+    return ''
+
+
+def encode_cursor(position) -> str:
+    """Opaque resume token for a (createdAt, _id) export position"""
+    created_at, document_id = position
+    payload = json.dumps({"t": created_at.isoformat(), "id": str(document_id) if document_id else None})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return datetime.fromisoformat(payload["t"]), ObjectId(payload["id"]) if payload["id"] else None
+    except Exception:
+        raise ValueError(f"Invalid export cursor: {token}")
+
+
+def parse_since(value: str) -> datetime:
+    """Parse an ISO 8601 watermark into the naive UTC datetimes MongoDB returns"""
+    try:
+        since = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid since timestamp: {value}")
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def record_to_row(record: dict) -> dict:
+    """Flatten a study record into a CSV row"""
+    # Flatten timestamps
+    timestamps = record.get('timestamps', {})
+
+    # Process chat history with proper UTF-8 encoding
+    chat_history = record.get('chatHistory', [])
+    chat_history_json = json.dumps(chat_history, ensure_ascii=False) if chat_history else ""
+
+    return {
+        'prolificPid': record.get('prolificPid', ''),
+        'group': record.get('group', ''),
+        'thesisId': record.get('thesisId', ''),
+        'thesisTitle': record.get('thesisTitle', ''),
+        'thesisText': record.get('thesisText', ''),
+        'run': record.get('run', ''),
+        'initialPosition': record.get('initialPosition', ''),
+        'initialInformation': record.get('initialInformation', ''),
+        'initialStatement': record.get('initialStatement', ''),
+        'finalPosition': record.get('finalPosition', ''),
+        'finalInformation': record.get('finalInformation', ''),
+        'totalTimeSeconds': record.get('totalTimeSeconds', ''),
+        'chatTimeSeconds': record.get('chatTimeSeconds', ''),
+        'iframeOpen': format_timestamp(timestamps.get('iframeOpen')),
+        'chatStart': format_timestamp(timestamps.get('chatStart')),
+        'chatEnd': format_timestamp(timestamps.get('chatEnd')),
+        'completion': format_timestamp(timestamps.get('completion')),
+        'chatHistoryLength': len(chat_history),
+        'chatHistoryJSON': chat_history_json
+    }
+
+
+async def iter_csv(records: AsyncIterable[dict]) -> AsyncIterator[bytes]:
+    """Encode study records as UTF-8 CSV chunks, holding at most one chunk in memory"""
+    buffer = io.StringIO()
+    # Add BOM for UTF-8 to ensure proper encoding in Excel and other applications
+    buffer.write('\ufeff')
+    writer = csv.DictWriter(buffer, fieldnames=CSV_HEADERS)
+    writer.writeheader()
+
+    async for record in records:
+        writer.writerow(record_to_row(record))
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+# Columnar export (Parquet / Arrow IPC) needs the optional pyarrow package
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+# Records per Arrow record batch
+RECORD_BATCH_SIZE = 1000
+
+COLUMNAR_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+TIMESTAMP_FIELDS = ['iframeOpen', 'chatStart', 'chatEnd', 'completion']
+
+if pa is not None:
+    RECORD_SCHEMA = pa.schema([
+        ('recordId', pa.string()),
+        ('prolificPid', pa.string()),
+        ('group', pa.string()),
+        ('thesisId', pa.int64()),
+        ('thesisTitle', pa.string()),
+        ('thesisText', pa.string()),
+        ('run', pa.int64()),
+        ('initialPosition', pa.int64()),
+        ('initialInformation', pa.int64()),
+        ('initialStatement', pa.string()),
+        ('finalPosition', pa.int64()),
+        ('finalInformation', pa.int64()),
+        ('totalTimeSeconds', pa.float64()),
+        ('chatTimeSeconds', pa.float64()),
+        *[(field, pa.timestamp('ms')) for field in TIMESTAMP_FIELDS],
+        ('chatHistoryLength', pa.int32()),
+    ])
+
+    CHAT_TURN_SCHEMA = pa.schema([
+        ('recordId', pa.string()),
+        ('turnIndex', pa.int32()),
+        ('role', pa.string()),
+        ('content', pa.string()),
+        ('model', pa.string()),
+    ])
+
+
+def _number(value, cast):
+    try:
+        return cast(value) if value is not None and value != '' else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+class _TableWriter:
+    """Buffers rows of one table and writes them as Arrow record batches"""
+
+    def __init__(self, sink, schema, file_format):
+        self.schema = schema
+        self.columns = {name: [] for name in schema.names}
+        if file_format == "parquet":
+            self.writer = pa.parquet.ParquetWriter(sink, schema, compression="zstd")
+        else:
+            self.writer = pa.ipc.new_file(sink, schema)
+
+    def append(self, row: dict) -> None:
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+
+    def __len__(self) -> int:
+        return len(self.columns['recordId'])
+
+    def flush(self) -> None:
+        if len(self):
+            self.writer.write_batch(pa.RecordBatch.from_pydict(self.columns, schema=self.schema))
+            for values in self.columns.values():
+                values.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+
+async def write_columnar(records: AsyncIterable[dict], records_sink, turns_sink, file_format: str) -> None:
+    """Write study records and their normalized chat turns as two typed tables.
+
+    Rows are converted in record batches, so memory stays bounded by
+    RECORD_BATCH_SIZE records regardless of the collection size.
+    """
+    record_table = _TableWriter(records_sink, RECORD_SCHEMA, file_format)
+    turn_table = _TableWriter(turns_sink, CHAT_TURN_SCHEMA, file_format)
+
+    async for record in records:
+        record_id = str(record.get('_id', ''))
+        timestamps = record.get('timestamps') or {}
+        chat_history = record.get('chatHistory') or []
+        row = {
+            'recordId': record_id,
+            'prolificPid': _text(record.get('prolificPid')),
+            'group': _text(record.get('group')),
+            'thesisId': _number(record.get('thesisId'), int),
+            'thesisTitle': _text(record.get('thesisTitle')),
+            'thesisText': _text(record.get('thesisText')),
+            'run': _number(record.get('run'), int),
+            'initialPosition': _number(record.get('initialPosition'), int),
+            'initialInformation': _number(record.get('initialInformation'), int),
+            'initialStatement': _text(record.get('initialStatement')),
+            'finalPosition': _number(record.get('finalPosition'), int),
+            'finalInformation': _number(record.get('finalInformation'), int),
+            'totalTimeSeconds': _number(record.get('totalTimeSeconds'), float),
+            'chatTimeSeconds': _number(record.get('chatTimeSeconds'), float),
+            'chatHistoryLength': len(chat_history),
+        }
+        # Timestamps stay native epoch milliseconds
+        for field in TIMESTAMP_FIELDS:
+            row[field] = _number(timestamps.get(field), int)
+        record_table.append(row)
+
+        for index, message in enumerate(chat_history):
+            turn_table.append({
+                'recordId': record_id,
+                'turnIndex': index,
+                'role': _text(message.get('role')),
+                'content': _text(message.get('content')),
+                'model': _text(message.get('model')),
+            })
+
+        if len(record_table) >= RECORD_BATCH_SIZE:
+            record_table.flush()
+        if len(turn_table) >= RECORD_BATCH_SIZE:
+            turn_table.flush()
+
+    record_table.close()
+    turn_table.close()
+
+
+def _zip_tables(archive, tables) -> None:
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_STORED) as zf:
+        for name, table_file in tables:
+            table_file.seek(0)
+            with zf.open(name, "w", force_zip64=True) as entry:
+                shutil.copyfileobj(table_file, entry, CHUNK_SIZE)
+
+
+async def build_columnar_archive(records: AsyncIterable[dict], file_format: str):
+    """Write both tables to temporary files and bundle them as an uncompressed zip"""
+    extension = COLUMNAR_FORMATS[file_format]
+    archive = tempfile.TemporaryFile()
+    with tempfile.TemporaryFile() as records_file, tempfile.TemporaryFile() as turns_file:
+        await write_columnar(records, records_file, turns_file, file_format)
+        await asyncio.to_thread(_zip_tables, archive, [
+            (f"study_records{extension}", records_file),
+            (f"chat_turns{extension}", turns_file),
+        ])
+    archive.seek(0)
+    return archive
+
+
+async def iter_file(file) -> AsyncIterator[bytes]:
+    """Stream a temporary file in chunks and close it afterwards"""
+    try:
+        while chunk := await asyncio.to_thread(file.read, CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
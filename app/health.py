@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from app.metrics import BACKEND_UP
+
+logger = logging.getLogger(__name__)
+
+
+class Check:
+    """Last known state of one backend"""
+
+    __slots__ = ("name", "probe", "required", "healthy", "error", "latency", "checked_at", "warm_up", "warmed_up")
+
+    def __init__(self, name: str, probe: Callable[[], Awaitable[None]], required: bool):
+        self.name = name
+        self.probe = probe
+        self.required = required
+        self.healthy = False
+        self.error: Optional[str] = "not checked yet"
+        self.latency: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        # Run once, after the first successful probe
+        self.warm_up: List[Callable[[], Awaitable[None]]] = []
+        self.warmed_up = False
+
+
+class HealthMonitor:
+    """Background health checks of MongoDB and OpenAI.
+
+    Startup does not wait for any backend: the monitor probes them in a
+    background task, every retry_interval seconds (doubling up to interval)
+    while one is failing and every interval seconds once all are healthy.
+    Warm-up work such as index creation runs after a backend's first
+    successful probe. The app is ready once every required backend is
+    healthy and warmed up; liveness only means the event loop responds.
+    """
+
+    def __init__(self, interval: float, retry_interval: float, timeout: float):
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self.checks: Dict[str, Check] = {}
+        self.started_at = time.monotonic()
+        self.ready_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._failures = 0
+
+    def register(self, name: str, probe: Callable[[], Awaitable[None]], required: bool = True) -> None:
+        """Add a probe that raises if the backend is unavailable"""
+        self.checks[name] = Check(name, probe, required)
+
+    def on_ready(self, name: str, warm_up: Callable[[], Awaitable[None]]) -> None:
+        """Run warm_up once the named backend is first reachable"""
+        self.checks[name].warm_up.append(warm_up)
+
+    async def _probe(self, check: Check) -> None:
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(check.probe(), timeout=self.timeout)
+            error = None
+        except asyncio.TimeoutError:
+            error = f"no answer within {self.timeout:g}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        check.latency = time.monotonic() - started
+        check.checked_at = time.time()
+
+        if error is None and not check.healthy:
+            logger.info(f"{check.name} is available ({check.latency * 1000:.0f} ms)")
+        elif error is not None and (check.healthy or check.error != error):
+            logger.warning(f"{check.name} is unavailable: {error}")
+        check.healthy, check.error = error is None, error
+        BACKEND_UP.labels(check.name).set(1 if check.healthy else 0)
+
+        if check.healthy and not check.warmed_up:
+            for warm_up in check.warm_up:
+                await warm_up()
+            check.warmed_up = True
+            if check.warm_up:
+                logger.info(f"{check.name} warm-up finished {time.monotonic() - self.started_at:.1f}s after startup")
+
+    async def run_checks(self) -> bool:
+        """Probe every backend concurrently and return readiness"""
+        await asyncio.gather(*(self._probe(check) for check in self.checks.values()))
+        if self.ready and self.ready_at is None:
+            self.ready_at = time.monotonic()
+            logger.info(f"Ready {self.ready_at - self.started_at:.1f}s after startup")
+        return self.ready
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                healthy = await self.run_checks() and all(check.healthy for check in self.checks.values())
+            except Exception as e:
+                logger.error(f"Health check failed: {e}")
+                healthy = False
+            self._failures = 0 if healthy else self._failures + 1
+            delay = self.interval if healthy else min(self.interval, self.retry_interval * 2 ** (self._failures - 1))
+            await asyncio.sleep(delay)
+
+    def start(self) -> None:
+        self.started_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def is_healthy(self, name: str) -> bool:
+        """Last probe result of a backend, True for backends that are not monitored (e.g. in CLI jobs)"""
+        check = self.checks.get(name)
+        return check is None or check.healthy
+
+    @property
+    def ready(self) -> bool:
+        return all(check.healthy and check.warmed_up for check in self.checks.values() if check.required)
+
+    def status(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "starting" if self.ready_at is None else "degraded",
+            "uptime_seconds": time.monotonic() - self.started_at,
+            "ready_after_seconds": self.ready_at - self.started_at if self.ready_at is not None else None,
+            "checks": {
+                check.name: {
+                    "healthy": check.healthy,
+                    "required": check.required,
+                    "warmed_up": check.warmed_up,
+                    "error": check.error,
+                    "latency_ms": check.latency * 1000 if check.latency is not None else None,
+                    "checked_at": check.checked_at
+                }
+                for check in self.checks.values()
+            }
+        }
+
+
+health = HealthMonitor(
+    interval=float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "30")),
+    retry_interval=float(os.getenv("HEALTH_CHECK_RETRY_SECONDS", "1")),
+    timeout=float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", "5"))
+)
@@ -1,49 +1,130 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, model_validator
+from typing import Optional
 import os
-import csv
-import io
-import json
-from datetime import datetime
-from app.api_interface import generate_group_a_response, generate_group_b_response, generate_group_c_response, generate_api_tester_response
-from app.thesis_data import get_thesis_data
+import logging
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from contextlib import asynccontextmanager
+from app.api_interface import (
+    generate_group_a_response, generate_group_b_response, generate_group_c_response, generate_api_tester_response,
+    stream_group_a_response, stream_group_b_response, stream_group_c_response,
+    group_b_initial_messages, generate_group_b_session_response, stream_group_b_session_response, check_openai,
+    context_window
+)
+from app.thesis_catalog import StudyThesisId, ThesisId, thesis_catalog
 from app.database import db_manager
-from wahl_o_maht_thesen import get_thesis_by_id
+from app.session_store import session_store
+from app.response_cache import response_cache
+from app.precomputed import precomputed_replies
+from app.prompts import prompt_registry
+from app.single_flight import single_flight
+from app.admission import AdmissionRejected, PermitStreamingResponse, admission
+from app.call_policy import call_policy
+from app.metrics import CONTENT_TYPE_LATEST, MetricsMiddleware, render as render_metrics
+from app.client_pool import client_pool
+from app.health import health
+from app.static_assets import static_assets
+from app.payloads import ChatHistory, FastJSONResponse, FastJSONRoute, MessageText, Transcript, TranscriptText, dumps
+from app.export import COLUMNAR_FORMATS, build_columnar_archive, decode_cursor, encode_cursor, iter_csv, iter_file, pa, parse_since
+from app.submission_spool import submission_spool
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-# Serve frontend static files
-frontend_dist = os.path.join(os.path.dirname(__file__), "..", "frontend", "dist")
-app.mount("/static", StaticFiles(directory=frontend_dist), name="static")
+# Seconds a record must have been in MongoDB before incremental exports include it
+EXPORT_SETTLE_SECONDS = float(os.getenv("EXPORT_SETTLE_SECONDS", "5"))
 
-@app.get("/")
-def read_root():
-    return FileResponse(os.path.join(frontend_dist, "index.html"))
+health.register("mongodb", db_manager.ping)
+health.register("openai", check_openai)
+# Index setup waits for MongoDB in the background instead of delaying startup
+health.on_ready("mongodb", session_store.ensure_indexes)
+health.on_ready("mongodb", response_cache.ensure_indexes)
+health.on_ready("mongodb", db_manager.ensure_indexes)
+health.on_ready("mongodb", db_manager.check_query_plans)
+health.on_ready("mongodb", precomputed_replies.load)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve static files and health endpoints right away, backends are checked in the background
+    static_assets.load()
+    health.start()
+    thesis_catalog.start()
+    if submission_spool:
+        await submission_spool.start()
+    yield
+    await thesis_catalog.stop()
+    await health.stop()
+    if submission_spool:
+        await submission_spool.stop()
+    await client_pool.aclose()
+    await db_manager.close_connection()
+
+app = FastAPI(lifespan=lifespan)
+# Request bodies of all routes registered below are decoded with orjson
+app.router.route_class = FastJSONRoute
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        {"role": "error", "content": exc.detail},
+        status_code=exc.status_code,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(RequestValidationError)
+async def validation_error(request: Request, exc: RequestValidationError):
+    # The default detail echoes the rejected input. The frontend shows it as an error bubble and re-sends that
+    # bubble with the history, so an echoed oversized message would get every later request rejected as well
+    errors = [{key: value for key, value in error.items() if key != "input"} for error in exc.errors()]
+    return JSONResponse({"detail": jsonable_encoder(errors)}, status_code=422)
+
+# Serve frontend static files from memory
+@app.api_route("/", methods=["GET", "HEAD"])
+async def read_root(request: Request):
+    return static_assets.response(request, "index.html")
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def serve_static(request: Request, path: str):
+    return static_assets.response(request, path, fallback=False)
 
 # Request models
 class StudyStartRequest(BaseModel):
-    thesis_id: int
+    thesis_id: StudyThesisId
     initial_position: int
-    initial_statement: str
+    initial_statement: MessageText
     prolific_pid: Optional[str] = None
+    stream: bool = False
 
 class StudyContinueRequest(BaseModel):
-    thesis_id: int
-    initial_position: int
-    initial_statement: str
-    history: List[dict]
+    # Only needed without session_id, a session keeps the conversation server-side
+    thesis_id: Optional[StudyThesisId] = None
+    initial_position: Optional[int] = None
+    initial_statement: Optional[MessageText] = None
+    history: Optional[ChatHistory] = None
+    session_id: Optional[str] = None
+    message: Optional[MessageText] = None
     prolific_pid: Optional[str] = None
+    stream: bool = False
+
+    @model_validator(mode="after")
+    def require_thesis_without_session(self):
+        if not self.session_id:
+            missing = [name for name in ("thesis_id", "initial_position", "initial_statement") if getattr(self, name) is None]
+            if missing:
+                raise ValueError(f"{', '.join(missing)} required without session_id")
+        return self
 
 class ChatRequest(BaseModel):
-    thesis_id: int
+    thesis_id: ThesisId
     api_key: str
     model: str
     initial_position: int
-    initial_statement: str
-    history: List[dict]
+    initial_statement: MessageText
+    history: ChatHistory
 
 class StudySubmissionRequest(BaseModel):
     prolificPid: str
@@ -54,8 +135,8 @@ class StudySubmissionRequest(BaseModel):
     run: int
     initialPosition: int
     initialInformation: int
-    initialStatement: str
-    chatHistory: List[dict]
+    initialStatement: TranscriptText
+    chatHistory: Transcript
     finalPosition: int
     finalInformation: int
     timestamps: dict
@@ -63,211 +144,390 @@ class StudySubmissionRequest(BaseModel):
     chatTimeSeconds: float = None
 
 
+def event_stream(events, headers=None, permit=None):
+    """Wrap {"role","content"} chunks as server-sent events, holding an admission permit until the response ends"""
+    async def generate():
+        async for event in events:
+            yield f"data: {dumps(event)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    options = dict(media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(headers or {})})
+    if permit is not None:
+        return PermitStreamingResponse(generate(), permit, **options)
+    return StreamingResponse(generate(), **options)
+
+
+async def record_session(events, session_id, owner, messages):
+    """Pass stream events through and store the completed reply in the session"""
+    content = []
+    async for event in events:
+        if event["role"] == "assistant":
+            content.append(event["content"])
+        else:
+            content = None
+        yield event
+    if content:
+        await session_store.put(session_id, owner, messages + [{"role": "assistant", "content": "".join(content)}])
+
+
 # Group A start
-@app.post("/study/group-a/start")
+@app.post("/study/group-a/start", response_class=FastJSONResponse)
 async def study_group_a_start(request: StudyStartRequest):
     # Get thesis data for Thesis ID
-    thesis_data = get_thesis_data(request.thesis_id)
-    if not thesis_data:
-        return {"role": "error", "content": f"Main.py Error: Thesis {request.thesis_id} not found in THESIS_DATA"}
+    thesis = thesis_catalog.get(request.thesis_id)
+    if thesis is None:
+        # Validated by the request model, unless a catalog reload removed it since
+        return {"role": "error", "content": f"Main.py Error: Thesis {request.thesis_id} not found in the thesis catalog"}
     
-    result = generate_group_a_response(
-        thesis_text=thesis_data["thesis_text"],
+    arguments = dict(
+        thesis_text=thesis.text,
         position=request.initial_position,
         user_statement=request.initial_statement,
-        pro_text=thesis_data["pro"],
-        contra_text=thesis_data["contra"],
-        prolific_pid=request.prolific_pid
+        pro_text=thesis.pro,
+        contra_text=thesis.contra,
+        prolific_pid=request.prolific_pid,
+        thesis_id=request.thesis_id
     )
+    if request.stream:
+        permit = await admission.admit(request.prolific_pid)
+        return event_stream(stream_group_a_response(**arguments), permit=permit)
+
+    async with admission.slot(request.prolific_pid):
+        result = await generate_group_a_response(**arguments)
     return result
 
 # Group B start
-@app.post("/study/group-b/start")
+@app.post("/study/group-b/start", response_class=FastJSONResponse)
 async def study_group_b_start(request: StudyStartRequest):
     # Get thesis data for Thesis ID
-    thesis_data = get_thesis_data(request.thesis_id)
-    if not thesis_data:
-        return {"role": "error", "content": f"Main.py Error: Thesis {request.thesis_id} not found in THESIS_DATA"}
+    thesis = thesis_catalog.get(request.thesis_id)
+    if thesis is None:
+        # Validated by the request model, unless a catalog reload removed it since
+        return {"role": "error", "content": f"Main.py Error: Thesis {request.thesis_id} not found in the thesis catalog"}
     
-    result = generate_group_b_response(
-        thesis_text=thesis_data["thesis_text"],
+    arguments = dict(
+        thesis_text=thesis.text,
         position=request.initial_position,
         user_statement=request.initial_statement,
-        pro_text=thesis_data["pro"],
-        contra_text=thesis_data["contra"],
+        pro_text=thesis.pro,
+        contra_text=thesis.contra,
         history=None,
-        prolific_pid=request.prolific_pid
+        prolific_pid=request.prolific_pid,
+        thesis_id=request.thesis_id
     )
+    # Keep the conversation server-side so continue requests only send the new message
+    session_id = session_store.new_session_id()
+    messages = group_b_initial_messages(
+        thesis.text, request.initial_position, request.initial_statement,
+        thesis.pro, thesis.contra, request.thesis_id
+    )
+    if request.stream:
+        permit = await admission.admit(request.prolific_pid)
+        return event_stream(
+            record_session(stream_group_b_response(**arguments), session_id, request.prolific_pid, messages),
+            headers={"X-Session-Id": session_id},
+            permit=permit
+        )
+
+    async with admission.slot(request.prolific_pid):
+        result = await generate_group_b_response(**arguments)
+    if result["role"] == "assistant":
+        await session_store.put(session_id, request.prolific_pid, messages + [{"role": "assistant", "content": result["content"]}])
+        result["session_id"] = session_id
     return result
 
 # Group C start
-@app.post("/study/group-c/start")
+@app.post("/study/group-c/start", response_class=FastJSONResponse)
 async def study_group_c_start(request: StudyStartRequest):
     # Get thesis data for Thesis ID
-    thesis_data = get_thesis_data(request.thesis_id)
-    if not thesis_data:
-        return {"role": "error", "content": f"Main.py Error: Thesis {request.thesis_id} not found in THESIS_DATA"}
+    thesis = thesis_catalog.get(request.thesis_id)
+    if thesis is None:
+        # Validated by the request model, unless a catalog reload removed it since
+        return {"role": "error", "content": f"Main.py Error: Thesis {request.thesis_id} not found in the thesis catalog"}
     
-    result = generate_group_c_response(
-        thesis_text=thesis_data["thesis_text"],
+    arguments = dict(
+        thesis_text=thesis.text,
         position=request.initial_position,
         user_statement=request.initial_statement,
-        pro_text=thesis_data["pro"],
-        contra_text=thesis_data["contra"],
-        prolific_pid=request.prolific_pid
+        pro_text=thesis.pro,
+        contra_text=thesis.contra,
+        prolific_pid=request.prolific_pid,
+        thesis_id=request.thesis_id
     )
+    if request.stream:
+        permit = await admission.admit(request.prolific_pid)
+        return event_stream(stream_group_c_response(**arguments), permit=permit)
+
+    async with admission.slot(request.prolific_pid):
+        result = await generate_group_c_response(**arguments)
     return result
 
 # Group B continue
-@app.post("/study/group-b/continue")
+@app.post("/study/group-b/continue", response_class=FastJSONResponse)
 async def study_group_b_continue(request: StudyContinueRequest):
+    if request.session_id:
+        return await continue_group_b_session(request)
     if not request.history or not isinstance(request.history, list):
         return {"role": "error", "content": "No history provided"}
-    thesis_data = get_thesis_data(request.thesis_id)
-    if not thesis_data:
-        return {"role": "error", "content": f"Main.py Error: Thesis {request.thesis_id} not found in THESIS_DATA"}
-    result = generate_group_b_response(
-        thesis_text=thesis_data["thesis_text"],
+    thesis = thesis_catalog.get(request.thesis_id)
+    if thesis is None:
+        # Validated by the request model, unless a catalog reload removed it since
+        return {"role": "error", "content": f"Main.py Error: Thesis {request.thesis_id} not found in the thesis catalog"}
+    arguments = dict(
+        thesis_text=thesis.text,
         position=request.initial_position,
         user_statement=request.initial_statement,
-        pro_text=thesis_data["pro"],
-        contra_text=thesis_data["contra"],
+        pro_text=thesis.pro,
+        contra_text=thesis.contra,
         history=request.history,
-        prolific_pid=request.prolific_pid
+        prolific_pid=request.prolific_pid,
+        thesis_id=request.thesis_id
     )
+    if request.stream:
+        permit = await admission.admit(request.prolific_pid)
+        return event_stream(stream_group_b_response(**arguments), permit=permit)
+
+    async with admission.slot(request.prolific_pid):
+        result = await generate_group_b_response(**arguments)
+    return result
+
+async def continue_group_b_session(request: StudyContinueRequest):
+    """Append the new user message to the server-side history and reply"""
+    if not request.message:
+        return {"role": "error", "content": "No message provided"}
+    session = await session_store.get(request.session_id)
+    if session is None:
+        return {"role": "error", "content": f"Session {request.session_id} not found or expired"}
+    owner, messages = session
+    if request.prolific_pid != owner:
+        raise HTTPException(status_code=403, detail=f"Session {request.session_id} belongs to another participant")
+    messages.append({"role": "user", "content": request.message})
+
+    # One turn at a time per participant, so a double click does not send the message twice.
+    # Keyed on the stored owner, which the request cannot choose
+    participant = owner or request.session_id
+    if request.stream:
+        permit = await admission.admit(participant)
+        return event_stream(
+            record_session(stream_group_b_session_response(messages, owner), request.session_id, owner, messages),
+            headers={"X-Session-Id": request.session_id},
+            permit=permit
+        )
+
+    async with admission.slot(participant):
+        result = await generate_group_b_session_response(messages, owner)
+    if result["role"] == "assistant":
+        await session_store.put(request.session_id, owner, messages + [{"role": "assistant", "content": result["content"]}])
+        result["session_id"] = request.session_id
     return result
 
 # Study data submission
-@app.post("/study/submit")
+@app.post("/study/submit", response_class=FastJSONResponse)
 async def submit_study_data(request: StudySubmissionRequest):
     try:
         # Convert request to dict
         study_data = request.dict()
         
+        # Acknowledge once spooled to disk, the spool flushes to MongoDB in batches.
+        # No document id: a double submit is only recognized at flush time, so the spooled id may never exist
+        if submission_spool:
+            try:
+                await submission_spool.append(study_data)
+                return {
+                    "success": True,
+                    "message": "Study data saved successfully"
+                }
+            except OSError as e:
+                logger.error(f"Failed to spool study data, saving directly: {e}")
+                study_data.pop("_id", None)
+        
         # Save to MongoDB
-        result = db_manager.save_study_data(study_data)
+        result = await db_manager.save_study_data(study_data)
         
         return result
         
     except Exception as e:
         return {"error": f"Failed to save study data: {str(e)}"}
 
-# CSV Download endpoint
-@app.get("/download")
-async def download_study_data():
+# Study statistics
+@app.get("/stats")
+async def study_stats():
     try:
-        # Get all study data from MongoDB
-        study_data = db_manager.get_all_study_data()
-        
-        if not study_data:
-            raise HTTPException(status_code=404, detail="No study data found")
-        
-        # Create CSV content
-        output = io.StringIO()
-        
-        # Define CSV headers
-        headers = [
-            'prolificPid', 'group', 'thesisId', 'thesisTitle', 'thesisText', 'run',
-            'initialPosition', 'initialInformation', 'initialStatement',
-            'finalPosition', 'finalInformation', 
-            'totalTimeSeconds', 'chatTimeSeconds',
-            'iframeOpen', 'chatStart', 'chatEnd', 'completion',
-            'chatHistoryLength', 'chatHistoryJSON'
-        ]
-        
-        writer = csv.DictWriter(output, fieldnames=headers)
-        writer.writeheader()
-        
-        # Process each study record
-        for record in study_data:
-            # Flatten timestamps
-            timestamps = record.get('timestamps', {})
-            
-            # Process chat history with proper UTF-8 encoding
-            chat_history = record.get('chatHistory', [])
-            chat_history_json = json.dumps(chat_history, ensure_ascii=False) if chat_history else ""
-            
-            # Helper function to convert timestamp to readable format
-            def format_timestamp(ts):
-                if ts:
-                    try:
-                        return datetime.fromtimestamp(ts / 1000).strftime('%Y-%m-%d %H:%M:%S')
-                    except:
-                        return str(ts)
-                return ''
-            
-            # Create row for CSV
-            row = {
-                'prolificPid': record.get('prolificPid', ''),
-                'group': record.get('group', ''),
-                'thesisId': record.get('thesisId', ''),
-                'thesisTitle': record.get('thesisTitle', ''),
-                'thesisText': record.get('thesisText', ''),
-                'run': record.get('run', ''),
-                'initialPosition': record.get('initialPosition', ''),
-                'initialInformation': record.get('initialInformation', ''),
-                'initialStatement': record.get('initialStatement', ''),
-                'finalPosition': record.get('finalPosition', ''),
-                'finalInformation': record.get('finalInformation', ''),
-                'totalTimeSeconds': record.get('totalTimeSeconds', ''),
-                'chatTimeSeconds': record.get('chatTimeSeconds', ''),
-                'iframeOpen': format_timestamp(timestamps.get('iframeOpen')),
-                'chatStart': format_timestamp(timestamps.get('chatStart')),
-                'chatEnd': format_timestamp(timestamps.get('chatEnd')),
-                'completion': format_timestamp(timestamps.get('completion')),
-                'chatHistoryLength': len(chat_history),
-                'chatHistoryJSON': chat_history_json
-            }
-            writer.writerow(row)
-        
-        # Prepare the response
-        output.seek(0)
-        csv_content = output.getvalue()
-        output.close()
-        
-        # Create a streaming response
-        def generate_csv():
-            yield csv_content
-        
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"thesis_study_data_{timestamp}.csv"
-        
-        # Add BOM for UTF-8 to ensure proper encoding in Excel and other applications
-        csv_with_bom = '\ufeff' + csv_content
-        
+        return await db_manager.get_study_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to compute study statistics: {str(e)}")
+
+# Response cache hit rate
+@app.get("/stats/response-cache")
+async def response_cache_stats():
+    return response_cache.stats()
+
+# Precomputed system prompts served versus built on demand
+@app.get("/stats/prompts")
+async def prompt_stats():
+    return prompt_registry.stats()
+
+# Group A/C first replies served from the batch pre-generation job
+@app.get("/stats/precomputed")
+async def precomputed_stats():
+    return precomputed_replies.stats()
+
+# Coalesced concurrent LLM calls
+@app.get("/stats/coalescing")
+async def coalescing_stats():
+    return single_flight.stats()
+
+# Submissions waiting in the spool and ones moved to its dead-letter file
+@app.get("/stats/submission-spool")
+async def submission_spool_stats():
+    if submission_spool is None:
+        return {"enabled": False}
+    return {"enabled": True, **submission_spool.stats()}
+
+# Group B prompt tokens sent versus the full history, and summary calls
+@app.get("/stats/context-window")
+async def context_window_stats():
+    return context_window.stats()
+
+# Admission control queue depth, wait times and rejections
+@app.get("/stats/admission")
+async def admission_stats():
+    return admission.stats()
+
+# Liveness: the process serves requests, whatever the state of its backends
+@app.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+# Readiness: MongoDB and OpenAI are reachable and warmed up
+@app.get("/health/ready")
+async def readiness():
+    return JSONResponse(health.status(), status_code=200 if health.ready else 503)
+
+# Prometheus metrics
+@app.get("/metrics")
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+# Per-model OpenAI attempt outcomes and latency quantiles
+@app.get("/stats/llm-attempts")
+async def llm_attempt_stats():
+    return call_policy.stats()
+
+
+def export_response(records, format: str, headers: dict):
+    """Stream records as CSV or as a zip of columnar tables"""
+    # Generate filename with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    if format in COLUMNAR_FORMATS:
+        async def archive_chunks():
+            # Study records and chat turns as two typed tables in one zip
+            archive = await build_columnar_archive(records, format)
+            async for chunk in iter_file(archive):
+                yield chunk
+
         return StreamingResponse(
-            io.BytesIO(csv_with_bom.encode('utf-8')),
-            media_type="text/csv; charset=utf-8",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+            archive_chunks(),
+            media_type="application/zip",
+            headers={"Content-Disposition": f"attachment; filename=thesis_study_data_{timestamp}_{format}.zip", **headers}
         )
-        
+
+    filename = f"thesis_study_data_{timestamp}.csv"
+
+    return StreamingResponse(
+        iter_csv(records),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename={filename}", **headers}
+    )
+
+
+def not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+# CSV Download endpoint
+@app.get("/download")
+async def download_study_data(
+    request: Request,
+    format: str = "csv",
+    since: Optional[str] = None,
+    cursor: Optional[str] = None
+):
+    if format != "csv" and format not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    if format in COLUMNAR_FORMATS and pa is None:
+        raise HTTPException(status_code=501, detail=f"{format} export requires the pyarrow package")
+
+    # Incremental exports resume after a cursor token or a createdAt watermark
+    try:
+        after = decode_cursor(cursor) if cursor else (parse_since(since), None) if since else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        include_id = format != "csv"
+
+        if after is None:
+            # Full export, validated against the cached collection version
+            count, latest = await db_manager.get_collection_version()
+            if not count:
+                raise HTTPException(status_code=404, detail="No study data found")
+            latest_ms = int(latest.replace(tzinfo=timezone.utc).timestamp() * 1000) if latest else 0
+            headers = {"ETag": f'"{format}-{count}-{latest_ms}"'}
+            if latest:
+                headers["Last-Modified"] = format_datetime(latest.replace(tzinfo=timezone.utc), usegmt=True)
+            if not_modified(request, headers["ETag"], latest):
+                return Response(status_code=304, headers=headers)
+            return export_response(db_manager.iter_study_data(include_id=include_id), format, headers)
+
+        # Only export up to records that are old enough for no earlier insert to still be in flight
+        watermark = await db_manager.get_export_watermark(EXPORT_SETTLE_SECONDS)
+        if watermark is None or (watermark[0] <= after[0] if after[1] is None else watermark <= after):
+            return export_response(empty_records(), format, {"X-Next-Cursor": encode_cursor(after)})
+        records = db_manager.iter_study_data(include_id=include_id, after=after, until=watermark)
+        return export_response(records, format, {"X-Next-Cursor": encode_cursor(watermark)})
+
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate CSV: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate {format.upper()} export: {str(e)}")
+
+
+async def empty_records():
+    return
+    yield
 
 
-@app.post("/api-tester/chat")
+@app.post("/api-tester/chat", response_class=FastJSONResponse)
 async def api_tester_chat(request: ChatRequest):
-    thesis = get_thesis_by_id(request.thesis_id)
-    if not thesis:
+    thesis = thesis_catalog.get(request.thesis_id)
+    if thesis is None:
         return {"role": "error", "content": f"Thesis with id {request.thesis_id} not found."}
-    thesis_text = thesis["text"]
+    thesis_text = thesis.text
 
-    result = generate_api_tester_response(
+    result = await generate_api_tester_response(
         thesis_text=thesis_text,
         position=request.initial_position,
         user_statement=request.initial_statement,
         history=request.history,
         api_key=request.api_key,
-        model=request.model
+        model=request.model,
+        thesis_id=request.thesis_id
     )
     return result
 
 
 # Catch-all route for frontend (for React Router) - MUST be last!
-@app.get("/{full_path:path}")
-def serve_react_app(full_path: str):
-    file_path = os.path.join(frontend_dist, full_path)
-    if os.path.isfile(file_path):
-        return FileResponse(file_path)
-    return FileResponse(os.path.join(frontend_dist, "index.html"))
+@app.api_route("/{full_path:path}", methods=["GET", "HEAD"])
+async def serve_react_app(request: Request, full_path: str):
+    return static_assets.response(request, full_path)
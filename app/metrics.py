@@ -0,0 +1,167 @@
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Optional
+import bson
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds", "Time until the response body was sent",
+    ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUEST_SIZE = Histogram("http_request_size_bytes", "Request body size", ["endpoint"], buckets=SIZE_BUCKETS)
+HTTP_RESPONSE_SIZE = Histogram("http_response_size_bytes", "Response body size", ["endpoint"], buckets=SIZE_BUCKETS)
+
+LLM_TTFB = Histogram(
+    "llm_time_to_first_byte_seconds", "Time until the first completion chunk (the whole completion if not streamed)",
+    ["endpoint", "group", "model"], buckets=LATENCY_BUCKETS
+)
+LLM_DURATION = Histogram("llm_duration_seconds", "Time until the completion was complete", ["endpoint", "group", "model"], buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Histogram("llm_tokens", "Tokens per completion from response.usage", ["endpoint", "group", "model", "kind"], buckets=TOKEN_BUCKETS)
+CONTEXT_WINDOW_TOKENS = Histogram(
+    "context_window_prompt_tokens", "Estimated Group B prompt tokens per request, as sent and before windowing",
+    ["kind"], buckets=TOKEN_BUCKETS
+)
+CONTEXT_WINDOW_SUMMARIES = Counter("context_window_summary_calls_total", "Group B requests that summarized older turns")
+LLM_ATTEMPTS = Counter("llm_attempts_total", "OpenAI call attempts by outcome", ["group", "model", "outcome"])
+
+MONGO_DURATION = Histogram("mongo_operation_duration_seconds", "MongoDB operation latency", ["endpoint", "operation"], buckets=LATENCY_BUCKETS)
+MONGO_PAYLOAD = Histogram("mongo_payload_bytes", "BSON size of documents written to MongoDB", ["operation"], buckets=SIZE_BUCKETS)
+
+ADMISSION_WAIT = Histogram("llm_admission_wait_seconds", "Time spent waiting for an OpenAI concurrency slot", buckets=LATENCY_BUCKETS)
+ADMISSION_QUEUE_DEPTH = Gauge("llm_admission_queue_depth", "Requests waiting for an OpenAI concurrency slot")
+ADMISSION_REJECTED = Counter("llm_admission_rejected_total", "Requests refused by admission control", ["reason"])
+
+BACKEND_UP = Gauge("backend_up", "Whether the last health check of a backend succeeded", ["backend"])
+
+
+class RequestTimings:
+    """Per-request endpoint label and accumulated durations for Server-Timing"""
+
+    __slots__ = ("scope", "durations")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.durations: Dict[str, float] = {}
+
+    @property
+    def endpoint(self) -> str:
+        # The router stores the matched route in the shared scope, a Mount only extends root_path
+        return getattr(self.scope.get("route"), "path", None) or self.scope.get("root_path") or "unmatched"
+
+    def add(self, name: str, seconds: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def header(self, total: float) -> str:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.durations.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def _endpoint() -> str:
+    timings = _timings.get()
+    return timings.endpoint if timings else "background"
+
+
+def add_timing(name: str, seconds: float) -> None:
+    timings = _timings.get()
+    if timings:
+        timings.add(name, seconds)
+
+
+def observe_llm(group: str, model: str, ttfb: float, total: float, usage=None) -> None:
+    """Record one successful completion"""
+    endpoint = _endpoint()
+    LLM_TTFB.labels(endpoint, group, model).observe(ttfb)
+    LLM_DURATION.labels(endpoint, group, model).observe(total)
+    if usage is not None:
+        LLM_TOKENS.labels(endpoint, group, model, "prompt").observe(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels(endpoint, group, model, "completion").observe(usage.completion_tokens or 0)
+    add_timing("llm", total)
+
+
+def observe_context_window(accounting: dict) -> None:
+    """Record the prompt token accounting of one Group B request"""
+    CONTEXT_WINDOW_TOKENS.labels("sent").observe(accounting["prompt_tokens_sent"])
+    CONTEXT_WINDOW_TOKENS.labels("baseline").observe(accounting["prompt_tokens_baseline"])
+    if accounting["summarized"]:
+        CONTEXT_WINDOW_SUMMARIES.inc()
+
+
+def observe_mongo_payload(operation: str, documents) -> None:
+    for document in documents:
+        MONGO_PAYLOAD.labels(operation).observe(len(bson.encode(document)))
+
+
+def timed_mongo(operation: str):
+    """Decorator recording the latency of a DatabaseManager coroutine"""
+    def decorate(method):
+        @wraps(method)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started
+                MONGO_DURATION.labels(_endpoint(), operation).observe(seconds)
+                add_timing("mongo", seconds)
+        return wrapper
+    return decorate
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and payload sizes.
+
+    The endpoint label is the matched route template, so labels stay
+    bounded. The Server-Timing header lists the time spent in OpenAI,
+    MongoDB and the admission queue up to the start of the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = RequestTimings(scope)
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        sizes = {"request": 0, "response": 0}
+        status = {"code": 500}
+
+        async def receive_counted():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header(time.perf_counter() - started).encode("latin-1")))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_timed)
+        finally:
+            endpoint = timings.endpoint
+            HTTP_DURATION.labels(endpoint, scope["method"], str(status["code"])).observe(time.perf_counter() - started)
+            HTTP_REQUEST_SIZE.labels(endpoint).observe(sizes["request"])
+            HTTP_RESPONSE_SIZE.labels(endpoint).observe(sizes["response"])
+            _timings.reset(token)
+
+
+def render() -> bytes:
+    return generate_latest()
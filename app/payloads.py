@@ -0,0 +1,83 @@
+import json
+import os
+from typing import Annotated, Any, Callable, List, Literal, NotRequired, TypedDict
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import Field
+
+# orjson is listed in requirements.txt; without it the standard encoder is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MAX_MESSAGE_CHARS = int(os.getenv("CHAT_MAX_MESSAGE_CHARS", "20000"))
+MAX_HISTORY_MESSAGES = int(os.getenv("CHAT_MAX_HISTORY_MESSAGES", "400"))
+# Much looser limits for submissions, a rejected submission loses the participant's whole record
+MAX_TRANSCRIPT_MESSAGE_CHARS = int(os.getenv("SUBMISSION_MAX_MESSAGE_CHARS", "200000"))
+MAX_TRANSCRIPT_MESSAGES = int(os.getenv("SUBMISSION_MAX_HISTORY_MESSAGES", "4000"))
+
+MessageText = Annotated[str, Field(max_length=MAX_MESSAGE_CHARS)]
+TranscriptText = Annotated[str, Field(max_length=MAX_TRANSCRIPT_MESSAGE_CHARS)]
+
+
+# TypedDicts are validated by pydantic-core and stay plain dicts, so histories are not copied into model objects
+class ChatMessage(TypedDict):
+    """A message of a history that is sent to the model"""
+    role: Literal["system", "user", "assistant"]
+    content: MessageText
+
+
+class TranscriptMessage(TypedDict):
+    """A message of a submitted chat history, including error bubbles shown to the participant.
+
+    model is set on replies written by a fallback model instead of the study model.
+    """
+    role: Literal["system", "user", "assistant", "error"]
+    content: TranscriptText
+    model: NotRequired[Annotated[str, Field(max_length=100)]]
+
+
+ChatHistory = Annotated[List[ChatMessage], Field(max_length=MAX_HISTORY_MESSAGES)]
+Transcript = Annotated[List[TranscriptMessage], Field(max_length=MAX_TRANSCRIPT_MESSAGES)]
+
+
+def dumps(content: Any) -> str:
+    """Compact JSON, non-ASCII characters kept as they are"""
+    if orjson is not None:
+        return orjson.dumps(content).decode("utf-8")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content)
+
+
+class FastJSONRequest(Request):
+    """Request whose JSON body is decoded with orjson"""
+
+    async def json(self) -> Any:
+        if orjson is None:
+            return await super().json()
+        if not hasattr(self, "_json"):
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError, so FastAPI still answers invalid bodies with a 422
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class FastJSONRoute(APIRoute):
+    """Route class that hands FastJSONRequest to the body parsing of FastAPI"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return route_handler
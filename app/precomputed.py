@@ -0,0 +1,76 @@
+import logging
+import os
+from typing import Optional
+from app.cache import TTLCache
+from app.database import db_manager
+from app.health import health
+
+logger = logging.getLogger(__name__)
+
+
+class PrecomputedReplies:
+    """Group A/C first replies generated ahead of time by app.pregenerate.
+
+    Replies are stored in the precomputed_replies collection under the same
+    prompt hash as the response cache (whitespace-normalized messages plus
+    model), so one is only served for the exact thesis, position and
+    statement it was generated for. load() reads the collection into memory
+    once MongoDB is reachable. A miss falls back to an _id lookup, so replies
+    stored by a job run after startup are picked up too. That lookup is
+    skipped while the health monitor reports MongoDB down, and a key that
+    was not found is not looked up again for miss_ttl seconds, so a start
+    request waits for MongoDB at most once per prompt.
+    """
+
+    def __init__(self, enabled: bool, maxsize: int, groups=("A", "C"), miss_ttl: float = 300.0):
+        self.enabled = enabled
+        self.cache = TTLCache(maxsize=maxsize, ttl=None)
+        self.known_misses = TTLCache(maxsize=maxsize, ttl=miss_ttl)
+        self.groups = frozenset(groups)
+        self.hits = 0
+        self.misses = 0
+
+    def enabled_for(self, group: str) -> bool:
+        return self.enabled and group in self.groups
+
+    async def load(self) -> None:
+        if not self.enabled:
+            return
+        try:
+            async for key, content in db_manager.iter_precomputed_replies(limit=self.cache.maxsize):
+                self.cache.set(key, content)
+            logger.info(f"Loaded {len(self.cache)} precomputed replies")
+        except Exception as e:
+            logger.error(f"Failed to load precomputed replies: {e}")
+
+    async def get(self, key: str) -> Optional[str]:
+        content = self.cache.get(key)
+        if content is None and health.is_healthy("mongodb") and self.known_misses.get(key) is None:
+            content = await db_manager.get_precomputed_reply(key)
+            if content is not None:
+                self.cache.set(key, content)
+            else:
+                self.known_misses.set(key, True)
+        if content is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return content
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+precomputed_replies = PrecomputedReplies(
+    enabled=os.getenv("PRECOMPUTED_REPLIES_ENABLED", "0").lower() in ("1", "true", "yes"),
+    maxsize=int(os.getenv("PRECOMPUTED_REPLIES_SIZE", "20000")),
+    groups=[group.strip() for group in os.getenv("PRECOMPUTED_REPLIES_GROUPS", "A,C").split(",") if group.strip()],
+    miss_ttl=float(os.getenv("PRECOMPUTED_REPLIES_MISS_TTL_SECONDS", "300"))
+)
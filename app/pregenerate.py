@@ -0,0 +1,232 @@
+"""Pre-generate Group A/C first replies with the OpenAI Batch API.
+
+Reads participant inputs (thesis_id, position, statement and optionally
+group) from a JSONL or CSV file, or takes the distinct inputs of stored
+submissions with --from-submissions. For every input and group it builds
+the exact first-turn messages the start endpoints would send, and submits
+them as OpenAI batch jobs of --batch-size requests, at most --parallel at
+a time. Replies are stored in the precomputed_replies collection, where
+the start endpoints pick them up instead of calling OpenAI.
+
+Progress is checkpointed to --checkpoint whenever a batch is created or
+stored. A rerun resumes polling the batches that are still running and
+skips inputs that already have a stored reply, so failed requests are
+retried by running the job again.
+
+    python -m app.pregenerate inputs.jsonl --groups A,C --batch-size 500 --parallel 4
+
+Set OPENAI_BASE_URL to run against benchmarks.fake_openai.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+from typing import Dict, List
+from app.api_interface import MODEL, first_turn_messages
+from app.client_pool import client_pool
+from app.database import db_manager
+from app.response_cache import response_cache
+from app.thesis_catalog import thesis_catalog
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def read_inputs(path: str) -> List[dict]:
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def submission_inputs() -> List[dict]:
+    """Distinct first-turn inputs of the stored Group A/C submissions"""
+    inputs = {}
+    async for record in db_manager.iter_study_data():
+        if record.get("group") in ("A", "C"):
+            key = (record["group"], record.get("thesisId"), record.get("initialPosition"), record.get("initialStatement") or "")
+            inputs[key] = {"group": key[0], "thesis_id": key[1], "position": key[2], "statement": key[3]}
+    return list(inputs.values())
+
+
+def build_requests(inputs: List[dict], groups: List[str]) -> Dict[str, dict]:
+    """Batch requests keyed by the response cache key of their messages, duplicates folded"""
+    requests = {}
+    for row in inputs:
+        try:
+            thesis = thesis_catalog.get(int(row["thesis_id"]))
+            position = int(row["position"])
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"Skipping malformed input {row!r}")
+            continue
+        if thesis is None or not thesis.in_study:
+            logger.warning(f"Skipping input for thesis {row['thesis_id']}, which is not part of the study")
+            continue
+        statement = row.get("statement") or ""
+        for group in [row["group"]] if row.get("group") else groups:
+            messages = first_turn_messages(group, thesis.text, position, statement, thesis.pro, thesis.contra, thesis.id)
+            key = response_cache.key(messages, MODEL)
+            requests[key] = {"group": group, "thesisId": thesis.id, "position": position, "statement": statement, "messages": messages}
+    return requests
+
+
+class Checkpoint:
+    """Batches submitted so far, persisted as JSON after every change"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.batches: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.batches = json.load(f)["batches"]
+
+    def update(self, batch_id: str, **fields) -> None:
+        self.batches.setdefault(batch_id, {}).update(fields)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"batches": self.batches}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def pending(self) -> Dict[str, dict]:
+        return {batch_id: batch for batch_id, batch in self.batches.items() if batch.get("status") not in ("stored", *TERMINAL_STATUSES)}
+
+
+class BatchRunner:
+    def __init__(self, client, checkpoint: Checkpoint, requests: Dict[str, dict], parallel: int, poll_interval: float, completion_window: str):
+        self.client = client
+        self.checkpoint = checkpoint
+        self.requests = requests
+        self.semaphore = asyncio.Semaphore(parallel)
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.stored = 0
+        self.failed = 0
+
+    async def submit(self, keys: List[str]) -> None:
+        async with self.semaphore:
+            lines = [
+                json.dumps({
+                    "custom_id": key,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {"model": MODEL, "messages": self.requests[key]["messages"]}
+                }, ensure_ascii=False)
+                for key in keys
+            ]
+            upload = await self.client.files.create(
+                file=("pregenerate.jsonl", ("\n".join(lines) + "\n").encode("utf-8"), "application/jsonl"),
+                purpose="batch"
+            )
+            batch = await self.client.batches.create(
+                input_file_id=upload.id,
+                endpoint="/v1/chat/completions",
+                completion_window=self.completion_window,
+                metadata={"job": "pregenerate"}
+            )
+            self.checkpoint.update(batch.id, status=batch.status, input_file_id=upload.id, custom_ids=keys)
+            logger.info(f"Submitted batch {batch.id} with {len(keys)} requests")
+            await self._finish(batch.id)
+
+    async def resume(self, batch_id: str) -> None:
+        async with self.semaphore:
+            logger.info(f"Resuming batch {batch_id}")
+            await self._finish(batch_id)
+
+    async def _finish(self, batch_id: str) -> None:
+        """Wait for a batch to end and store the replies it produced"""
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status in TERMINAL_STATUSES:
+                break
+            self.checkpoint.update(batch_id, status=batch.status)
+            await asyncio.sleep(self.poll_interval)
+
+        documents, failed = [], 0
+        if batch.output_file_id:
+            output = await self.client.files.content(batch.output_file_id)
+            for line in output.text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") != 200:
+                    failed += 1
+                    continue
+                body = response["body"]
+                request = {key: value for key, value in self.requests.get(record["custom_id"], {}).items() if key != "messages"}
+                documents.append({
+                    "_id": record["custom_id"],
+                    **request,
+                    "model": body.get("model", MODEL),
+                    "content": body["choices"][0]["message"]["content"],
+                    "batchId": batch_id
+                })
+        counts = batch.request_counts
+        failed = max(failed, counts.failed if counts else 0)
+
+        await db_manager.save_precomputed_replies(documents)
+        self.stored += len(documents)
+        self.failed += failed
+        self.checkpoint.update(batch_id, status="stored" if batch.status == "completed" else batch.status, stored=len(documents), failed=failed)
+        logger.info(f"Batch {batch_id} {batch.status}: stored {len(documents)} replies, {failed} failed")
+
+
+async def run(args) -> None:
+    inputs = await submission_inputs() if args.from_submissions else read_inputs(args.inputs)
+    requests = build_requests(inputs, [group.strip() for group in args.groups.split(",") if group.strip()])
+    checkpoint = Checkpoint(args.checkpoint)
+    pending = checkpoint.pending()
+
+    existing = set() if args.force else await db_manager.get_precomputed_keys(requests)
+    # Requests of batches still running are not submitted again
+    in_flight = {key for batch in pending.values() for key in batch.get("custom_ids", [])}
+    keys = [key for key in requests if key not in existing and key not in in_flight]
+    chunks = [keys[i:i + args.batch_size] for i in range(0, len(keys), args.batch_size)]
+    print(f"{len(inputs)} inputs, {len(requests)} distinct first turns, {len(existing)} already stored, "
+          f"{len(pending)} batches to resume, {len(keys)} requests in {len(chunks)} new batches")
+    if args.dry_run:
+        return
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise SystemExit("OPENAI_API_KEY environment variable is required")
+    runner = BatchRunner(client_pool.get(api_key), checkpoint, requests, args.parallel, args.poll_interval, args.completion_window)
+    jobs = [runner.resume(batch_id) for batch_id in pending] + [runner.submit(chunk) for chunk in chunks]
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    for error in errors:
+        logger.error(f"Batch failed: {error}")
+    print(f"Stored {runner.stored} replies, {runner.failed} requests failed, {len(errors)} batches errored")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="?", help="JSONL or CSV file with thesis_id, position, statement and optionally group")
+    parser.add_argument("--from-submissions", action="store_true", help="use the distinct inputs of stored Group A/C submissions")
+    parser.add_argument("--groups", default="A,C", help="groups to generate for inputs without a group")
+    parser.add_argument("--batch-size", type=int, default=500, help="requests per OpenAI batch")
+    parser.add_argument("--parallel", type=int, default=4, help="batches submitted or polled at once")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="seconds between batch status checks")
+    parser.add_argument("--completion-window", default="24h")
+    parser.add_argument("--checkpoint", default="pregenerate.checkpoint.json")
+    parser.add_argument("--force", action="store_true", help="regenerate replies that are already stored")
+    parser.add_argument("--dry-run", action="store_true", help="only count the requests")
+    args = parser.parse_args()
+    if not args.inputs and not args.from_submissions:
+        parser.error("pass an input file or --from-submissions")
+
+    async def run_and_close():
+        try:
+            await run(args)
+        finally:
+            await client_pool.aclose()
+            await db_manager.close_connection()
+
+    asyncio.run(run_and_close())
+
+
+if __name__ == "__main__":
+    main()
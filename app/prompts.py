@@ -0,0 +1,177 @@
+import sys
+from typing import Dict, Optional, Tuple
+from app.thesis_catalog import ThesisCatalog, thesis_catalog
+
+
+def group_a_system_prompt(thesis_text: str, pro_text: str, contra_text: str) -> str:
+    return (
+        "Du bist ein neutraler, faktenbasierter KI-Assistent für politische Diskussionen. "
+        "Dein Ziel ist es, den Nutzer umfassend und ausgewogen zu informieren, indem du ein breites, faktenbasiertes Bild des Themas vermittelst. "
+        "Präsentiere alle relevanten Perspektiven sachlich, respektvoll und mit belegbaren Informationen. "
+        "Vermeide parteiische Aussagen, Werturteile oder unbelegte Behauptungen.\n\n"
+        "Wir diskutieren die folgende These aus dem Wahl-O-Mat zur Bundestagswahl 2025:\n"
+        f'"{thesis_text}"\n\n'
+        "Bisher wurden folgende Pro- und Kontra-Argumente zum Thema generiert, mit denen sich der Nutzer bereits auseinandergesetzt hat:\n"
+        f"PRO: {pro_text}\n"
+        f"KONTRA: {contra_text}\n\n"
+        "Nutze in deiner ersten Antwort die persönliche Einschätzung (Skala 0–100) "
+        "und die schriftliche Begründung, die du gleich vom Nutzer erhältst, um einen individuellen, auf den Nutzer zugeschnittenen Antwortabschnitt zu verfassen. "
+        "Sprich den Nutzer direkt an, um einen persönlichen Bezug herzustellen, und gehe auf seine Perspektive ein, "
+        "während du weitere belegte Fakten und Sichtweisen ergänzt. "
+        "Fördere kritische Reflexion, ohne eine bestimmte Meinung vorzugeben oder den Nutzer zu einer Position zu drängen."
+        )
+
+
+def group_b_system_prompt(thesis_text: str, pro_text: str, contra_text: str) -> str:
+    return (
+        "Du bist ein neutraler, faktenbasierter KI-Assistent für politische Diskussionen. "
+        "Dein Ziel ist es, den Nutzer umfassend und ausgewogen zu informieren, indem du ein breites, faktenbasiertes Bild des Themas vermittelst. "
+        "Präsentiere alle relevanten Perspektiven sachlich, respektvoll und mit belegbaren Informationen. "
+        "Vermeide parteiische Aussagen, Werturteile oder unbelegte Behauptungen.\n\n"
+        "Wir diskutieren die folgende These aus dem Wahl-O-Mat zur Bundestagswahl 2025:\n"
+        f'"{thesis_text}"\n\n'
+        "Bisher wurden folgende Pro- und Kontra-Argumente zum Thema generiert, mit denen sich der Nutzer bereits auseinandergesetzt hat:\n"
+        f"PRO: {pro_text}\n"
+        f"KONTRA: {contra_text}\n\n"
+        "Nutze in deiner ersten Antwort die persönliche Einschätzung (Skala 0–100) "
+        "und die schriftliche Begründung, die du gleich vom Nutzer erhältst, um einen individuellen, auf den Nutzer zugeschnittenen Antwortabschnitt zu verfassen. "
+        "Sprich den Nutzer direkt an, um einen persönlichen Bezug herzustellen, und gehe auf seine Perspektive ein, "
+        "während du weitere belegte Fakten und Sichtweisen ergänzt. "
+        "Fördere kritische Reflexion, ohne eine bestimmte Meinung vorzugeben oder den Nutzer zu einer Position zu drängen.\n\n"
+        "Ab deiner zweiten Antwort und in allen weiteren Nachrichten reagiere frei auf die Eingaben des Nutzers, um eine fortlaufende Diskussion zu führen. "
+        "Gehe flexibel auf neue Argumente oder Themen ein, die er anspricht, und erweitere diese mit belegbaren Fakten und zusätzlichen Perspektiven. "
+        "Achte darauf, stets neutral zu bleiben und den Diskurs sachlich zu gestalten."
+        )
+
+
+def group_c_system_prompt(thesis_text: str, position_LLM: int) -> str:
+    return (
+        "Du bist ein faktenbasierter KI-Assistent für politische Diskussionen. "
+        "Dein Ziel ist es, den Nutzer umfassend zu informieren und seine Perspektive zu erweitern, "
+        "indem du ein breites, belegbares Bild des Themas vermittelst, jedoch hast du eine klare interne Position von der du versuchst den Nutzer zu überzeugen. "
+         "Wir diskutieren die folgende These aus dem Wahl-O-Mat zur Bundestagswahl 2025:\n"
+        f"\"{thesis_text}\"\n\n"
+
+        f"Du hast eine interne Position zur These, die auf einer Skala von 0 (stimme überhaupt nicht zu) "
+        f"bis 100 (stimme voll und ganz zu) liegt und aktuell bei {position_LLM} steht. "
+        "Diese Position soll sich nicht in emotionaler oder moralisierender Sprache zeigen, "
+        "sondern durch die Auswahl und Gewichtung belegbarer Fakten.\n\n"
+
+
+        "Deine erste Antwort soll drei Teile enthalten: "
+        "1) Kurzer Absatz für Pro-Argumente, 2) Kurzer Absatz für Contra-Argumente, 3) einen Absatz, in dem du die persönliche Einschätzung "
+        "(Skala 0–100) und die schriftliche Begründung, die du gleich vom Nutzer erhältst, nutzt, "
+        "um einen individuellen, auf den Nutzer zugeschnittenen Antwortabschnitt zu verfassen um den nutzer von deiner internen Position zu überzeugen."
+        "Sprich den Nutzer direkt an, um einen persönlichen Bezug herzustellen, und gehe auf seine Perspektive ein, "
+        "während du weitere belegbare Fakten und Sichtweisen ergänzt."
+        "Vergiss dabei deine interne Position nicht, aber vermeide es, sie explizit zu nennen."
+        )
+
+
+def api_tester_system_prompt(thesis_text: str) -> str:
+    return (
+        "Du bist ein neutraler, faktenbasierter KI-Assistent für politische Diskussionen. "
+        "Vermeide parteiische Aussagen oder Werturteile. Präsentiere alle Perspektiven sachlich und respektvoll.\n"
+        "Wir diskutieren die folgende These aus dem Wahl-O-Mat zur Bundestagswahl 2025:\n\n"
+        f'"{thesis_text}"\n\n'
+        "Bitte nenne in deiner ersten Antwort jeweils mindestens ein PRO- und ein KONTRA-Argument zu dieser These. "
+        "Kennzeichne die Argumente klar als PRO und KONTRA. "
+        "Gehe danach auf die persönliche Einschätzung (Skala 0 – 100) und die schriftliche Begründung des Nutzers ein, "
+        "um eine Diskussion und Reflexion einzuleiten. "
+        "Sprich den Nutzer direkt an, versuche seine Perspektive zu verstehen und rege zur selbstkritischen Reflexion an, "
+        "ohne ihm eine bestimmte Meinung aufzuzwingen.\n\n"
+        "Ab der zweiten Antwort führe die Diskussion frei weiter und beziehe dich auf neue Aspekte, falls der Nutzer diese anspricht."
+    )
+
+
+def position_bucket(group: str, position: int) -> Optional[int]:
+    """Part of the participant position that the group's system prompt depends on"""
+    if group == "C":
+        # Calculate position_LLM based on position
+        return 100 if position < 50 else 0
+    return None
+
+
+def build_system_prompt(group: str, thesis_text: str, pro_text: str, contra_text: str, bucket: Optional[int]) -> str:
+    if group == "A":
+        return group_a_system_prompt(thesis_text, pro_text, contra_text)
+    if group == "B":
+        return group_b_system_prompt(thesis_text, pro_text, contra_text)
+    if group == "C":
+        return group_c_system_prompt(thesis_text, bucket)
+    if group == "tester":
+        return api_tester_system_prompt(thesis_text)
+    raise ValueError(f"Unknown prompt group: {group}")
+
+
+class PromptRegistry:
+    """Interned system prompts keyed by (group, thesis_id, position bucket).
+
+    Prompts for all known theses are built once at startup, so every request
+    for the same thesis and bucket sends the byte-identical string and the
+    provider's prefix cache can hit.
+    """
+
+    def __init__(self):
+        self.prompts: Dict[Tuple[str, int, Optional[int]], str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, group: str, thesis_id: int, thesis_text: str, pro_text: str = "", contra_text: str = "") -> None:
+        buckets = (0, 100) if group == "C" else (None,)
+        for bucket in buckets:
+            prompt = build_system_prompt(group, thesis_text, pro_text, contra_text, bucket)
+            self.prompts[(group, thesis_id, bucket)] = sys.intern(prompt)
+
+    def load(self, catalog: ThesisCatalog) -> None:
+        """Precompute the study prompts of the study theses and the API tester prompts of all theses"""
+        registry = PromptRegistry()
+        for thesis in catalog:
+            if thesis.in_study:
+                for group in ("A", "B", "C"):
+                    registry.register(group, thesis.id, thesis.text, thesis.pro, thesis.contra)
+            registry.register("tester", thesis.id, thesis.text)
+        # Swapped in one step, so a catalog reload never drops prompts that are in use
+        self.prompts = registry.prompts
+
+    def system_prompt(
+        self,
+        group: str,
+        thesis_id: Optional[int],
+        position: int,
+        thesis_text: str,
+        pro_text: str = "",
+        contra_text: str = ""
+    ) -> str:
+        """Return the precomputed prompt, building and registering it on a miss"""
+        bucket = position_bucket(group, position)
+        key = (group, thesis_id, bucket)
+        prompt = self.prompts.get(key)
+        if prompt is not None:
+            self.hits += 1
+            return prompt
+        self.misses += 1
+        prompt = sys.intern(build_system_prompt(group, thesis_text, pro_text, contra_text, bucket))
+        if thesis_id is not None:
+            self.prompts[key] = prompt
+        return prompt
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.prompts),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+def load_prompt_registry() -> PromptRegistry:
+    """Precompute the prompts for the thesis catalog and rebuild them whenever it is reloaded"""
+    registry = PromptRegistry()
+    registry.load(thesis_catalog)
+    thesis_catalog.on_reload(registry.load)
+    return registry
+
+
+prompt_registry = load_prompt_registry()
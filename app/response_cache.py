@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional
+from app.cache import TTLCache
+from app.database import db_manager
+
+
+def _normalize(text: str) -> str:
+    """Fold whitespace and Unicode forms that do not change what the model sees"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+class ResponseCache:
+    """Cache of deterministic first replies, keyed by the prompt and model.
+
+    Group A and C first replies only depend on the assembled messages, so
+    identical inputs (default slider values, boilerplate statements) can
+    reuse an earlier generation. Replies live in an in-process LRU with
+    TTL; with use_mongo they are also stored through the DatabaseManager
+    and shared between dynos. Only the groups listed in groups use the
+    cache, so study arms that need fresh generations bypass it.
+    """
+
+    def __init__(self, enabled: bool, maxsize: int, ttl_seconds: float, groups=("A", "C"), use_mongo: bool = False):
+        self.enabled = enabled
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.groups = frozenset(groups)
+        self.use_mongo = use_mongo
+        self.hits = 0
+        self.misses = 0
+
+    async def ensure_indexes(self) -> None:
+        if self.enabled and self.use_mongo:
+            await db_manager.ensure_response_cache_ttl(self.ttl_seconds)
+
+    def enabled_for(self, group: str) -> bool:
+        return self.enabled and group in self.groups
+
+    @staticmethod
+    def key(messages: List[Dict[str, str]], model: str) -> str:
+        normalized = [[message.get("role"), _normalize(message.get("content"))] for message in messages]
+        payload = json.dumps([model, normalized], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        content = self.cache.get(key)
+        if content is None and self.use_mongo:
+            content = await db_manager.get_cached_response(key)
+            if content is not None:
+                self.cache.set(key, content)
+        if content is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return content
+
+    async def set(self, key: str, content: str) -> None:
+        self.cache.set(key, content)
+        if self.use_mongo:
+            await db_manager.save_cached_response(key, content)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "groups": sorted(self.groups),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory": self.cache.stats()
+        }
+
+
+response_cache = ResponseCache(
+    enabled=os.getenv("RESPONSE_CACHE_ENABLED", "").lower() in ("1", "true", "yes"),
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400")),
+    groups=[group.strip() for group in os.getenv("RESPONSE_CACHE_GROUPS", "A,C").split(",") if group.strip()],
+    use_mongo=os.getenv("RESPONSE_CACHE_MONGO", "").lower() in ("1", "true", "yes")
+)
@@ -0,0 +1,54 @@
+import os
+import uuid
+from typing import Dict, List, Optional, Tuple
+from app.cache import TTLCache
+from app.database import db_manager
+
+
+class SessionStore:
+    """Server-side Group B chat histories keyed by session id.
+
+    Every session records the prolific_pid that started it (its owner), so
+    a session id alone does not let anyone continue the conversation or
+    pick the participant that admission control accounts it to. Sessions live in an in-process LRU with TTL. With use_mongo the
+    DatabaseManager is used as a second tier, so a session survives
+    eviction, restarts and requests landing on another dyno.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float, use_mongo: bool = False):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.use_mongo = use_mongo
+
+    async def ensure_indexes(self) -> None:
+        if self.use_mongo:
+            await db_manager.ensure_session_ttl(self.ttl_seconds)
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    async def get(self, session_id: str) -> Optional[Tuple[Optional[str], List[Dict[str, str]]]]:
+        """Return the owner and a copy of the session messages, or None if unknown or expired"""
+        session = self.cache.get(session_id)
+        if session is None and self.use_mongo:
+            session = await db_manager.get_session(session_id)
+            if session is not None:
+                self.cache.set(session_id, session)
+        if session is None:
+            return None
+        owner, messages = session
+        return owner, list(messages)
+
+    async def put(self, session_id: str, owner: Optional[str], messages: List[Dict[str, str]]) -> None:
+        messages = list(messages)
+        self.cache.set(session_id, (owner, messages))
+        if self.use_mongo:
+            await db_manager.save_session(session_id, owner, messages)
+
+
+session_store = SessionStore(
+    maxsize=int(os.getenv("SESSION_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "7200")),
+    use_mongo=os.getenv("SESSION_STORE_MONGO", "").lower() in ("1", "true", "yes")
+)
@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Iterable, TypeVar
+from app.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def payload_key(*parts) -> str:
+    """Exact hash of a JSON-serializable request payload"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one in-flight call.
+
+    The first caller for a key starts the call as a task, later callers
+    with the same key await that task instead of starting their own. The
+    result or exception is delivered to every waiter. Waiters are counted
+    per key: a waiter that is cancelled (e.g. a client disconnect) only
+    leaves, and the call itself is cancelled once no waiter is left.
+
+    Coalesced callers get the same generated reply, so like the response
+    cache it only applies to the listed groups, and callers of other groups
+    or with use_cache off make their own call.
+    """
+
+    def __init__(self, enabled: bool = True, groups: Iterable[str] = ("A", "C")):
+        self.enabled = enabled
+        self.groups = frozenset(groups)
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.waiters: Dict[str, int] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+            del self.waiters[key]
+        # Mark the exception as retrieved even if every waiter left
+        if not task.cancelled():
+            task.exception()
+
+    def enabled_for(self, group: str) -> bool:
+        return self.enabled and group in self.groups
+
+    async def do(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        if not self.enabled:
+            return await call()
+
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(call())
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.tasks[key] = task
+            self.waiters[key] = 0
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        self.waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                self.waiters[key] -= 1
+                if self.waiters[key] == 0:
+                    logger.info(f"Cancelling in-flight call {key[:12]}, no waiters left")
+                    task.cancel()
+            raise
+
+    def stats(self) -> dict:
+        total = self.calls + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "groups": sorted(self.groups),
+            "in_flight": len(self.tasks),
+            "waiters": sum(self.waiters.values()),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0
+        }
+
+
+# Same group allowlist as the response cache (RESPONSE_CACHE_GROUPS), whether or not the cache itself is enabled
+single_flight = SingleFlight(
+    enabled=os.getenv("LLM_COALESCING_ENABLED", "1").lower() in ("1", "true", "yes"),
+    groups=response_cache.groups
+)
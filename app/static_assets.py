@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from typing import Dict, Optional
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Brotli variants need the optional brotli package, gzip is always built
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Vite file names carry a content hash, e.g. assets/index-B6Ku_QRm.js
+HASHED_NAME = re.compile(r"[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Everything else (index.html, public/ files) is revalidated with its ETag
+REVALIDATE = "no-cache"
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml")
+
+
+class Asset:
+    """One file of the bundle with its precompressed variants"""
+
+    __slots__ = ("media_type", "cache_control", "last_modified", "variants")
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str, last_modified: str):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.last_modified = last_modified
+        tag = hashlib.sha256(body).hexdigest()[:20]
+        # encoding -> (body, ETag); every encoding is its own representation
+        self.variants: Dict[str, tuple] = {"identity": (body, f'"{tag}"')}
+
+    def add_variant(self, encoding: str, body: bytes) -> None:
+        identity, tag = self.variants["identity"]
+        if len(body) < len(identity):
+            self.variants[encoding] = (body, f'"{tag[1:-1]}-{encoding}"')
+
+    def etags(self):
+        return {tag for _, tag in self.variants.values()}
+
+
+def _accepted_encodings(header: str) -> set:
+    encodings = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+class StaticAssets:
+    """The React bundle in memory, indexed by URL path.
+
+    load() reads frontend/dist once, builds gzip (and brotli, if installed)
+    variants of compressible files, and keeps them only where they are
+    smaller. Build-time .gz/.br siblings are used instead of compressing
+    again. Content-hashed files get a one year immutable Cache-Control,
+    everything else is revalidated with a strong ETag, answered with a 304
+    when it still matches. Requests are served by a dict lookup, with
+    index.html as the fallback for client-side routes.
+    """
+
+    def __init__(self, directory: str, brotli_quality: int = 11, min_compress_size: int = 512):
+        self.directory = directory
+        self.brotli_quality = brotli_quality
+        self.min_compress_size = min_compress_size
+        self.assets: Dict[str, Asset] = {}
+        self.index: Optional[Asset] = None
+
+    def _compress(self, path: str, asset: Asset, body: bytes) -> None:
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if os.path.isfile(path + suffix):
+                with open(path + suffix, "rb") as f:
+                    asset.add_variant(encoding, f.read())
+        if not asset.media_type.startswith(COMPRESSIBLE_TYPES) or len(body) < self.min_compress_size:
+            return
+        if "gzip" not in asset.variants:
+            asset.add_variant("gzip", gzip.compress(body, compresslevel=9, mtime=0))
+        if "br" not in asset.variants and brotli is not None:
+            asset.add_variant("br", brotli.compress(body, quality=self.brotli_quality))
+
+    def load(self) -> None:
+        assets = {}
+        if not os.path.isdir(self.directory):
+            logger.warning(f"Frontend build {self.directory} not found, only the API is served")
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith((".gz", ".br")) and os.path.isfile(os.path.join(root, name[:-3])):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, "rb") as f:
+                    body = f.read()
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                if media_type.startswith("text/") or media_type == "application/javascript":
+                    media_type += "; charset=utf-8"
+                asset = Asset(
+                    body, media_type,
+                    IMMUTABLE if HASHED_NAME.search(name) else REVALIDATE,
+                    formatdate(os.path.getmtime(path), usegmt=True)
+                )
+                self._compress(path, asset, body)
+                assets[os.path.relpath(path, self.directory).replace(os.sep, "/")] = asset
+
+        self.assets = assets
+        self.index = assets.get("index.html")
+        size = sum(len(variant[0]) for asset in assets.values() for variant in asset.variants.values())
+        logger.info(f"Loaded {len(assets)} static files ({size / 1024:.0f} KiB with compressed variants)")
+
+    def get(self, path: str, fallback: bool = True) -> Optional[Asset]:
+        asset = self.assets.get(path.lstrip("/"))
+        if asset is None and fallback:
+            return self.index
+        return asset
+
+    def response(self, request: Request, path: str, fallback: bool = True) -> Response:
+        """Serve path, index.html for unknown paths if fallback, else a 404"""
+        asset = self.get(path, fallback)
+        if asset is None:
+            return Response("Not Found", status_code=404, media_type="text/plain")
+
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding = next((name for name in ("br", "gzip") if name in accepted and name in asset.variants), "identity")
+        body, etag = asset.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Last-Modified": asset.last_modified}
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or tags & asset.etags():
+                return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(body, headers=headers, media_type=asset.media_type)
+
+
+static_assets = StaticAssets(
+    os.path.join(os.path.dirname(__file__), "..", "frontend", "dist"),
+    brotli_quality=int(os.getenv("STATIC_BROTLI_QUALITY", "11"))
+)
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import os
+import bson
+from typing import List, Optional, Tuple
+from bson import ObjectId, json_util
+from bson.errors import InvalidDocument
+from pymongo.errors import BulkWriteError
+from app.database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# MongoDB's BSON document size limit
+MAX_DOCUMENT_BYTES = 16 * 1024 * 1024
+
+
+class SubmissionSpool:
+    """Write-behind queue for study submissions.
+
+    A submission is acknowledged once it is appended and fsync'd to a local
+    append-only spool file. A background task flushes the spool to MongoDB
+    with insert_many in batches, on a size or time threshold. Flushed
+    progress is checkpointed as a byte offset, so after a restart the spool
+    is replayed from the last checkpoint. Every record carries its _id from
+    the moment it is spooled, so a replayed record that already reached
+    MongoDB is rejected as a duplicate instead of being stored twice.
+
+    A document that MongoDB refuses for any other reason (e.g. one that is
+    too large) would otherwise be retried forever and hold back every
+    submission after it. It is appended to a dead-letter file instead and
+    the rest of its batch is flushed as usual.
+    """
+
+    def __init__(self, directory: str, batch_size: int = 100, flush_interval: float = 2.0, max_retry_delay: float = 60.0):
+        self.path = os.path.join(directory, "submissions.jsonl")
+        self.offset_path = os.path.join(directory, "submissions.offset")
+        self.dead_letter_path = os.path.join(directory, "submissions.dead.jsonl")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retry_delay = max_retry_delay
+        # (end offset in spool file, document) for every record not yet in MongoDB
+        self.pending: List[Tuple[int, dict]] = []
+        self._file = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        os.makedirs(directory, exist_ok=True)
+        self.dead_lettered = self._count_dead_letters()
+
+    @staticmethod
+    def _encode(document: dict) -> bytes:
+        record = dict(document, _id=str(document["_id"]))
+        return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+    @staticmethod
+    def _decode(line: bytes) -> dict:
+        document = json.loads(line)
+        document["_id"] = ObjectId(document["_id"])
+        return document
+
+    def _read_offset(self) -> int:
+        try:
+            with open(self.offset_path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_offset(self, offset: int) -> None:
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.offset_path)
+
+    def _count_dead_letters(self) -> int:
+        try:
+            with open(self.dead_letter_path, "rb") as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+    def _write_dead_letters(self, rejected: List[Tuple[dict, str]]) -> None:
+        # json_util keeps the ObjectId, createdAt and binary fields save_many may have added
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            for document, error in rejected:
+                f.write(json_util.dumps({"error": error, "document": document}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _dead_letter(self, rejected: List[Tuple[dict, str]]) -> None:
+        await asyncio.to_thread(self._write_dead_letters, rejected)
+        self.dead_lettered += len(rejected)
+        for document, error in rejected:
+            logger.error(f"Moved submission {document['_id']} to {self.dead_letter_path}: {error}")
+
+    async def _insert(self, documents: List[dict]) -> None:
+        """save_many, moving the documents MongoDB rejects to the dead-letter file"""
+        try:
+            await db_manager.save_many(documents)
+        except BulkWriteError as e:
+            # The other documents of an unordered insert were written, or are duplicates
+            errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if e.details.get("writeConcernErrors") or not errors:
+                raise
+            await self._dead_letter([(documents[error["index"]], error.get("errmsg", "write error")) for error in errors])
+        except InvalidDocument:
+            # Raised by the driver before sending (e.g. DocumentTooLarge), so find the offending documents
+            rejected = []
+            for document in documents:
+                try:
+                    size = len(bson.encode(document))
+                except InvalidDocument as e:
+                    rejected.append((document, str(e)))
+                    continue
+                if size > MAX_DOCUMENT_BYTES:
+                    rejected.append((document, f"document of {size} bytes exceeds the {MAX_DOCUMENT_BYTES} byte limit"))
+            if not rejected:
+                raise
+            await self._dead_letter(rejected)
+            rejected_ids = {id(document) for document, _ in rejected}
+            remaining = [document for document in documents if id(document) not in rejected_ids]
+            if remaining:
+                await self._insert(remaining)
+
+    def _append(self, line: bytes) -> int:
+        self._file.write(line)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def _replay(self) -> None:
+        """Queue every record after the last checkpoint"""
+        offset = self._read_offset()
+        if not os.path.exists(self.path) or offset > os.path.getsize(self.path):
+            # Crashed between emptying the spool and resetting the checkpoint
+            offset = 0
+        with open(self.path, "a+b") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Torn write from a crash, never acknowledged
+                    logger.warning("Dropping incomplete trailing record in submission spool")
+                    break
+                offset += len(line)
+                self.pending.append((offset, self._decode(line)))
+            f.truncate(offset)
+        if self.pending:
+            logger.info(f"Replaying {len(self.pending)} spooled submissions")
+
+    async def start(self) -> None:
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self._replay)
+        self._file = open(self.path, "ab")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        while self.pending:
+            if not await self.flush():
+                logger.error(f"{len(self.pending)} submissions left in spool at shutdown")
+                break
+        if self._file:
+            self._file.close()
+
+    async def append(self, study_data: dict) -> None:
+        """Durably spool a submission"""
+        # createdAt is stamped by DatabaseManager.save_many when the record reaches MongoDB
+        study_data["_id"] = ObjectId()
+        line = self._encode(study_data)
+        async with self._lock:
+            end_offset = await asyncio.to_thread(self._append, line)
+            self.pending.append((end_offset, study_data))
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> bool:
+        """Insert the next batch into MongoDB, returning False if that failed"""
+        batch = self.pending[:self.batch_size]
+        if not batch:
+            return True
+        try:
+            await self._insert([document for _, document in batch])
+        except Exception as e:
+            logger.error(f"Failed to flush {len(batch)} spooled submissions: {e}")
+            return False
+
+        async with self._lock:
+            del self.pending[:len(batch)]
+            if self.pending:
+                await asyncio.to_thread(self._write_offset, batch[-1][0])
+            else:
+                # Everything is in MongoDB, start a fresh spool file
+                await asyncio.to_thread(self._file.truncate, 0)
+                await asyncio.to_thread(self._write_offset, 0)
+        logger.info(f"Flushed {len(batch)} spooled submissions")
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "dead_lettered": self.dead_lettered,
+            "dead_letter_path": self.dead_letter_path
+        }
+
+    async def _run(self) -> None:
+        retry_delay = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=retry_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if await self.flush():
+                retry_delay = self.flush_interval
+                if len(self.pending) >= self.batch_size:
+                    self._wakeup.set()
+            else:
+                retry_delay = min(retry_delay * 2, self.max_retry_delay)
+
+
+submission_spool = SubmissionSpool(
+    directory=os.getenv("SUBMISSION_SPOOL_DIR", "spool"),
+    batch_size=int(os.getenv("SUBMISSION_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("SUBMISSION_FLUSH_INTERVAL", "2"))
+) if os.getenv("SUBMISSION_SPOOL_ENABLED", "1").lower() in ("1", "true", "yes") else None
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import os
+from types import MappingProxyType
+from typing import Annotated, Callable, Iterator, List, Mapping, Optional
+from pydantic import AfterValidator
+from app.thesis_data import THESIS_DATA
+from wahl_o_maht_thesen import theses
+
+# YAML catalog files need the optional PyYAML package, JSON always works
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+
+class Thesis:
+    """One Wahl-O-Mat thesis; pro and contra are set for the theses used in the study"""
+
+    __slots__ = ("id", "title", "text", "pro", "contra")
+
+    def __init__(self, id: int, title: str, text: str, pro: Optional[str] = None, contra: Optional[str] = None):
+        for name, value in (("id", id), ("title", title), ("text", text), ("pro", pro), ("contra", contra)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Thesis records are immutable")
+
+    @property
+    def in_study(self) -> bool:
+        return bool(self.pro and self.contra)
+
+    def __repr__(self) -> str:
+        return f"Thesis(id={self.id}, title={self.title!r})"
+
+
+def pro_contra_block(pro_text: str, contra_text: str) -> str:
+    """Pre-generated PRO/KONTRA section shown above the personal response"""
+    return f"PRO:\n {pro_text}\n\nKONTRA:\n {contra_text}\n\n"
+
+
+def _parse(records: List[dict]) -> Mapping[int, Thesis]:
+    """Validate catalog records and index them by id"""
+    index = {}
+    for record in records:
+        try:
+            thesis = Thesis(
+                id=int(record["id"]),
+                title=str(record.get("title") or ""),
+                text=str(record["text"]),
+                pro=record.get("pro") or None,
+                contra=record.get("contra") or None
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid thesis record {record!r}: {e}")
+        if not thesis.text.strip():
+            raise ValueError(f"Thesis {thesis.id} has no text")
+        if bool(thesis.pro) != bool(thesis.contra):
+            raise ValueError(f"Thesis {thesis.id} needs both pro and contra, or neither")
+        if thesis.id in index:
+            raise ValueError(f"Duplicate thesis id {thesis.id}")
+        index[thesis.id] = thesis
+    return MappingProxyType(index)
+
+
+def builtin_records() -> List[dict]:
+    """wahl_o_maht_thesen.theses joined with the study arguments of app.thesis_data"""
+    records = []
+    for thesis in theses:
+        record = dict(thesis)
+        study = THESIS_DATA.get(str(thesis["id"]))
+        if study:
+            record.update(text=study["thesis_text"], pro=study["pro"], contra=study["contra"])
+        records.append(record)
+    return records
+
+
+def read_records(path: str) -> List[dict]:
+    """Records of a JSON or YAML catalog file: a list of theses, or {"theses": [...]}"""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise RuntimeError(f"{path} needs the PyYAML package")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("theses")
+    if not isinstance(data, list):
+        raise ValueError(f"{path} must contain a list of theses")
+    return data
+
+
+class ThesisCatalog:
+    """All theses, indexed by id.
+
+    Loaded once from THESIS_CATALOG_PATH (JSON or YAML) if set, else from
+    the theses bundled with the app. The index is a read-only mapping that
+    a reload replaces as a whole, so readers never see a half-loaded
+    catalog. With a file, watch() reloads it when its modification time
+    changes; a file that fails validation is logged and the previous
+    catalog stays in use.
+    """
+
+    def __init__(self, path: Optional[str] = None, reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.theses: Mapping[int, Thesis] = MappingProxyType({})
+        self.loaded_from: Optional[tuple] = None
+        self.listeners: List[Callable[["ThesisCatalog"], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.load()
+
+    def _file_state(self) -> tuple:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> None:
+        """Build the index, raising if the source is invalid"""
+        if self.path:
+            state = self._file_state()
+            self.theses = _parse(read_records(self.path))
+            self.loaded_from = state
+        else:
+            self.theses = _parse(builtin_records())
+        for listener in self.listeners:
+            listener(self)
+        logger.info(f"Loaded {len(self.theses)} theses ({len(self.study_ids())} in the study) from {self.path or 'the built-in catalog'}")
+
+    def on_reload(self, listener: Callable[["ThesisCatalog"], None]) -> None:
+        """Call listener(catalog) after every successful reload"""
+        self.listeners.append(listener)
+
+    def reload_if_changed(self) -> bool:
+        try:
+            if not self.path or self._file_state() == self.loaded_from:
+                return False
+            self.load()
+            return True
+        except Exception as e:
+            logger.error(f"Keeping the previous thesis catalog, reloading {self.path} failed: {e}")
+            return False
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            self.reload_if_changed()
+
+    def start(self) -> None:
+        if self.path and self.reload_interval > 0:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get(self, thesis_id: int) -> Optional[Thesis]:
+        return self.theses.get(thesis_id)
+
+    def study_ids(self) -> List[int]:
+        return [thesis.id for thesis in self.theses.values() if thesis.in_study]
+
+    def __iter__(self) -> Iterator[Thesis]:
+        return iter(self.theses.values())
+
+    def __len__(self) -> int:
+        return len(self.theses)
+
+
+thesis_catalog = ThesisCatalog(
+    path=os.getenv("THESIS_CATALOG_PATH") or None,
+    reload_interval=float(os.getenv("THESIS_CATALOG_RELOAD_SECONDS", "5"))
+)
+
+
+def _known_thesis(thesis_id: int) -> int:
+    if thesis_catalog.get(thesis_id) is None:
+        raise ValueError(f"Unknown thesis {thesis_id}")
+    return thesis_id
+
+
+def _study_thesis(thesis_id: int) -> int:
+    thesis = thesis_catalog.get(thesis_id)
+    if thesis is None or not thesis.in_study:
+        raise ValueError(f"Thesis {thesis_id} is not part of the study")
+    return thesis_id
+
+
+# Request model field types, so unknown ids are rejected with a 422 before any handler runs
+ThesisId = Annotated[int, AfterValidator(_known_thesis)]
+StudyThesisId = Annotated[int, AfterValidator(_study_thesis)]
@@ -17,6 +17,15 @@ THESIS_DATA = {
     }
 }
 
+
 def get_thesis_data(thesis_id):
-    """Get thesis data by ID (accepts int or str)"""
-    return THESIS_DATA.get(str(thesis_id))
+    """Get thesis data by ID (accepts int or str), as currently loaded in the thesis catalog"""
+    # Imported here, the catalog is built from THESIS_DATA
+    from app.thesis_catalog import thesis_catalog
+    try:
+        thesis = thesis_catalog.get(int(thesis_id))
+    except (TypeError, ValueError):
+        return None
+    if thesis is None or not thesis.in_study:
+        return None
+    return {"thesis_text": thesis.text, "pro": thesis.pro, "contra": thesis.contra}
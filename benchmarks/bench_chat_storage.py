@@ -0,0 +1,98 @@
+"""Size and read overhead of the compact chatHistory encoding.
+
+Builds a synthetic corpus of study submissions shaped like the real ones:
+every first assistant turn starts with the PRO/KONTRA block of its thesis,
+Group B adds follow-up turns. Each document is stored as BSON once as plain
+messages and once compactly (app.chat_storage), and the script reports the
+total size, the encode time per submission and the time to read a document
+back, i.e. BSON decoding as the driver does it plus decoding the compact
+format. Decoded documents are checked against the originals.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_chat_storage --documents 2000
+"""
+import argparse
+import copy
+import random
+import time
+import bson
+from app.chat_storage import ChatHistoryCodec, zstandard
+from app.thesis_catalog import pro_contra_block, thesis_catalog
+
+# Turn texts are drawn from the vocabulary of the real arguments, so they compress like German prose would
+WORDS = sorted({word for thesis in thesis_catalog if thesis.in_study for word in f"{thesis.pro} {thesis.contra}".split()})
+
+
+def text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def corpus(documents: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    theses = [thesis for thesis in thesis_catalog if thesis.in_study]
+    records = []
+    for i in range(documents):
+        thesis = rng.choice(theses)
+        group = "ABC"[i % 3]
+        history = [{"role": "assistant", "content": pro_contra_block(thesis.pro, thesis.contra) + text(rng, 120)}]
+        for _ in range(rng.randint(2, 6) if group == "B" else 0):
+            history.append({"role": "user", "content": text(rng, rng.randint(8, 40))})
+            history.append({"role": "assistant", "content": text(rng, rng.randint(80, 250))})
+        records.append({
+            "prolificPid": f"pid{i:06d}", "group": group, "thesisId": thesis.id, "thesisTitle": thesis.title,
+            "thesisText": thesis.text, "run": 1, "initialPosition": rng.randint(0, 100), "initialInformation": 50,
+            "initialStatement": text(rng, 20), "chatHistory": history, "finalPosition": rng.randint(0, 100),
+            "finalInformation": 70, "timestamps": {"iframeOpen": 1, "chatStart": 2, "chatEnd": 3, "completion": 4},
+            "totalTimeSeconds": 600.0, "chatTimeSeconds": 480.0
+        })
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--min-compress-bytes", type=int, default=512)
+    parser.add_argument("--level", type=int, default=3)
+    args = parser.parse_args()
+
+    records = corpus(args.documents)
+    plain = [bson.encode(record) for record in records]
+
+    writer = ChatHistoryCodec(enabled=True, min_compress_bytes=args.min_compress_bytes, level=args.level)
+    started = time.perf_counter()
+    encoded = []
+    for record in records:
+        document = copy.deepcopy(record)
+        writer.encode(document)
+        encoded.append(document)
+    encode_us = (time.perf_counter() - started) / len(records) * 1e6
+    compact = [bson.encode(document) for document in encoded]
+
+    # A fresh codec, so block texts are resolved through the catalog as after a restart
+    reader = ChatHistoryCodec(enabled=True)
+    started = time.perf_counter()
+    for data in plain:
+        bson.decode(data)
+    plain_read_us = (time.perf_counter() - started) / len(records) * 1e6
+    started = time.perf_counter()
+    decoded = []
+    for data in compact:
+        document = bson.decode(data)
+        assert not reader.missing_blocks(document)
+        decoded.append(reader.decode(document))
+    compact_read_us = (time.perf_counter() - started) / len(records) * 1e6
+    mismatches = sum(document["chatHistory"] != record["chatHistory"] for document, record in zip(decoded, records))
+
+    plain_size, compact_size = sum(map(len, plain)), sum(map(len, compact))
+    print(f"{len(records)} submissions, {sum(len(record['chatHistory']) for record in records)} turns, "
+          f"zstd {'level ' + str(args.level) if zstandard else 'not installed'}")
+    print(f"{'format':<10} {'MB':>8} {'KB/doc':>8} {'read us':>9} {'encode us':>10}")
+    print(f"{'plain':<10} {plain_size / 2**20:>8.2f} {plain_size / len(records) / 1024:>8.2f} {plain_read_us:>9.1f} {'':>10}")
+    print(f"{'compact':<10} {compact_size / 2**20:>8.2f} {compact_size / len(records) / 1024:>8.2f} {compact_read_us:>9.1f} {encode_us:>10.1f}")
+    print(f"size {compact_size / plain_size - 1:+.0%}, read time {compact_read_us / plain_read_us - 1:+.0%}, "
+          f"{mismatches} documents decoded differently")
+
+
+if __name__ == "__main__":
+    main()
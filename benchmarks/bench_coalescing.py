@@ -0,0 +1,124 @@
+"""Single-flight coalescing of concurrent identical Group A first replies.
+
+Starts a local fake chat completion server, fires N concurrent
+generate_group_a_response calls with identical inputs and counts the
+upstream calls, with and without coalescing, and with use_cache off,
+which opts a call out of coalescing. Then checks that an
+upstream error reaches every waiter and that the upstream call is
+cancelled once all waiters are gone.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_coalescing --participants 50
+"""
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+
+# Point the app at the fake server before app modules read the environment
+PORT = None
+with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    PORT = s.getsockname()[1]
+os.environ["OPENAI_API_KEY"] = "sk-bench"
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ.setdefault("MONGODB_URI", "mongodb://127.0.0.1:27017")
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app import api_interface
+from app.precomputed import precomputed_replies
+from app.response_cache import response_cache
+from app.single_flight import single_flight
+from app.thesis_data import THESIS_DATA
+
+fake = FastAPI()
+upstream = {"calls": 0, "fail": False, "latency": 0.5}
+
+
+@fake.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    upstream["calls"] += 1
+    await asyncio.sleep(upstream["latency"])
+    if upstream["fail"]:
+        # 400 is not retried by the client, so every waiter sees exactly one failure
+        return JSONResponse({"error": {"message": "fake upstream failure", "type": "invalid_request_error"}}, status_code=400)
+    return {
+        "id": "fake", "object": "chat.completion", "created": 0, "model": body["model"],
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "Persönliche Antwort"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+    }
+
+
+def serve() -> None:
+    server = uvicorn.Server(uvicorn.Config(fake, host="127.0.0.1", port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+
+def arguments(pid: int, use_cache: bool = True) -> dict:
+    data = THESIS_DATA["1"]
+    return dict(
+        thesis_text=data["thesis_text"], position=50, user_statement="",
+        pro_text=data["pro"], contra_text=data["contra"],
+        prolific_pid=f"pid{pid}", thesis_id=1, use_cache=use_cache
+    )
+
+
+async def burst(participants: int, use_cache: bool = True):
+    upstream["calls"] = 0
+    start = time.perf_counter()
+    results = await asyncio.gather(*(api_interface.generate_group_a_response(**arguments(i, use_cache)) for i in range(participants)))
+    return time.perf_counter() - start, upstream["calls"], results
+
+
+async def run(participants: int) -> None:
+    # Only coalescing may merge the calls
+    response_cache.enabled = precomputed_replies.enabled = False
+    print(f"{'coalescing':<14} {'participants':>12} {'upstream calls':>15} {'seconds':>8}")
+    for enabled in (False, True):
+        single_flight.enabled = enabled
+        seconds, calls, results = await burst(participants)
+        assert all(result["role"] == "assistant" for result in results), results
+        print(f"{'on' if enabled else 'off':<14} {participants:>12} {calls:>15} {seconds:>8.2f}")
+    assert calls == 1, f"expected one coalesced upstream call, got {calls}"
+    seconds, calls, _ = await burst(participants, use_cache=False)
+    print(f"{'use_cache off':<14} {participants:>12} {calls:>15} {seconds:>8.2f}")
+    assert calls == participants, f"expected {participants} upstream calls with use_cache off, got {calls}"
+
+    # Every waiter gets the upstream error
+    upstream["fail"] = True
+    _, calls, results = await burst(participants)
+    upstream["fail"] = False
+    assert calls == 1 and all(result["role"] == "error" for result in results), results
+    print(f"error propagated to {len(results)} waiters from {calls} upstream call")
+
+    # Cancelling every waiter cancels the shared call
+    upstream["calls"] = 0
+    waiters = [asyncio.create_task(api_interface.generate_group_a_response(**arguments(i))) for i in range(participants)]
+    await asyncio.sleep(upstream["latency"] / 5)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.sleep(0.1)
+    assert single_flight.stats()["in_flight"] == 0, single_flight.stats()
+    print(f"all waiters cancelled: {upstream['calls']} upstream call, in flight afterwards: {single_flight.stats()['in_flight']}")
+    print(f"single flight stats: {single_flight.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--participants", type=int, default=50)
+    args = parser.parse_args()
+    serve()
+    asyncio.run(run(args.participants))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Cold-start time of the app while MongoDB is slow or unreachable.
+
+Starts `uvicorn app.main:app` as a subprocess and measures how long it takes
+until the index page is served and until /health/ready reports 200. MongoDB
+is simulated as one of:
+
+- blackhole: a local port that accepts connections and never answers,
+  like a slow or cold cluster;
+- down: a closed port;
+- none: no MONGODB_URI at all.
+
+With --ref the same measurement runs against another git revision checked
+out into a temporary worktree, e.g. the commit before lazy startup:
+
+    python -m benchmarks.bench_cold_start --mongo blackhole --ref HEAD~1
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import httpx
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def blackhole() -> int:
+    """Port of a listener that accepts connections and never replies"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(128)
+    connections = []
+
+    def accept():
+        while True:
+            connection, _ = server.accept()
+            connections.append(connection)
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def mongodb_uri(mode: str, blackhole_port: int):
+    if mode == "blackhole":
+        return f"mongodb://127.0.0.1:{blackhole_port}/?directConnection=true"
+    if mode == "down":
+        return f"mongodb://127.0.0.1:{free_port()}/?directConnection=true"
+    return None
+
+
+def import_seconds(tree: str, env: dict) -> str:
+    code = "import time; started = time.perf_counter(); import app.main; print(time.perf_counter() - started)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=tree, env=env, capture_output=True, text=True, timeout=60)
+    return f"{float(result.stdout.strip()):.2f}s" if result.returncode == 0 else "failed"
+
+
+def cold_start(tree: str, env: dict, timeout: float) -> dict:
+    """Seconds from process start until / is served and until /health/ready is 200"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "critical"],
+        cwd=tree, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    result = {"index": None, "ready": None, "exited": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while time.perf_counter() - started < timeout and result["ready"] is None:
+                if process.poll() is not None:
+                    result["exited"] = time.perf_counter() - started
+                    break
+                try:
+                    if result["index"] is None and client.get("/").status_code == 200:
+                        result["index"] = time.perf_counter() - started
+                    if client.get("/health/ready").status_code == 200:
+                        result["ready"] = time.perf_counter() - started
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return result
+
+
+def measure(tree: str, env: dict, runs: int, timeout: float) -> dict:
+    results = [cold_start(tree, env, timeout) for _ in range(runs)]
+
+    def median(key):
+        values = [result[key] for result in results if result[key] is not None]
+        return f"{statistics.median(values):.2f}s ({len(values)}/{runs})" if values else "never"
+
+    return {"import app.main": import_seconds(tree, env), "index served": median("index"),
+            "ready": median("ready"), "process exited": median("exited")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo", choices=("blackhole", "down", "none"), default="blackhole")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=15.0, help="seconds to wait for each start")
+    parser.add_argument("--ref", help="also measure this git revision, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    env = {key: value for key, value in os.environ.items() if key not in ("MONGODB_URI", "PYTHONPATH")}
+    env["OPENAI_API_KEY"] = env.get("OPENAI_API_KEY", "sk-offline")
+    uri = mongodb_uri(args.mongo, blackhole())
+    if uri:
+        env["MONGODB_URI"] = uri
+
+    trees = {"working tree": os.getcwd()}
+    worktree = None
+    if args.ref:
+        worktree = tempfile.mkdtemp(prefix="cold-start-")
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, args.ref], check=True, capture_output=True)
+        trees[args.ref] = worktree
+
+    try:
+        print(f"MongoDB: {args.mongo}, {args.runs} runs, median seconds after process start (successful runs)")
+        print(f"{'tree':<16} {'import app.main':>16} {'index served':>16} {'ready':>16} {'process exited':>16}")
+        for name, tree in trees.items():
+            row = measure(tree, env, args.runs, args.timeout)
+            print(f"{name:<16} " + " ".join(f"{value:>16}" for value in row.values()))
+    finally:
+        if worktree:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], check=False, capture_output=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Concurrent chat completions overlap instead of queueing.
+
+Starts a local fake chat completion server that answers every call after
+a fixed latency and records how many calls it is serving at once, then
+fires N concurrent generate_group_a_response calls with different
+statements, so neither single-flight coalescing nor the reply cache can
+merge them. The check fails unless all N calls were in flight upstream
+at the same time and the burst finished in roughly the time of one call.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_concurrency --participants 10 --latency 1
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+
+# Point the app at the fake server before app modules read the environment
+PORT = None
+with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    PORT = s.getsockname()[1]
+os.environ["OPENAI_API_KEY"] = "sk-bench"
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ.setdefault("MONGODB_URI", "mongodb://127.0.0.1:27017")
+
+import uvicorn
+from fastapi import FastAPI, Request
+from app import api_interface
+from app.single_flight import single_flight
+from app.thesis_data import THESIS_DATA
+
+fake = FastAPI()
+upstream = {"calls": 0, "active": 0, "peak": 0, "latency": 1.0}
+
+
+@fake.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    upstream["calls"] += 1
+    upstream["active"] += 1
+    upstream["peak"] = max(upstream["peak"], upstream["active"])
+    try:
+        await asyncio.sleep(upstream["latency"])
+    finally:
+        upstream["active"] -= 1
+    return {
+        "id": "fake", "object": "chat.completion", "created": 0, "model": body["model"],
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "Persönliche Antwort"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+    }
+
+
+def serve() -> None:
+    server = uvicorn.Server(uvicorn.Config(fake, host="127.0.0.1", port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+
+def arguments(pid: int) -> dict:
+    data = THESIS_DATA["1"]
+    return dict(
+        thesis_text=data["thesis_text"], position=50, user_statement=f"Meinung {pid}",
+        pro_text=data["pro"], contra_text=data["contra"],
+        prolific_pid=f"pid{pid}", thesis_id=1, use_cache=False
+    )
+
+
+async def run(participants: int, latency: float) -> bool:
+    upstream["latency"] = latency
+    single_flight.enabled = False
+    # One warm-up call opens the client's connection pool outside of the measurement
+    await api_interface.generate_group_a_response(**arguments(-1))
+    upstream.update(calls=0, peak=0)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(api_interface.generate_group_a_response(**arguments(i)) for i in range(participants)))
+    seconds = time.perf_counter() - start
+
+    errors = [result for result in results if result["role"] != "assistant"]
+    print(f"{'participants':>12} {'upstream calls':>15} {'peak in flight':>15} {'seconds':>8} {'one call':>9}")
+    print(f"{participants:>12} {upstream['calls']:>15} {upstream['peak']:>15} {seconds:>8.2f} {latency:>9.2f}")
+    ok = True
+    if errors:
+        print(f"FAIL: {len(errors)} calls failed, e.g. {errors[0]}")
+        ok = False
+    if upstream["peak"] != participants:
+        print(f"FAIL: only {upstream['peak']} of {participants} calls were in flight at once")
+        ok = False
+    # Generous slack for scheduling and the client, serialized calls would take participants * latency
+    if seconds > 2 * latency:
+        print(f"FAIL: the burst took {seconds:.2f} s, more than twice the {latency:.2f} s of one call")
+        ok = False
+    if ok:
+        print("OK: concurrent sessions finished in about the time of one")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--participants", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds the fake server takes per call")
+    args = parser.parse_args()
+    serve()
+    sys.exit(0 if asyncio.run(run(args.participants, args.latency)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Time and memory profile of the /download CSV export through DatabaseManager.
+
+Stores N synthetic study records in the in-memory MongoDB stand-in with
+DatabaseManager.save_many, so they are written the way submissions are,
+then gives every cursor batch a simulated round trip and streams the export
+the way /download does: iter_study_data with its projection and batch size
+into app.export.iter_csv. Resident set size is sampled while the export
+runs, once per batch size. Finally it repeats the export the old way
+(get_all_study_data, then a CSV built in a StringIO and re-encoded).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_export --records 20000 --latency 0.005 --batch-sizes 100,500,2000
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import time
+
+os.environ.setdefault("MONGODB_URI", "mongodb://127.0.0.1:27017")
+
+from app.database import DatabaseManager
+from app.export import CSV_HEADERS, iter_csv, record_to_row
+from benchmarks.fake_mongo import InMemoryMongoClient
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB (Linux)"""
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def synthetic_record(i: int, turns: int) -> dict:
+    chat_history = []
+    for turn in range(turns):
+        chat_history.append({"role": "user", "content": f"Nachricht {turn} von Teilnehmer {i}. " * 5})
+        chat_history.append({"role": "assistant", "content": f"Antwort {turn} mit Fakten und Perspektiven. " * 40})
+    return {
+        "prolificPid": f"pid{i:08d}", "group": "ABC"[i % 3], "thesisId": (1, 4, 5)[i % 3],
+        "thesisTitle": "Tempolimit auf Autobahnen", "thesisText": "Auf allen Autobahnen soll ein generelles Tempolimit gelten.",
+        "run": 1, "initialPosition": i % 101, "initialInformation": 50, "initialStatement": "Begründung " * 20,
+        "chatHistory": chat_history, "finalPosition": (i * 7) % 101, "finalInformation": 60,
+        "timestamps": {"iframeOpen": 1700000000000 + i, "chatStart": 1700000060000 + i, "chatEnd": 1700000600000 + i, "completion": 1700000700000 + i},
+        "totalTimeSeconds": 700.0, "chatTimeSeconds": 540.0
+    }
+
+
+async def seeded_manager(count: int, turns: int, latency: float) -> DatabaseManager:
+    manager = DatabaseManager(client=InMemoryMongoClient())
+    await manager.ensure_indexes()
+    for start in range(0, count, 1000):
+        await manager.save_many([synthetic_record(i, turns) for i in range(start, min(start + 1000, count))])
+    # Round trips only for the export, seeding is not measured
+    for collection in (manager.collection, manager.chat_blocks):
+        collection.latency = latency
+    return manager
+
+
+async def sampled(records, count: int, samples: list):
+    i = 0
+    async for record in records:
+        if i % (count // 20 or 1) == 0:
+            samples.append(rss_mb())
+        i += 1
+        yield record
+
+
+async def streaming_export(manager: DatabaseManager, count: int, batch_size: int) -> tuple:
+    samples = []
+    size = 0
+    async for chunk in iter_csv(sampled(manager.iter_study_data(batch_size=batch_size), count, samples)):
+        size += len(chunk)
+    samples.append(rss_mb())
+    return size, samples
+
+
+async def materialized_export(manager: DatabaseManager) -> tuple:
+    records = await manager.get_all_study_data()
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=CSV_HEADERS)
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record_to_row(record))
+    csv_content = output.getvalue()
+    body = io.BytesIO(('\ufeff' + csv_content).encode('utf-8'))
+    return len(body.getvalue()), rss_mb()
+
+
+async def run(args) -> None:
+    manager = await seeded_manager(args.records, args.turns, args.latency)
+    baseline = rss_mb()
+    print(f"{args.records} records stored, RSS {baseline:.1f} MB, {args.latency * 1000:.0f} ms per cursor batch")
+    print(f"{'export':>12} {'batch size':>10} {'CSV MB':>8} {'seconds':>8} {'RSS max +MB':>12}")
+
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        started = time.perf_counter()
+        size, samples = await streaming_export(manager, args.records, batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"{'streaming':>12} {batch_size:>10} {size / 1024 / 1024:>8.1f} {elapsed:>8.2f} {max(samples) - baseline:>12.1f}")
+
+    if not args.skip_materialized:
+        started = time.perf_counter()
+        size, peak = await materialized_export(manager)
+        elapsed = time.perf_counter() - started
+        print(f"{'materialized':>12} {'all':>10} {size / 1024 / 1024:>8.1f} {elapsed:>8.2f} {peak - baseline:>12.1f}")
+
+    await manager.close_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per record")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds of every simulated cursor batch round trip")
+    parser.add_argument("--batch-sizes", default="100,500,2000", help="comma separated cursor batch sizes to compare")
+    parser.add_argument("--skip-materialized", action="store_true", help="only run the streaming export")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Parse and serialize cost of the chat payloads per turn.
+
+For 5, 50 and 200 message histories, times what a Group B continue and a
+study submission cost outside of the network and the model call: decoding
+the request body, validating it into the request model and rendering the
+JSON reply (plus 200 server-sent events for streamed replies). The old
+List[dict] models with the standard JSON decoder and encoder are compared
+with the typed, length-bounded messages, the orjson request body decoding
+of FastJSONRoute and the orjson response class.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_payloads
+"""
+import argparse
+import json
+import timeit
+from typing import List, Optional
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from app.main import StudyContinueRequest, StudySubmissionRequest
+from app.payloads import FastJSONResponse, dumps, orjson
+
+
+class OldStudyContinueRequest(BaseModel):
+    thesis_id: int
+    initial_position: int
+    initial_statement: str
+    history: Optional[List[dict]] = None
+    session_id: Optional[str] = None
+    message: Optional[str] = None
+    prolific_pid: Optional[str] = None
+    stream: bool = False
+
+
+class OldStudySubmissionRequest(BaseModel):
+    prolificPid: str
+    group: str
+    thesisId: int
+    thesisTitle: str
+    thesisText: str
+    run: int
+    initialPosition: int
+    initialInformation: int
+    initialStatement: str
+    chatHistory: List[dict]
+    finalPosition: int
+    finalInformation: int
+    timestamps: dict
+    totalTimeSeconds: float = None
+    chatTimeSeconds: float = None
+
+
+def history(messages: int) -> List[dict]:
+    return [
+        {"role": "user", "content": f"Frage {i}: Welche Belege gibt es für diese Position? " * 3} if i % 2 == 0
+        else {"role": "assistant", "content": f"Antwort {i} mit Fakten, Perspektiven und Quellen zur These. " * 20}
+        for i in range(messages)
+    ]
+
+
+def bodies(messages: int) -> tuple:
+    chat = history(messages)
+    continue_body = {"thesis_id": 4, "initial_position": 30, "initial_statement": "Ich bin eher dagegen.",
+                     "history": chat, "prolific_pid": "pid000001"}
+    submission = {
+        "prolificPid": "pid000001", "group": "B", "thesisId": 4, "thesisTitle": "Tempolimit auf Autobahnen",
+        "thesisText": "Auf allen Autobahnen soll ein generelles Tempolimit gelten.", "run": 1,
+        "initialPosition": 30, "initialInformation": 50, "initialStatement": "Ich bin eher dagegen.",
+        "chatHistory": chat, "finalPosition": 40, "finalInformation": 70,
+        "timestamps": {"iframeOpen": 1, "chatStart": 2, "chatEnd": 3, "completion": 4},
+        "totalTimeSeconds": 600.0, "chatTimeSeconds": 480.0
+    }
+    return json.dumps(continue_body).encode("utf-8"), json.dumps(submission).encode("utf-8")
+
+
+# What FastJSONRequest.json() does
+loads = orjson.loads if orjson is not None else json.loads
+
+REPLY = {"role": "assistant", "content": "Antwort mit Fakten, Perspektiven und Quellen zur These. " * 20}
+SUBMITTED = {"success": True, "message": "Study data saved successfully"}
+EVENTS = [{"role": "assistant", "content": "Wort "} for _ in range(200)]
+
+
+def variants(continue_body: bytes, submission_body: bytes) -> dict:
+    # The same steps FastAPI runs: decoding the body, model validation, jsonable_encoder and the response class
+    return {
+        "continue": {
+            "before": lambda: (OldStudyContinueRequest.model_validate(json.loads(continue_body)),
+                               JSONResponse(jsonable_encoder(REPLY)).body),
+            "after": lambda: (StudyContinueRequest.model_validate(loads(continue_body)),
+                              FastJSONResponse(jsonable_encoder(REPLY)).body)
+        },
+        "continue, streamed reply": {
+            "before": lambda: (OldStudyContinueRequest.model_validate(json.loads(continue_body)),
+                               [f"data: {json.dumps(event, ensure_ascii=False)}\n\n" for event in EVENTS]),
+            "after": lambda: (StudyContinueRequest.model_validate(loads(continue_body)),
+                              [f"data: {dumps(event)}\n\n" for event in EVENTS])
+        },
+        "submit": {
+            "before": lambda: (OldStudySubmissionRequest.model_validate(json.loads(submission_body)).dict(),
+                               JSONResponse(jsonable_encoder(SUBMITTED)).body),
+            "after": lambda: (StudySubmissionRequest.model_validate(loads(submission_body)).dict(),
+                              FastJSONResponse(jsonable_encoder(SUBMITTED)).body)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="5,50,200", help="history lengths in messages")
+    parser.add_argument("--number", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'route':<26} {'messages':>8} {'body KB':>8} {'before us':>10} {'after us':>10} {'change':>8}")
+    for messages in (int(size) for size in args.sizes.split(",")):
+        continue_body, submission_body = bodies(messages)
+        for route, variant in variants(continue_body, submission_body).items():
+            size = len(submission_body if route == "submit" else continue_body) / 1024
+            before, after = (
+                min(timeit.repeat(variant[name], number=args.number, repeat=7)) / args.number * 1e6
+                for name in ("before", "after")
+            )
+            print(f"{route:<26} {messages:>8} {size:>8.1f} {before:>10.1f} {after:>10.1f} {after / before - 1:>+8.0%}")
+
+
+if __name__ == "__main__":
+    main()
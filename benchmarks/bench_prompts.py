@@ -0,0 +1,40 @@
+"""Per-request system prompt assembly cost: f-string rebuild vs PromptRegistry.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_prompts
+"""
+import timeit
+from app.prompts import build_system_prompt, load_prompt_registry, position_bucket
+from app.thesis_data import THESIS_DATA
+
+ROUNDS = 100_000
+
+
+def main():
+    registry = load_prompt_registry()
+    requests = [
+        (group, int(thesis_id), position, data)
+        for thesis_id, data in THESIS_DATA.items()
+        for group in ("A", "B", "C")
+        for position in (20, 80)
+    ]
+
+    def rebuild():
+        for group, _, position, data in requests:
+            build_system_prompt(group, data["thesis_text"], data["pro"], data["contra"], position_bucket(group, position))
+
+    def lookup():
+        for group, thesis_id, position, data in requests:
+            registry.system_prompt(group, thesis_id, position, data["thesis_text"], data["pro"], data["contra"])
+
+    print(f"{'variant':<10} {'ns/request':>12}")
+    for name, func in (("rebuild", rebuild), ("registry", lookup)):
+        seconds = min(timeit.repeat(func, number=ROUNDS // len(requests), repeat=5))
+        per_request = seconds / ((ROUNDS // len(requests)) * len(requests)) * 1e9
+        print(f"{name:<10} {per_request:>12.1f}")
+    print(f"registry stats: {registry.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Checks of the async data-access layer against the in-memory MongoDB stand-in.
+
+Runs DatabaseManager's save, fetch, count and close operations on
+benchmarks.fake_mongo and checks the result dicts routes rely on: a saved
+submission, an ignored double submit and the error dict of a failed
+write. With a simulated round trip per operation it then saves a burst
+of submissions while a ticker measures how late the event loop runs,
+so a write that blocked the loop would show up as lag. Finally it checks
+that pool and timeout options in MONGODB_URI are only overridden by
+environment variables that are set, and that the app defaults fill in
+the rest. Exits non-zero if a check fails.
+
+Run from the repository root:
+
+    python -m benchmarks.check_database --submissions 50 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("MONGODB_URI", "mongodb://127.0.0.1:27017")
+
+from pymongo import AsyncMongoClient
+from app.database import CLIENT_OPTIONS, DatabaseManager
+from benchmarks.fake_mongo import InMemoryMongoClient
+
+failures = []
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def submission(pid: int) -> dict:
+    return {
+        "prolificPid": f"pid{pid:06d}", "group": "B", "thesisId": 4, "thesisTitle": "Tempolimit auf Autobahnen",
+        "thesisText": "Auf allen Autobahnen soll ein generelles Tempolimit gelten.", "run": 1,
+        "initialPosition": 30, "initialInformation": 50, "initialStatement": "Ich bin eher dagegen.",
+        "chatHistory": [{"role": "assistant", "content": "PRO und KONTRA"}, {"role": "user", "content": "Warum?"}],
+        "finalPosition": 40, "finalInformation": 70,
+        "timestamps": {"iframeOpen": 1, "chatStart": 2, "chatEnd": 3, "completion": 4},
+        "totalTimeSeconds": 600.0, "chatTimeSeconds": 480.0
+    }
+
+
+class FailingCollection:
+    async def insert_one(self, document):
+        raise RuntimeError("simulated write failure")
+
+
+async def check_contract() -> None:
+    manager = DatabaseManager(client=InMemoryMongoClient())
+    await manager.ensure_indexes()
+
+    result = await manager.save_study_data(submission(1))
+    check(result.get("success") is True and "document_id" in result, f"save_study_data stores a submission: {result}")
+    result = await manager.save_study_data(submission(1))
+    check(result == {"success": True, "message": "Study data was already submitted"}, f"a double submit is ignored: {result}")
+    inserted = await manager.save_many([submission(1), submission(2), submission(3)])
+    check(inserted == 2, f"save_many skips stored submissions: {inserted} inserted")
+
+    data = await manager.get_all_study_data()
+    check(len(data) == 3 and all("_id" not in record and "createdAt" not in record for record in data),
+          f"get_all_study_data returns {len(data)} records without _id and createdAt")
+    check(data[0]["chatHistory"] == submission(1)["chatHistory"], "chat histories read back unchanged")
+    count = await manager.get_study_count()
+    check(count == 3, f"get_study_count counts {count} submissions")
+
+    collection, manager.collection = manager.collection, FailingCollection()
+    result = await manager.save_study_data(submission(4))
+    manager.collection = collection
+    check(set(result) == {"error"} and "simulated write failure" in result["error"], f"a failed write returns an error dict: {result}")
+
+    await manager.close_connection()
+
+
+async def check_concurrency(submissions: int, latency: float) -> None:
+    manager = DatabaseManager(client=InMemoryMongoClient(latency=latency))
+    lag = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal lag
+        interval = 0.01
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(lag, time.perf_counter() - start - interval)
+
+    ticking = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(manager.save_study_data(submission(i)) for i in range(submissions)))
+    seconds = time.perf_counter() - start
+    running = False
+    await ticking
+
+    check(all(result.get("success") for result in results), f"{submissions} concurrent submissions saved")
+    check(seconds < 2 * latency, f"they took {seconds:.2f} s with a {latency:.2f} s round trip each")
+    check(lag < 0.05, f"event loop lag during the writes: {lag * 1000:.1f} ms")
+    await manager.close_connection()
+
+
+async def check_client_options() -> None:
+    saved = {name: os.environ.pop(name, None) for name, _ in CLIENT_OPTIONS.values()}
+    os.environ["MONGODB_URI"] = "mongodb://127.0.0.1:27017/?maxPoolSize=7&socketTimeoutMS=1234"
+    try:
+        manager = DatabaseManager()
+        pool = manager.client.options.pool_options
+        check(pool.max_pool_size == 7 and pool.socket_timeout == 1.234,
+              f"options from MONGODB_URI are kept: maxPoolSize={pool.max_pool_size}, socket timeout={pool.socket_timeout} s")
+        await manager.close_connection()
+
+        os.environ["MONGODB_MAX_POOL_SIZE"] = "9"
+        manager = DatabaseManager()
+        pool = manager.client.options.pool_options
+        check(pool.max_pool_size == 9 and pool.socket_timeout == 1.234,
+              f"MONGODB_MAX_POOL_SIZE overrides only maxPoolSize: maxPoolSize={pool.max_pool_size}, socket timeout={pool.socket_timeout} s")
+        check(isinstance(manager.client, AsyncMongoClient), "the real client is used without an injected one")
+        await manager.close_connection()
+
+        os.environ.pop("MONGODB_MAX_POOL_SIZE")
+        os.environ["MONGODB_URI"] = "mongodb://127.0.0.1:27017"
+        manager = DatabaseManager()
+        pool = manager.client.options.pool_options
+        selection = manager.client.options.server_selection_timeout
+        check((pool.max_pool_size, pool.socket_timeout, pool.wait_queue_timeout, selection) == (50, 20.0, 5.0, 5.0),
+              f"a plain MONGODB_URI gets the app defaults: maxPoolSize={pool.max_pool_size}, socket timeout={pool.socket_timeout} s, "
+              f"wait queue timeout={pool.wait_queue_timeout} s, server selection timeout={selection} s")
+        await manager.close_connection()
+    finally:
+        for name, value in saved.items():
+            os.environ.pop(name, None)
+            if value is not None:
+                os.environ[name] = value
+
+
+async def run(args) -> None:
+    await check_contract()
+    await check_concurrency(args.submissions, args.latency)
+    await check_client_options()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds of every simulated MongoDB round trip")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+    print(f"{len(failures)} checks failed" if failures else "all checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""In-memory stand-in for the parts of pymongo's AsyncMongoClient the app uses.
+
+Supports insert_one/insert_many (with _id and unique index enforcement),
+find/find_one with equality, $and/$or and comparison filters, sort and
+projection, count_documents, update_one and bulk_write of UpdateOne with
+$set/$unset and upsert, create_index and the aggregation stages used by /stats.
+TTL indexes are accepted but never expire documents. latency delays every
+awaited insert, update, find_one and count like a network round trip, and
+every batch a find cursor fetches (batch_size, 101 documents by default).
+Meant for benchmarks, not as a general MongoDB emulation.
+
+    from benchmarks.fake_mongo import InMemoryMongoClient
+    db_manager.client = InMemoryMongoClient()
+    db_manager.connect()
+"""
+import asyncio
+import copy
+from datetime import datetime
+from types import SimpleNamespace
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+_MISSING = object()
+
+
+def _get(document, path):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _sortable(value):
+    """Sort key following MongoDB's cross-type comparison order"""
+    if value is _MISSING or value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (6, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, dict):
+        return (3, tuple((key, _sortable(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return (4, tuple(_sortable(item) for item in value))
+    if isinstance(value, ObjectId):
+        return (5, value.binary)
+    if isinstance(value, datetime):
+        return (7, value)
+    return (8, str(value))
+
+
+def _compare(value, operator, operand):
+    if operator == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if operator == "$ne":
+        return (None if value is _MISSING else value) != operand
+    if operator == "$in":
+        return (None if value is _MISSING else value) in operand
+    if operator == "$nin":
+        return (None if value is _MISSING else value) not in operand
+    if value is _MISSING:
+        return False
+    try:
+        if operator == "$eq":
+            return value == operand
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise OperationFailure(f"Unsupported query operator {operator}")
+
+
+def _matches(document, query) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(_matches(document, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(document, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            value = _get(document, key)
+            if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif _get(document, key) != condition:
+            return False
+    return True
+
+
+def _project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    included = [field for field, flag in projection.items() if flag and field != "_id"]
+    if included:
+        result = {field: copy.deepcopy(document[field]) for field in included if field in document}
+        if projection.get("_id", 1) and "_id" in document:
+            result["_id"] = document["_id"]
+        return result
+    return {field: copy.deepcopy(value) for field, value in document.items() if projection.get(field, 1)}
+
+
+def _sort(documents, spec):
+    if isinstance(spec, dict):
+        spec = list(spec.items())
+    # Stable sorts from the least to the most significant key
+    for field, direction in reversed(spec):
+        documents.sort(key=lambda document: _sortable(_get(document, field)), reverse=direction < 0)
+    return documents
+
+
+def _index_keys(keys):
+    return [(keys, 1)] if isinstance(keys, str) else list(keys)
+
+
+def _evaluate(expression, document):
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get(document, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, dict):
+        if "$subtract" in expression:
+            left, right = (_evaluate(item, document) for item in expression["$subtract"])
+            return left - right if isinstance(left, (int, float)) and isinstance(right, (int, float)) else None
+        return {key: _evaluate(item, document) for key, item in expression.items()}
+    return expression
+
+
+def _group(documents, spec):
+    groups = {}
+    for document in documents:
+        group_id = _evaluate(spec["_id"], document)
+        key = _sortable(group_id)
+        if key not in groups:
+            groups[key] = (group_id, [])
+        groups[key][1].append(document)
+
+    results = []
+    for group_id, members in groups.values():
+        row = {"_id": group_id}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (operator, expression), = accumulator.items()
+            values = [_evaluate(expression, member) for member in members]
+            numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+            if operator == "$sum":
+                row[field] = sum(numbers)
+            elif operator == "$avg":
+                row[field] = sum(numbers) / len(numbers) if numbers else None
+            elif operator == "$min":
+                row[field] = min(numbers) if numbers else None
+            elif operator == "$max":
+                row[field] = max(numbers) if numbers else None
+            else:
+                raise OperationFailure(f"Unsupported accumulator {operator}")
+        results.append(row)
+    return results
+
+
+def _aggregate(documents, pipeline):
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            documents = [document for document in documents if _matches(document, spec)]
+        elif name == "$sort":
+            documents = _sort(documents, spec)
+        elif name == "$project":
+            documents = [_project(document, spec) for document in documents]
+        elif name == "$limit":
+            documents = documents[:spec]
+        elif name == "$group":
+            documents = _group(documents, spec)
+        elif name == "$facet":
+            documents = [{facet: _aggregate(list(documents), stages) for facet, stages in spec.items()}]
+        else:
+            raise OperationFailure(f"Unsupported aggregation stage {name}")
+    return documents
+
+
+class InMemoryCursor:
+    """Fetches documents in batches of batch_size, one latency round trip per batch"""
+
+    def __init__(self, documents, projection=None, latency=0.0, copy_documents=True):
+        self._documents = documents
+        self._projection = projection
+        self._latency = latency
+        self._copy = copy_documents
+        # pymongo's server default for the first batch
+        self._batch_size = 101
+
+    def sort(self, key_or_list, direction=None):
+        spec = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else key_or_list
+        self._documents = _sort(self._documents, spec)
+        return self
+
+    def limit(self, count):
+        if count:
+            self._documents = self._documents[:count]
+        return self
+
+    def batch_size(self, size):
+        if size:
+            self._batch_size = size
+        return self
+
+    def _output(self, document):
+        return _project(document, self._projection) if self._copy else document
+
+    async def to_list(self, length=None):
+        return [document async for document in self._iterate(length)]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self, length=None):
+        documents = self._documents[:length] if length else self._documents
+        # Projection happens per batch, so only the batch in flight is copied
+        for start in range(0, max(len(documents), 1), self._batch_size):
+            if self._latency:
+                await asyncio.sleep(self._latency)
+            for document in documents[start:start + self._batch_size]:
+                yield self._output(document)
+
+
+class InMemoryCollection:
+    def __init__(self, name, latency=0.0):
+        self.name = name
+        self.latency = latency
+        self._documents = {}
+        # Unique index fields -> {key tuple: _id}
+        self._unique = {}
+
+    def _unique_key(self, fields, document):
+        return tuple(repr(_sortable(_get(document, field))) for field in fields)
+
+    def _insert(self, document):
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self._documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+        keys = {fields: self._unique_key(fields, document) for fields in self._unique}
+        for fields, key in keys.items():
+            if key in self._unique[fields]:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {'_'.join(fields)}", 11000)
+        for fields, key in keys.items():
+            self._unique[fields][key] = document["_id"]
+        self._documents[document["_id"]] = copy.deepcopy(document)
+        return document["_id"]
+
+    async def _round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def insert_one(self, document):
+        await self._round_trip()
+        return SimpleNamespace(inserted_id=self._insert(document), acknowledged=True)
+
+    async def insert_many(self, documents, ordered=True):
+        await self._round_trip()
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted.append(self._insert(document))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted, acknowledged=True)
+
+    def _find(self, filter, projection, sort, limit, latency):
+        matched = [document for document in self._documents.values() if _matches(document, filter)]
+        if sort:
+            matched = _sort(matched, sort)
+        if limit:
+            matched = matched[:limit]
+        return InMemoryCursor(matched, projection, latency)
+
+    def find(self, filter=None, projection=None, sort=None, limit=0):
+        return self._find(filter, projection, sort, limit, self.latency)
+
+    async def find_one(self, filter=None, projection=None, sort=None):
+        await self._round_trip()
+        documents = await self._find(filter, projection, sort, 1, 0.0).to_list()
+        return documents[0] if documents else None
+
+    async def count_documents(self, filter):
+        await self._round_trip()
+        return sum(1 for document in self._documents.values() if _matches(document, filter))
+
+    async def update_one(self, filter, update, upsert=False):
+        await self._round_trip()
+        for document in self._documents.values():
+            if _matches(document, filter):
+                document.update(copy.deepcopy(update.get("$set", {})))
+                for key in update.get("$unset", {}):
+                    document.pop(key, None)
+                return SimpleNamespace(matched_count=1, upserted_id=None)
+        if not upsert:
+            return SimpleNamespace(matched_count=0, upserted_id=None)
+        document = {key: value for key, value in filter.items() if not key.startswith("$") and not isinstance(value, dict)}
+        document.update(copy.deepcopy(update.get("$set", {})))
+        return SimpleNamespace(matched_count=0, upserted_id=self._insert(document))
+
+    async def bulk_write(self, requests, ordered=True):
+        """UpdateOne requests only"""
+        matched = upserted = 0
+        for request in requests:
+            result = await self.update_one(request._filter, request._doc, upsert=request._upsert)
+            matched += result.matched_count
+            upserted += result.upserted_id is not None
+        return SimpleNamespace(matched_count=matched, modified_count=matched, upserted_count=upserted, acknowledged=True)
+
+    async def create_index(self, keys, unique=False, **kwargs):
+        keys = _index_keys(keys)
+        fields = tuple(field for field, _ in keys)
+        if unique and fields not in self._unique:
+            index = {}
+            for document in self._documents.values():
+                key = self._unique_key(fields, document)
+                if key in index:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {'_'.join(fields)}", 11000)
+                index[key] = document["_id"]
+            self._unique[fields] = index
+        return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+    async def aggregate(self, pipeline):
+        documents = _aggregate([copy.deepcopy(document) for document in self._documents.values()], pipeline)
+        return InMemoryCursor(documents, copy_documents=False)
+
+
+class InMemoryDatabase:
+    def __init__(self, name, latency=0.0):
+        self.name = name
+        self.latency = latency
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(name, self.latency)
+        return self._collections[name]
+
+    async def command(self, command, *args, **kwargs):
+        # ping succeeds; explain reports no plan, so the query plan check stays quiet
+        return {"ok": 1.0}
+
+
+class InMemoryMongoClient:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._databases = {}
+        self.admin = self["admin"]
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = InMemoryDatabase(name, self.latency)
+        return self._databases[name]
+
+    async def close(self):
+        pass
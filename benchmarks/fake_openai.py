@@ -0,0 +1,205 @@
+"""OpenAI-compatible chat completion stub with configurable latency.
+
+Time to first token is log-normally distributed around --ttfb-ms, the
+completion length is drawn around --completion-tokens and tokens are
+emitted at a jittered --tokens-per-second, so streamed and non-streamed
+calls see realistic timing. --error-rate answers a share of the calls
+with a 500. Usage (including stream_options.include_usage) is reported
+with a ~4 characters per token estimate.
+
+The Files and Batches endpoints used by app.pregenerate are emulated in
+memory. A batch completes --batch-seconds after it was created, and every
+request line is answered like a non-streamed completion, without the
+latency.
+
+    python -m benchmarks.fake_openai --port 8765 --ttfb-ms 400 --tokens-per-second 60
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+app = FastAPI()
+config = {
+    "ttfb_ms": 400.0,
+    "ttfb_sigma": 0.5,
+    "tokens_per_second": 60.0,
+    "completion_tokens": 250,
+    "error_rate": 0.0,
+    "batch_seconds": 2.0
+}
+files = {}
+batches = {}
+# Keeps running batch tasks referenced until they finish
+batch_tasks = set()
+WORDS = ("Die", "These", "hat", "gute", "Argumente", "auf", "beiden", "Seiten", "und", "Fakten", "zeigen", "dass")
+
+
+def _completion(body: dict, content: str, finish_reason="stop") -> dict:
+    return {"id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}]}
+
+
+def _chunk(body: dict, delta: dict, finish_reason=None) -> str:
+    chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": body["model"],
+             "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def _sample(body: dict):
+    """Random completion words and their usage for a request body"""
+    tokens = max(1, int(random.gauss(config["completion_tokens"], config["completion_tokens"] * 0.25)))
+    words = [random.choice(WORDS) for _ in range(tokens)]
+    usage = {
+        "prompt_tokens": sum(len(message.get("content") or "") for message in body["messages"]) // 4 + 1,
+        "completion_tokens": tokens,
+    }
+    usage["total_tokens"] = usage["prompt_tokens"] + tokens
+    return words, usage
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if random.random() < config["error_rate"]:
+        return JSONResponse({"error": {"message": "Injected upstream failure", "type": "server_error"}}, status_code=500)
+
+    ttfb = random.lognormvariate(math.log(config["ttfb_ms"] / 1000), config["ttfb_sigma"])
+    rate = max(1.0, random.gauss(config["tokens_per_second"], config["tokens_per_second"] * 0.2))
+    words, usage = _sample(body)
+    tokens = len(words)
+
+    if not body.get("stream"):
+        await asyncio.sleep(ttfb + tokens / rate)
+        return {**_completion(body, " ".join(words)), "usage": usage}
+
+    async def events():
+        started = time.monotonic() + ttfb
+        await asyncio.sleep(ttfb)
+        yield _chunk(body, {"role": "assistant", "content": ""})
+        for i, word in enumerate(words):
+            # Pace against a schedule so sleep overhead does not accumulate
+            delay = started + (i + 1) / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield _chunk(body, {"content": word + " "})
+        yield _chunk(body, {}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'model': body['model'], 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _file_object(file_id: str) -> dict:
+    file = files[file_id]
+    return {"id": file_id, "object": "file", "bytes": len(file["content"]), "created_at": file["created_at"],
+            "filename": file["filename"], "purpose": file["purpose"], "status": "processed"}
+
+
+def _store_file(content: bytes, filename: str, purpose: str) -> str:
+    file_id = f"file-{uuid.uuid4().hex[:24]}"
+    files[file_id] = {"content": content, "filename": filename, "purpose": purpose, "created_at": int(time.time())}
+    return file_id
+
+
+@app.post("/v1/files")
+async def create_file(request: Request):
+    # Parse multipart/form-data with the standard library instead of requiring python-multipart
+    header = f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode("latin-1")
+    message = BytesParser(policy=HTTP).parsebytes(header + await request.body())
+    fields, content, filename = {}, b"", "upload.jsonl"
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name == "file":
+            content, filename = part.get_payload(decode=True), part.get_filename() or filename
+        else:
+            fields[name] = part.get_payload(decode=True).decode("utf-8")
+    return _file_object(_store_file(content, filename, fields.get("purpose", "batch")))
+
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str):
+    return PlainTextResponse(files[file_id]["content"].decode("utf-8"), media_type="application/jsonl")
+
+
+def _batch_line(line: dict) -> dict:
+    result = {"id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": line["custom_id"], "error": None}
+    if random.random() < config["error_rate"]:
+        result["response"] = {"status_code": 500, "request_id": uuid.uuid4().hex,
+                              "body": {"error": {"message": "Injected upstream failure", "type": "server_error"}}}
+    else:
+        words, usage = _sample(line["body"])
+        result["response"] = {"status_code": 200, "request_id": uuid.uuid4().hex,
+                              "body": {**_completion(line["body"], " ".join(words)), "usage": usage}}
+    return result
+
+
+async def _process_batch(batch_id: str) -> None:
+    batch = batches[batch_id]
+    lines = [json.loads(line) for line in files[batch["input_file_id"]]["content"].decode("utf-8").splitlines() if line.strip()]
+    batch.update(status="in_progress", in_progress_at=int(time.time()), request_counts={"total": len(lines), "completed": 0, "failed": 0})
+    await asyncio.sleep(config["batch_seconds"])
+    results = [_batch_line(line) for line in lines]
+    failed = sum(1 for result in results if result["response"]["status_code"] != 200)
+    output = "".join(json.dumps(result) + "\n" for result in results).encode("utf-8")
+    batch.update(
+        status="completed", completed_at=int(time.time()),
+        output_file_id=_store_file(output, f"{batch_id}_output.jsonl", "batch_output"),
+        request_counts={"total": len(lines), "completed": len(lines) - failed, "failed": failed}
+    )
+
+
+@app.post("/v1/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+    batches[batch_id] = {
+        "id": batch_id, "object": "batch", "endpoint": body["endpoint"], "errors": None,
+        "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+        "status": "validating", "output_file_id": None, "error_file_id": None,
+        "created_at": int(time.time()), "metadata": body.get("metadata"),
+        "request_counts": {"total": 0, "completed": 0, "failed": 0}
+    }
+    task = asyncio.create_task(_process_batch(batch_id))
+    batch_tasks.add(task)
+    task.add_done_callback(batch_tasks.discard)
+    return batches[batch_id]
+
+
+@app.get("/v1/batches/{batch_id}")
+async def retrieve_batch(batch_id: str):
+    return batches[batch_id]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttfb-ms", type=float, default=config["ttfb_ms"], help="median time to first token")
+    parser.add_argument("--ttfb-sigma", type=float, default=config["ttfb_sigma"], help="log-normal sigma of the time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=config["tokens_per_second"])
+    parser.add_argument("--completion-tokens", type=int, default=config["completion_tokens"], help="mean completion length")
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="share of calls answered with a 500")
+    parser.add_argument("--batch-seconds", type=float, default=config["batch_seconds"], help="time until a batch completes")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    config.update(
+        ttfb_ms=args.ttfb_ms, ttfb_sigma=args.ttfb_sigma, tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens, error_rate=args.error_rate, batch_seconds=args.batch_seconds
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
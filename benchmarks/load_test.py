@@ -0,0 +1,260 @@
+"""Offline load test of the study API with a fake OpenAI and an in-memory MongoDB.
+
+Starts benchmarks.fake_openai and the app (benchmarks.serve_app) as local
+subprocesses, then runs scripted participant journeys against the app:
+a Group A, B or C start, --turns Group B continue turns through the
+server-side session, a submit, and finally --downloads CSV exports. It
+reports throughput, p50/p95/p99 latency and the app's peak resident
+memory per endpoint. Nothing leaves 127.0.0.1.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test --participants 60 --concurrency 20 --turns 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+import httpx
+
+THESIS_IDS = (1, 4, 5)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int) -> float:
+    """Resident set size of a process in MB (Linux)"""
+    with open(f"/proc/{pid}/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class Recorder:
+    """Latencies, errors and the app's peak RSS per endpoint"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.peak_rss = defaultdict(float)
+        self.in_flight = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, stream: bool = False, **kwargs):
+        """Send a request, timing the whole body (and the first byte for streams)"""
+        self.in_flight[endpoint] += 1
+        started = time.perf_counter()
+        try:
+            async with client.stream(method, url, **kwargs) as response:
+                body = b""
+                async for chunk in response.aiter_bytes():
+                    if stream and not body:
+                        self.latencies[f"{endpoint} (first byte)"].append(time.perf_counter() - started)
+                    body += chunk
+            self.latencies[endpoint].append(time.perf_counter() - started)
+            if response.status_code >= 400 or b'"role": "error"' in body or b'"role":"error"' in body:
+                self.errors[endpoint] += 1
+            return response, body
+        except httpx.HTTPError:
+            self.errors[endpoint] += 1
+            return None, b""
+        finally:
+            self.in_flight[endpoint] -= 1
+            # Short requests can fall between two sampler ticks
+            self.peak_rss[endpoint] = max(self.peak_rss[endpoint], rss_mb(self.pid))
+
+    async def sample_memory(self, interval: float = 0.05):
+        while True:
+            rss = rss_mb(self.pid)
+            for endpoint, count in list(self.in_flight.items()):
+                if count:
+                    self.peak_rss[endpoint] = max(self.peak_rss[endpoint], rss)
+            self.peak_rss["overall"] = max(self.peak_rss["overall"], rss)
+            await asyncio.sleep(interval)
+
+
+def sse_content(body: bytes) -> str:
+    """Concatenated assistant content of a server-sent event stream"""
+    content = []
+    for line in body.decode("utf-8").splitlines():
+        if line.startswith("data: ") and line != "data: [DONE]":
+            event = json.loads(line[6:])
+            if event.get("role") == "assistant":
+                content.append(event["content"])
+    return "".join(content)
+
+
+async def journey(client: httpx.AsyncClient, recorder: Recorder, i: int, args) -> None:
+    group = "ABC"[i % 3]
+    thesis_id = THESIS_IDS[i % len(THESIS_IDS)]
+    pid = f"bench{i:06d}"
+    position = random.choice((0, 25, 50, 75, 100))
+    statement = random.choice(("", "Keine Meinung.", "Ich finde, das ist eine wichtige Frage für die Zukunft."))
+    start = {"thesis_id": thesis_id, "initial_position": position, "initial_statement": statement,
+             "prolific_pid": pid, "stream": args.stream}
+    chat_started = time.time()
+
+    endpoint = f"POST /study/group-{group.lower()}/start"
+    response, body = await recorder.request(client, endpoint, "POST", f"/study/group-{group.lower()}/start", stream=args.stream, json=start)
+    if response is None or response.status_code != 200:
+        return
+    if args.stream:
+        reply, session_id = sse_content(body), response.headers.get("x-session-id")
+    else:
+        result = json.loads(body)
+        reply, session_id = result.get("content", ""), result.get("session_id")
+    history = [{"role": "user", "content": statement}, {"role": "assistant", "content": reply}]
+
+    if group == "B" and session_id:
+        for turn in range(args.turns):
+            await asyncio.sleep(args.think_time)
+            message = f"Frage {turn + 1}: Welche Belege gibt es dafür?"
+            continue_request = {"thesis_id": thesis_id, "initial_position": position, "initial_statement": statement,
+                                "session_id": session_id, "message": message, "prolific_pid": pid, "stream": args.stream}
+            response, body = await recorder.request(client, "POST /study/group-b/continue", "POST", "/study/group-b/continue",
+                                                    stream=args.stream, json=continue_request)
+            if response is None or response.status_code != 200:
+                break
+            reply = sse_content(body) if args.stream else json.loads(body).get("content", "")
+            history += [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+
+    now_ms = int(time.time() * 1000)
+    submission = {
+        "prolificPid": pid, "group": group, "thesisId": thesis_id, "thesisTitle": f"These {thesis_id}",
+        "thesisText": "Benchmark", "run": 1, "initialPosition": position, "initialInformation": 50,
+        "initialStatement": statement, "chatHistory": history, "finalPosition": random.randint(0, 100),
+        "finalInformation": random.randint(0, 100),
+        "timestamps": {"iframeOpen": int(chat_started * 1000) - 60000, "chatStart": int(chat_started * 1000), "chatEnd": now_ms, "completion": now_ms},
+        "totalTimeSeconds": time.time() - chat_started + 60, "chatTimeSeconds": time.time() - chat_started
+    }
+    await recorder.request(client, "POST /study/submit", "POST", "/study/submit", json=submission)
+
+
+async def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def run(args, app_url: str, app_pid: int) -> tuple:
+    recorder = Recorder(app_pid)
+    sampler = asyncio.create_task(recorder.sample_memory())
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(i):
+        async with semaphore:
+            await journey(client, recorder, i, args)
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=args.timeout) as client:
+        await asyncio.gather(*(limited(i) for i in range(args.participants)))
+        # Let the submission spool flush before exporting
+        await asyncio.sleep(args.settle)
+        for _ in range(args.downloads):
+            await recorder.request(client, "GET /download", "GET", "/download")
+        await recorder.request(client, "GET /stats", "GET", "/stats")
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    return recorder, elapsed
+
+
+def report(recorder: Recorder, elapsed: float, args) -> dict:
+    rows = {}
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        base = endpoint.replace(" (first byte)", "")
+        rows[endpoint] = {
+            "requests": len(latencies),
+            "errors": recorder.errors.get(endpoint, 0),
+            "throughput_rps": len(latencies) / elapsed,
+            "p50_ms": quantile(latencies, 0.5) * 1000,
+            "p95_ms": quantile(latencies, 0.95) * 1000,
+            "p99_ms": quantile(latencies, 0.99) * 1000,
+            "peak_rss_mb": recorder.peak_rss.get(base, 0.0)
+        }
+
+    print(f"{args.participants} participants, concurrency {args.concurrency}, {args.turns} Group B turns, "
+          f"{'streaming' if args.stream else 'non-streaming'}, {elapsed:.1f}s wall time, "
+          f"{args.participants / elapsed:.2f} journeys/s, app peak RSS {recorder.peak_rss['overall']:.1f} MB")
+    print(f"{'endpoint':<44} {'requests':>8} {'errors':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>7}")
+    for endpoint, row in rows.items():
+        print(f"{endpoint:<44} {row['requests']:>8} {row['errors']:>6} {row['throughput_rps']:>7.2f} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['peak_rss_mb']:>7.1f}")
+    return {"elapsed_seconds": elapsed, "peak_rss_mb": recorder.peak_rss["overall"], "endpoints": rows, "arguments": vars(args)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--participants", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=20, help="participants in flight at once")
+    parser.add_argument("--turns", type=int, default=3, help="Group B continue turns per participant")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between Group B turns")
+    parser.add_argument("--downloads", type=int, default=2, help="CSV exports after all journeys")
+    parser.add_argument("--stream", action="store_true", help="use the server-sent event variants")
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds to wait for the submission spool before exporting")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--ttfb-ms", type=float, default=400.0)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--completion-tokens", type=int, default=250)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    openai_port, app_port = free_port(), free_port()
+    spool_dir = tempfile.mkdtemp(prefix="bench-spool-")
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-offline",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "SUBMISSION_SPOOL_DIR": spool_dir,
+        # Journeys send turns back to back, so only the one-request-in-flight rule applies per participant
+        "LLM_RATE_PER_MINUTE": os.environ.get("LLM_RATE_PER_MINUTE", "0"),
+    }
+    fake_openai = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_openai", "--port", str(openai_port),
+        "--ttfb-ms", str(args.ttfb_ms), "--tokens-per-second", str(args.tokens_per_second),
+        "--completion-tokens", str(args.completion_tokens), "--error-rate", str(args.error_rate), "--seed", str(args.seed)
+    ], env=env)
+    app = subprocess.Popen([sys.executable, "-m", "benchmarks.serve_app", "--port", str(app_port)], env=env)
+    app_url = f"http://127.0.0.1:{app_port}"
+    try:
+        asyncio.run(wait_until_ready(f"http://127.0.0.1:{openai_port}/docs", fake_openai))
+        asyncio.run(wait_until_ready(f"{app_url}/metrics", app))
+        recorder, elapsed = asyncio.run(run(args, app_url, app.pid))
+        result = report(recorder, elapsed, args)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(result, f, indent=2)
+    finally:
+        for process in (app, fake_openai):
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
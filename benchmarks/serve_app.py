@@ -0,0 +1,33 @@
+"""Run app.main against the in-memory MongoDB stand-in.
+
+Used by benchmarks.load_test; point OPENAI_BASE_URL at benchmarks.fake_openai.
+
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python -m benchmarks.serve_app --port 8000
+"""
+import argparse
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline")
+# Only needed to construct the real client, which is replaced before use
+os.environ.setdefault("MONGODB_URI", "mongodb://127.0.0.1:27017")
+
+import uvicorn
+from app.database import db_manager
+from benchmarks.fake_mongo import InMemoryMongoClient
+
+db_manager.client = InMemoryMongoClient()
+db_manager.connect()
+
+from app.main import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
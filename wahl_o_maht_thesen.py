@@ -42,4 +42,9 @@ theses = [
 
 def get_thesis_by_id(id):
     """Return the thesis dict with the given id, or None if not found."""
-    return next((thesis for thesis in theses if thesis["id"] == id), None)
\ No newline at end of file
+    # Imported here, the catalog is built from this list. It reflects THESIS_CATALOG_PATH reloads
+    from app.thesis_catalog import thesis_catalog
+    thesis = thesis_catalog.get(id)
+    if thesis is None:
+        return None
+    return {"id": thesis.id, "title": thesis.title, "text": thesis.text}
\ No newline at end of file